@@ -5,7 +5,7 @@ import { useState, useRef } from 'react'
 import { useNavigate } from '@tanstack/react-router'
 import { set } from 'idb-keyval'
 
-const MAX_FILE_SIZE = 6 * 1024 * 1024 // 6MB
+const MAX_FILE_SIZE = 200 * 1024 * 1024 // 200MB, matches MAX_UPLOAD_MB on the backend
 
 export default function StartConversation() {
   // Local upload states
@@ -0,0 +1,10 @@
+"""
+Offline benchmarks for ingestion, search and the HTTP routes.
+
+OpenAI, D1 and R2 are replaced by local stand-ins (see fakes.py) with
+configurable latency, and documents are synthetic PDFs (see synthetic.py),
+so a run costs nothing, needs no network and is repeatable.
+
+Run `python -m backend.benchmarks --help` from the packages directory.
+Results are printed (or written with --output) as JSON for comparing runs.
+"""
@@ -0,0 +1,142 @@
+"""
+Run the offline benchmarks and print the results as JSON.
+
+    python -m backend.benchmarks --suites search --search-sizes 1000 100000
+    python -m backend.benchmarks --output before.json
+
+Everything runs in a temporary working directory against local fakes;
+nothing reaches OpenAI or Cloudflare. Service logs go to stderr so stdout
+is only the JSON report.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+SUITES = ("chunking", "pdf", "search", "documents", "routes")
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m backend.benchmarks", description="Offline benchmarks with local fakes")
+    parser.add_argument("--suites", nargs="+", choices=SUITES, default=list(SUITES))
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    parser.add_argument("--chunk-sizes", type=int, nargs="+", default=[100_000, 1_000_000, 10_000_000], help="Characters")
+    parser.add_argument("--pdf-pages", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--search-sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000, 1_000_000], help="Chunks")
+    parser.add_argument("--search-dim", type=int, default=256, help="10^6 chunks take dim * 4 MB")
+    parser.add_argument("--search-queries", type=int, default=200)
+    parser.add_argument("--document-counts", type=int, nargs="+", default=[100, 1_000, 10_000], help="Documents")
+    parser.add_argument("--document-chunks", type=int, default=50, help="Chunks per document")
+    parser.add_argument("--uploads", type=int, default=8, help="Documents per upload route")
+    parser.add_argument("--upload-pages", type=int, default=50)
+    parser.add_argument("--chats", type=int, default=200, help="Questions per chat route")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--dim", type=int, default=1536, help="Fake embedding dimensions")
+    parser.add_argument("--embedding-latency", type=float, default=0.05, help="Seconds per embeddings request")
+    parser.add_argument("--chat-latency", type=float, default=0.3, help="Seconds to the first answer token")
+    parser.add_argument("--token-latency", type=float, default=0.005, help="Seconds between answer tokens")
+    parser.add_argument("--storage", choices=("d1", "sqlite"), default="d1", help="Fake D1, or the real local SQLite backend")
+    parser.add_argument("--d1-latency", type=float, default=0.02, help="Seconds per D1 query")
+    parser.add_argument("--r2-latency", type=float, default=0.02, help="Seconds per R2 call")
+    return parser.parse_args(argv)
+
+
+def _settings() -> dict:
+    """Tunables that change the numbers, recorded with every report."""
+    from backend import config
+
+    names = [
+        "EMBEDDING_BATCH_SIZE", "EMBEDDING_CONCURRENCY", "ANN_ENABLED", "ANN_MIN_SIZE", "PDF_WORKERS",
+        "PIPELINE_QUEUE_SIZE", "CHUNK_MAX_TOKENS", "CHUNK_OVERLAP_TOKENS", "HYBRID_SEARCH_ENABLED",
+        "LEXICAL_FAST_PATH", "PARTITION_MIN_SIZE", "ANSWER_CACHE_ENABLED", "INGEST_WORKERS", "STORAGE_BACKEND",
+        "EMBEDDING_DIMENSIONS", "VECTOR_QUANTIZATION", "QUANTIZED_RERANK_FACTOR"
+    ]
+    return {name: getattr(config, name) for name in names if hasattr(config, name)}
+
+
+async def run(args: argparse.Namespace, workdir: str) -> dict:
+    from backend.benchmarks import fakes, suites
+    from backend.services.d1 import init_schema, close_client
+    from backend.services.pdf import shutdown_pool
+
+    services = fakes.install(
+        dim=args.dim,
+        embedding_latency=args.embedding_latency,
+        chat_latency=args.chat_latency,
+        token_latency=args.token_latency,
+        d1_latency=args.d1_latency,
+        r2_latency=args.r2_latency
+    )
+    await init_schema()
+    results = {}
+    for suite in args.suites:
+        started = time.perf_counter()
+        print(f"Running {suite} benchmarks...", file=sys.stderr)
+        if suite == "chunking":
+            results[suite] = suites.bench_chunking(args.chunk_sizes)
+        elif suite == "pdf":
+            results[suite] = await asyncio.to_thread(suites.bench_process_pdf, args.pdf_pages, workdir)
+        elif suite == "search":
+            results[suite] = await suites.bench_search(args.search_sizes, args.search_dim, args.search_queries)
+        elif suite == "documents":
+            results[suite] = suites.bench_documents(
+                args.document_counts, args.document_chunks, args.search_dim, args.search_queries
+            )
+        elif suite == "routes":
+            results[suite] = await suites.bench_routes(
+                workdir, args.uploads, args.upload_pages, args.chats, args.concurrency
+            )
+        print(f"{suite} done in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    shutdown_pool()
+    await close_client()
+
+    return {
+        "started_at": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "args": vars(args),
+        "settings": _settings(),
+        "service_calls": {
+            "embedding_requests": services.openai.calls["embeddings"] + services.async_openai.calls["embeddings"],
+            "embedded_inputs": services.openai.calls["embedded_inputs"] + services.async_openai.calls["embedded_inputs"],
+            "chat_completions": services.openai.calls["chat"] + services.async_openai.calls["chat"],
+            "d1_queries": services.d1.queries if services.d1 else None,
+            "r2_calls": services.r2.calls
+        },
+        "results": results
+    }
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    output = os.path.abspath(args.output) if args.output else None
+    with tempfile.TemporaryDirectory(prefix="pdfhelper-bench-") as workdir:
+        # Config is read at import time: keep every file the app writes
+        # inside the scratch directory and never touch a real cache
+        os.environ.setdefault("OPENAI_API_KEY", "offline-benchmark")
+        os.environ["EMBEDDING_CACHE_PATH"] = ""
+        os.environ["LOCAL_STORE_DIR"] = os.path.join(workdir, "local_store")
+        os.environ["JOBS_DIR"] = os.path.join(workdir, "jobs")
+        os.environ["STORAGE_BACKEND"] = args.storage
+        os.environ["SQLITE_PATH"] = os.path.join(workdir, "pdfhelper.sqlite3")
+        os.chdir(workdir)
+        with contextlib.redirect_stdout(sys.stderr):
+            report = asyncio.run(run(args, workdir))
+
+    text = json.dumps(report, indent=2)
+    if output:
+        with open(output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
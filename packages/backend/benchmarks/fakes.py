@@ -0,0 +1,288 @@
+"""
+Local stand-ins for the external services, with configurable latency.
+
+- FakeOpenAI: embeddings and chat completions with the same call shapes
+  as the openai clients (sync and async). Embeddings are deterministic
+  feature-hashed bags of words, so texts sharing words are similar and
+  search results are meaningful.
+- FakeD1: execute_sql against an in-memory SQLite database, returning
+  the D1 HTTP API's response shape.
+- FakeR2: an in-process S3 object store covering the boto3 calls in
+  services/r2.py, multipart uploads included.
+
+install() swaps them into the service modules and returns the fakes.
+With STORAGE_BACKEND=sqlite the real local backend is kept instead of
+FakeD1.
+"""
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from types import SimpleNamespace
+import numpy as np
+
+from backend.data.lexical import TOKEN_PATTERN
+
+
+class FakeEmbedder:
+    """
+    Maps text to a unit vector: the sum of fixed random vectors of its
+    terms (hashed into `buckets` slots).
+    """
+
+    def __init__(self, dim: int = 1536, buckets: int = 8192, seed: int = 0):
+        self.dim = dim
+        rng = np.random.default_rng(seed)
+        self._table = rng.normal(size=(buckets, dim)).astype(np.float32)
+
+    def embed(self, text: str, dimensions: int = None) -> list:
+        slots = [zlib.crc32(term.encode("utf-8")) % self._table.shape[0] for term in TOKEN_PATTERN.findall(text.lower())]
+        if not slots:
+            slots = [0]
+        # Shortened embeddings are truncated and renormalized, like text-embedding-3's
+        vector = self._table[slots, :dimensions].sum(axis=0)
+        vector /= np.linalg.norm(vector) or 1.0
+        return vector.tolist()
+
+
+class _Embeddings:
+    def __init__(self, owner):
+        self._owner = owner
+
+    def create(self, input: list, model: str, dimensions: int = None, **kwargs):
+        return self._owner._embed_response(input, dimensions=dimensions)
+
+
+class _AsyncEmbeddings(_Embeddings):
+    async def create(self, input: list, model: str, dimensions: int = None, **kwargs):
+        await asyncio.sleep(self._owner.embedding_latency)
+        return self._owner._embed_response(input, sleep=False, dimensions=dimensions)
+
+
+class _Completions:
+    def __init__(self, owner):
+        self._owner = owner
+
+    def create(self, model: str, messages: list, stream: bool = False, **kwargs):
+        time.sleep(self._owner.chat_latency)
+        return self._owner._chat_response(messages)
+
+
+class _Stream:
+    """Async iterator of chat completion chunks with a close() method."""
+
+    def __init__(self, owner, tokens: list):
+        self._owner = owner
+        self._tokens = iter(tokens)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        token = next(self._tokens, None)
+        if token is None:
+            raise StopAsyncIteration
+        await asyncio.sleep(self._owner.token_latency)
+        return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=token))])
+
+    async def close(self):
+        self._tokens = iter(())
+
+
+class _AsyncCompletions(_Completions):
+    async def create(self, model: str, messages: list, stream: bool = False, **kwargs):
+        await asyncio.sleep(self._owner.chat_latency)
+        if stream:
+            return _Stream(self._owner, self._owner._answer_tokens(messages))
+        return self._owner._chat_response(messages)
+
+
+class FakeOpenAI:
+    """
+    Stand-in for openai.OpenAI / openai.AsyncOpenAI (`asynchronous=True`).
+
+    Args:
+        embedder: Shared FakeEmbedder
+        embedding_latency: Seconds per embeddings.create request
+        chat_latency: Seconds before the first answer token
+        token_latency: Seconds between streamed answer tokens
+        answer_tokens: Length of every answer
+        asynchronous: Expose coroutine methods like AsyncOpenAI
+    """
+
+    def __init__(
+        self,
+        embedder: FakeEmbedder,
+        embedding_latency: float = 0.0,
+        chat_latency: float = 0.0,
+        token_latency: float = 0.0,
+        answer_tokens: int = 60,
+        asynchronous: bool = False
+    ):
+        self.embedder = embedder
+        self.embedding_latency = embedding_latency
+        self.chat_latency = chat_latency
+        self.token_latency = token_latency
+        self.answer_tokens = answer_tokens
+        self.calls = {"embeddings": 0, "embedded_inputs": 0, "chat": 0}
+        self._lock = threading.Lock()
+        if asynchronous:
+            self.embeddings = _AsyncEmbeddings(self)
+            self.chat = SimpleNamespace(completions=_AsyncCompletions(self))
+        else:
+            self.embeddings = _Embeddings(self)
+            self.chat = SimpleNamespace(completions=_Completions(self))
+
+    def _embed_response(self, inputs: list, sleep: bool = True, dimensions: int = None):
+        if sleep:
+            time.sleep(self.embedding_latency)
+        with self._lock:
+            self.calls["embeddings"] += 1
+            self.calls["embedded_inputs"] += len(inputs)
+        return SimpleNamespace(data=[
+            SimpleNamespace(index=i, embedding=self.embedder.embed(text, dimensions))
+            for i, text in enumerate(inputs)
+        ])
+
+    def _answer_tokens(self, messages: list) -> list:
+        with self._lock:
+            self.calls["chat"] += 1
+        seed = hashlib.sha1(messages[-1]["content"].encode("utf-8")).hexdigest()
+        return [f"{seed[i % len(seed)]}word{i} " for i in range(self.answer_tokens)]
+
+    def _chat_response(self, messages: list):
+        content = "".join(self._answer_tokens(messages))
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+class FakeD1:
+    """
+    SQLite-backed replacement for services.d1.execute_sql.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.queries = 0
+        self._db = sqlite3.connect(":memory:", check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+
+    async def execute_sql(self, sql: str, params: list = None) -> dict:
+        await asyncio.sleep(self.latency)
+        self.queries += 1
+        cursor = self._db.execute(sql, params or [])
+        rows = [dict(row) for row in cursor.fetchall()]
+        self._db.commit()
+        return {"success": True, "result": [{"results": rows, "success": True, "meta": {"changes": cursor.rowcount}}]}
+
+    def close(self):
+        self._db.close()
+
+
+class FakeR2:
+    """
+    In-process S3 object store with the boto3 client methods used by
+    services/r2.py. Every call sleeps `latency` seconds.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.objects = {}
+        self.calls = 0
+        self._uploads = {}
+        self._lock = threading.Lock()
+
+    def _call(self):
+        time.sleep(self.latency)
+        with self._lock:
+            self.calls += 1
+
+    def put_object(self, Bucket: str, Key: str, Body=b"", **kwargs):
+        self._call()
+        self.objects[Key] = Body if isinstance(Body, bytes) else Body.read()
+        return {"ETag": hashlib.md5(self.objects[Key]).hexdigest()}
+
+    def get_object(self, Bucket: str, Key: str, **kwargs):
+        self._call()
+        if Key not in self.objects:
+            raise KeyError(Key)
+        data = self.objects[Key]
+        return {"Body": SimpleNamespace(read=lambda: data), "ContentLength": len(data)}
+
+    def delete_object(self, Bucket: str, Key: str, **kwargs):
+        self._call()
+        self.objects.pop(Key, None)
+        return {}
+
+    def delete_objects(self, Bucket: str, Delete: dict, **kwargs):
+        self._call()
+        deleted = []
+        for item in Delete["Objects"]:
+            self.objects.pop(item["Key"], None)
+            deleted.append({"Key": item["Key"]})
+        return {"Deleted": deleted, "Errors": []}
+
+    def generate_presigned_url(self, operation: str, Params: dict, ExpiresIn: int = 3600):
+        return f"https://r2.invalid/{Params['Key']}?expires={ExpiresIn}"
+
+    def create_multipart_upload(self, Bucket: str, Key: str, **kwargs):
+        self._call()
+        upload_id = str(uuid.uuid4())
+        self._uploads[upload_id] = {}
+        return {"UploadId": upload_id}
+
+    def upload_part(self, Bucket: str, Key: str, UploadId: str, PartNumber: int, Body: bytes, **kwargs):
+        self._call()
+        self._uploads[UploadId][PartNumber] = Body
+        return {"ETag": hashlib.md5(Body).hexdigest()}
+
+    def complete_multipart_upload(self, Bucket: str, Key: str, UploadId: str, MultipartUpload: dict, **kwargs):
+        self._call()
+        parts = self._uploads.pop(UploadId)
+        self.objects[Key] = b"".join(parts[part["PartNumber"]] for part in MultipartUpload["Parts"])
+        return {"Key": Key}
+
+    def abort_multipart_upload(self, Bucket: str, Key: str, UploadId: str, **kwargs):
+        self._call()
+        self._uploads.pop(UploadId, None)
+        return {}
+
+
+def install(
+    dim: int = 1536,
+    embedding_latency: float = 0.0,
+    chat_latency: float = 0.0,
+    token_latency: float = 0.0,
+    d1_latency: float = 0.0,
+    r2_latency: float = 0.0
+) -> SimpleNamespace:
+    """
+    Point the embedding, LLM, D1 and R2 services at local fakes.
+
+    Returns:
+        Namespace with openai, async_openai, d1 and r2 fakes, for reading
+        their call counters; d1 is None when the storage backend is
+        already local (SQLite)
+    """
+    from backend.services import d1, embedding, llm, r2
+
+    embedder = FakeEmbedder(dim)
+    options = {
+        "embedding_latency": embedding_latency,
+        "chat_latency": chat_latency,
+        "token_latency": token_latency
+    }
+    fakes = SimpleNamespace(
+        openai=FakeOpenAI(embedder, **options),
+        async_openai=FakeOpenAI(embedder, asynchronous=True, **options),
+        d1=FakeD1(d1_latency) if d1.backend.name == "d1" else None,
+        r2=FakeR2(r2_latency)
+    )
+    embedding.client = llm.client = fakes.openai
+    embedding.async_client = llm.async_client = fakes.async_openai
+    if fakes.d1 is not None:
+        d1.execute_sql = fakes.d1.execute_sql
+    r2._client = fakes.r2
+    return fakes
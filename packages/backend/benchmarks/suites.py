@@ -0,0 +1,352 @@
+"""
+Benchmark suites. Each returns a JSON-serializable dict; latencies are
+in milliseconds, throughput per second.
+
+Call fakes.install() and create the D1 schema (d1.init_schema) before
+running a suite that reaches a service.
+"""
+import asyncio
+import json
+import os
+import time
+import numpy as np
+
+from backend.benchmarks.synthetic import TextGenerator, write_pdf
+
+
+def latency_summary(samples: list) -> dict:
+    """Percentiles of a list of durations in seconds, in milliseconds."""
+    if not samples:
+        return {"count": 0}
+    ms = np.asarray(samples) * 1000
+    return {
+        "count": len(samples),
+        "mean": float(ms.mean()),
+        "p50": float(np.percentile(ms, 50)),
+        "p95": float(np.percentile(ms, 95)),
+        "p99": float(np.percentile(ms, 99)),
+        "min": float(ms.min()),
+        "max": float(ms.max())
+    }
+
+
+def _timed(func, *args, **kwargs) -> tuple:
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+def bench_chunking(sizes: list, repeat: int = 3) -> list:
+    """
+    chunk_text on a single string and iter_page_chunks on the same text
+    split into ~3 KB pages, best of `repeat` runs per size (characters).
+    """
+    from backend.utils.chunker import chunk_text, iter_page_chunks
+
+    rows = []
+    for size in sizes:
+        text = TextGenerator(seed=size).text(size)
+        pages = [text[i:i + 3000] for i in range(0, len(text), 3000)]
+        chunks, chunk_text_s = min((_timed(chunk_text, text) for _ in range(repeat)), key=lambda r: r[1])
+        page_chunks, page_chunks_s = min(
+            (_timed(lambda: list(iter_page_chunks(pages))) for _ in range(repeat)), key=lambda r: r[1]
+        )
+        rows.append({
+            "chars": len(text),
+            "chunk_text": {"chunks": len(chunks), "seconds": chunk_text_s, "mb_per_s": len(text) / chunk_text_s / 1e6},
+            "iter_page_chunks": {
+                "chunks": len(page_chunks), "seconds": page_chunks_s, "mb_per_s": len(text) / page_chunks_s / 1e6
+            }
+        })
+    return rows
+
+
+def bench_process_pdf(page_counts: list, workdir: str) -> list:
+    """Extract and chunk synthetic PDFs with process_pdf."""
+    from backend.services.pdf import process_pdf
+
+    rows = []
+    for pages in page_counts:
+        pdf = write_pdf(os.path.join(workdir, f"process_{pages}.pdf"), pages, seed=pages)
+        chunks, seconds = _timed(process_pdf, pdf["path"])
+        rows.append({
+            "pages": pages,
+            "bytes": pdf["bytes"],
+            "chunks": len(chunks),
+            "seconds": seconds,
+            "pages_per_s": pages / seconds
+        })
+        os.remove(pdf["path"])
+    return rows
+
+
+def _fill_index(index, size: int, dim: int, documents: int, rng, generator: TextGenerator) -> np.ndarray:
+    """Add `size` clustered random vectors with short texts, in blocks."""
+    centers = rng.normal(size=(max(1, size // 500), dim)).astype(np.float32)
+    block = 20000
+    for start in range(0, size, block):
+        count = min(block, size - start)
+        vectors = centers[rng.integers(0, centers.shape[0], count)] + 0.5 * rng.normal(size=(count, dim)).astype(np.float32)
+        index.add_many(vectors, [
+            {
+                "text": generator.sentence(10),
+                "source": f"doc-{(start + i) % documents}.pdf",
+                "document_id": f"doc-{(start + i) % documents}",
+                "chunk_index": start + i
+            }
+            for i in range(count)
+        ])
+    return centers
+
+
+async def bench_search(sizes: list, dim: int = 256, queries: int = 200, k: int = 3, documents: int = 100) -> list:
+    """
+    search_similar_chunks over indexes of each size: vector only, hybrid
+    (vector + BM25), lexical only, and vector scoped to one document.
+    The chunks go straight into the local-upload index, in memory.
+    """
+    from backend.data.storage import DB_MEMORY
+    from backend.services.search import search_similar_chunks
+
+    index = DB_MEMORY["chunks"]
+    rows = []
+    for size in sizes:
+        rng = np.random.default_rng(size)
+        generator = TextGenerator(seed=size)
+        index.clear()
+        started = time.perf_counter()
+        centers = _fill_index(index, size, dim, documents, rng, generator)
+        index.wait_for_ann()
+        build_s = time.perf_counter() - started
+
+        query_vectors = centers[rng.integers(0, centers.shape[0], queries)] + 0.5 * rng.normal(size=(queries, dim)).astype(np.float32)
+        query_texts = [generator.sentence(8) for _ in range(queries)]
+        modes = {
+            "vector": lambda q, t: search_similar_chunks(q.tolist(), limit=k),
+            "hybrid": lambda q, t: search_similar_chunks(q.tolist(), limit=k, query_text=t),
+            "lexical": lambda q, t: search_similar_chunks(None, limit=k, query_text=t),
+            "vector_scoped": lambda q, t: search_similar_chunks(q.tolist(), limit=k, document_ids=["doc-0"])
+        }
+        row = {"chunks": size, "dim": dim, "documents": documents, "build_seconds": build_s, "index_bytes": index.nbytes}
+        for mode, search in modes.items():
+            await search(query_vectors[0], query_texts[0])
+            samples = []
+            for q, t in zip(query_vectors, query_texts):
+                started = time.perf_counter()
+                await search(q, t)
+                samples.append(time.perf_counter() - started)
+            row[mode] = latency_summary(samples)
+        rows.append(row)
+    index.clear()
+    return rows
+
+
+def bench_documents(
+    document_counts: list,
+    chunks_per_document: int = 50,
+    dim: int = 256,
+    queries: int = 200,
+    k: int = 3
+) -> list:
+    """
+    Search over many small documents: unscoped and scoped to one document,
+    with small documents in one shared index (the default), with an index
+    per document (min_partition_size=1) and as one flat VectorIndex.
+    """
+    from backend.data.index import PartitionedIndex, VectorIndex
+
+    rows = []
+    for documents in document_counts:
+        rng = np.random.default_rng(documents)
+        size = documents * chunks_per_document
+        vectors = rng.normal(size=(size, dim)).astype(np.float32)
+        metadata = [{"document_id": f"doc-{i // chunks_per_document}", "chunk_index": i} for i in range(size)]
+        query_vectors = vectors[rng.integers(0, size, queries)] + 0.5 * rng.normal(size=(queries, dim)).astype(np.float32)
+        layouts = {
+            "shared": PartitionedIndex(),
+            "per_document": PartitionedIndex(min_partition_size=1),
+            "flat": VectorIndex()
+        }
+        row = {"documents": documents, "chunks": size, "dim": dim}
+        for layout, index in layouts.items():
+            _, build_s = _timed(index.add_many, vectors, metadata)
+            index.wait_for_ann()
+            searches = {"unscoped": lambda q: index.search(q, k)}
+            if layout != "flat":
+                searches["scoped"] = lambda q: index.search(q, k, partitions=["doc-0"])
+            result = {"build_seconds": build_s}
+            for mode, search in searches.items():
+                samples = []
+                for q in query_vectors:
+                    started = time.perf_counter()
+                    search(q)
+                    samples.append(time.perf_counter() - started)
+                result[mode] = latency_summary(samples)
+            row[layout] = result
+        rows.append(row)
+    return rows
+
+
+async def _run_concurrently(requests: list, concurrency: int) -> tuple:
+    """
+    Await the request factories with at most `concurrency` in flight.
+
+    Returns:
+        (per-request results, per-request seconds, wall-clock seconds)
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(make_request):
+        async with semaphore:
+            started = time.perf_counter()
+            result = await make_request()
+            return result, time.perf_counter() - started
+
+    started = time.perf_counter()
+    outcomes = await asyncio.gather(*(run(request) for request in requests))
+    wall = time.perf_counter() - started
+    return [o[0] for o in outcomes], [o[1] for o in outcomes], wall
+
+
+async def _stream_first_token(app, path: str, payload: dict):
+    """
+    POST JSON to a server-sent-events route by calling the ASGI app
+    directly (httpx's ASGI transport buffers the whole body) and return
+    the seconds until the first `token` event, or None if none came.
+    """
+    body = json.dumps(payload).encode("utf-8")
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode("utf-8"),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"host", b"bench"), (b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        "client": ("127.0.0.1", 0),
+        "server": ("bench", 80)
+    }
+    requested = False
+    first_token = None
+    started = time.perf_counter()
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        # The client never disconnects
+        await asyncio.Event().wait()
+
+    async def send(message):
+        nonlocal first_token
+        if first_token is None and message["type"] == "http.response.body" and b"event: token" in message.get("body", b""):
+            first_token = time.perf_counter() - started
+
+    await app(scope, receive, send)
+    return first_token
+
+
+async def bench_routes(
+    workdir: str,
+    uploads: int = 8,
+    upload_pages: int = 50,
+    chats: int = 200,
+    concurrency: int = 8
+) -> dict:
+    """
+    Drive the FastAPI app in-process (ASGI transport, app lifespan
+    included): concurrent /upload and /upload/cloud requests of distinct
+    synthetic PDFs, then concurrent /chat and /chat/stream questions.
+    Cloud uploads are timed to the 202 response and to job completion;
+    streamed answers also to their first token.
+    """
+    import httpx
+    from backend.main import app
+
+    generator = TextGenerator(seed=1)
+    pdfs = [
+        write_pdf(os.path.join(workdir, f"upload_{i}.pdf"), upload_pages, seed=1000 + i)
+        for i in range(2 * uploads)
+    ]
+    results = {"uploads": uploads, "upload_pages": upload_pages, "chats": chats, "concurrency": concurrency}
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            def upload(path: str, route: str):
+                async def request():
+                    with open(path, "rb") as f:
+                        response = await client.post(
+                            f"/api/v1/{route}", files={"file": (os.path.basename(path), f, "application/pdf")}
+                        )
+                    response.raise_for_status()
+                    return response.json()
+                return request
+
+            local, samples, wall = await _run_concurrently(
+                [upload(pdf["path"], "upload") for pdf in pdfs[:uploads]], concurrency
+            )
+            chunks = sum(r["chunks_processed"] for r in local)
+            results["upload"] = {
+                "latency_ms": latency_summary(samples),
+                "wall_seconds": wall,
+                "chunks": chunks,
+                "pages_per_s": uploads * upload_pages / wall,
+                "chunks_per_s": chunks / wall
+            }
+
+            started = time.perf_counter()
+            accepted, samples, wall = await _run_concurrently(
+                [upload(pdf["path"], "upload/cloud") for pdf in pdfs[uploads:]], concurrency
+            )
+            pending = {r["job_id"] for r in accepted}
+            while pending:
+                await asyncio.sleep(0.05)
+                for job_id in list(pending):
+                    job = (await client.get(f"/api/v1/jobs/{job_id}")).json()
+                    if job["stage"] in ("completed", "failed"):
+                        pending.discard(job_id)
+            completed = time.perf_counter() - started
+            results["upload_cloud"] = {
+                "accepted_latency_ms": latency_summary(samples),
+                "accepted_wall_seconds": wall,
+                "completed_wall_seconds": completed,
+                "pages_per_s": uploads * upload_pages / completed
+            }
+
+            def chat(question: str):
+                async def request():
+                    response = await client.post("/api/v1/chat", json={"question": question})
+                    response.raise_for_status()
+                    return response.json().get("cached", False)
+                return request
+
+            questions = [generator.sentence(10) for _ in range(chats)]
+            cached, samples, wall = await _run_concurrently([chat(q) for q in questions], concurrency)
+            results["chat"] = {
+                "latency_ms": latency_summary(samples),
+                "wall_seconds": wall,
+                "requests_per_s": chats / wall,
+                "cached": sum(1 for c in cached if c)
+            }
+
+        questions = [generator.sentence(10) for _ in range(chats)]
+        first_tokens, samples, wall = await _run_concurrently(
+            [lambda q=q: _stream_first_token(app, "/api/v1/chat/stream", {"question": q}) for q in questions],
+            concurrency
+        )
+        results["chat_stream"] = {
+            "latency_ms": latency_summary(samples),
+            "first_token_ms": latency_summary([t for t in first_tokens if t is not None]),
+            "wall_seconds": wall,
+            "requests_per_s": chats / wall
+        }
+
+    for pdf in pdfs:
+        if os.path.exists(pdf["path"]):
+            os.remove(pdf["path"])
+    return results
@@ -0,0 +1,131 @@
+"""
+Deterministic synthetic documents: prose-like text made of pseudo-words,
+sprinkled with identifiers (part numbers, error codes), and minimal PDFs
+that PyPDF2 reads like real ones.
+"""
+import numpy as np
+
+_SYLLABLES = [
+    "ka", "lo", "mi", "ne", "ru", "ta", "vo", "sen", "dar", "pel", "qua", "tor",
+    "ex", "in", "al", "or", "um", "is", "ber", "con", "gra", "ph", "st", "ion"
+]
+_FILLER = ["the", "of", "and", "to", "in", "is", "for", "with", "on", "as", "by", "that"]
+
+
+def vocabulary(size: int = 2000, seed: int = 0) -> list:
+    """Distinct pseudo-words of two to four syllables."""
+    rng = np.random.default_rng(seed)
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(_SYLLABLES, size=rng.integers(2, 5))))
+    return sorted(words)
+
+
+class TextGenerator:
+    """
+    Sentences drawn from a Zipf-distributed vocabulary, so term
+    frequencies look like natural text to BM25 and the chunker.
+    """
+
+    def __init__(self, seed: int = 0, vocabulary_size: int = 2000, identifier_rate: float = 0.01):
+        self.rng = np.random.default_rng(seed)
+        # One vocabulary for every seed, so questions share words with documents
+        self.words = vocabulary(vocabulary_size)
+        weights = np.cumsum(1.0 / np.arange(1, len(self.words) + 1))
+        self._cumulative = weights / weights[-1]
+        self.identifier_rate = identifier_rate
+
+    def identifier(self) -> str:
+        prefix = "".join(chr(c) for c in self.rng.integers(65, 91, size=2))
+        return f"{prefix}-{self.rng.integers(100, 10000)}"
+
+    def sentence(self, words: int = 14) -> str:
+        picks = np.searchsorted(self._cumulative, self.rng.random(words))
+        extras = self.rng.random(words)
+        tokens = []
+        for pick, extra in zip(picks, extras):
+            if extra < self.identifier_rate:
+                tokens.append(self.identifier())
+            elif extra < 0.3:
+                tokens.append(_FILLER[pick % len(_FILLER)])
+            tokens.append(self.words[pick])
+        return " ".join(tokens).capitalize() + "."
+
+    def paragraph(self, sentences: int = 5) -> str:
+        return " ".join(self.sentence(int(self.rng.integers(8, 20))) for _ in range(sentences))
+
+    def text(self, chars: int) -> str:
+        """At least `chars` characters of paragraphs."""
+        parts = []
+        size = 0
+        while size < chars:
+            parts.append(self.paragraph())
+            size += len(parts[-1]) + 2
+        return "\n\n".join(parts)
+
+    def page_lines(self, lines: int = 40, width: int = 90) -> list:
+        """One page of text wrapped to `width` characters."""
+        words = self.text(lines * width).split()
+        out, line = [], ""
+        for word in words:
+            if line and len(line) + 1 + len(word) > width:
+                out.append(line)
+                if len(out) == lines:
+                    break
+                line = word
+            else:
+                line = f"{line} {word}" if line else word
+        return out
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path: str, pages: int, seed: int = 0, lines_per_page: int = 40) -> dict:
+    """
+    Write a text PDF with the given number of pages, one object at a time
+    so large documents don't build up in memory.
+
+    Returns:
+        dict with path, pages, bytes and chars (text characters written)
+    """
+    generator = TextGenerator(seed)
+    offsets = []
+    chars = 0
+    # Objects: 1 catalog, 2 page tree, 3 font, then a (page, content) pair per page
+    page_ids = [4 + 2 * i for i in range(pages)]
+
+    with open(path, "wb") as f:
+        def write_object(number: int, body: bytes):
+            offsets.append((number, f.tell()))
+            f.write(f"{number} 0 obj\n".encode() + body + b"\nendobj\n")
+
+        f.write(b"%PDF-1.4\n")
+        write_object(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+        write_object(2, f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>".encode())
+        write_object(3, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+        for page_id in page_ids:
+            lines = generator.page_lines(lines_per_page)
+            chars += sum(len(line) for line in lines)
+            ops = ["BT", "/F1 9 Tf", "11 TL", "40 800 Td"]
+            ops.extend(f"({_escape(line)}) Tj T*" for line in lines)
+            ops.append("ET")
+            stream = "\n".join(ops).encode("latin-1")
+            write_object(page_id, (
+                f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+                f"/Resources << /Font << /F1 3 0 R >> >> /Contents {page_id + 1} 0 R >>"
+            ).encode())
+            write_object(page_id + 1, f"<< /Length {len(stream)} >>\nstream\n".encode() + stream + b"\nendstream")
+
+        xref_at = f.tell()
+        count = len(offsets) + 1
+        f.write(f"xref\n0 {count}\n0000000000 65535 f \n".encode())
+        for _, offset in sorted(offsets):
+            f.write(f"{offset:010d} 00000 n \n".encode())
+        f.write(f"trailer\n<< /Size {count} /Root 1 0 R >>\nstartxref\n{xref_at}\n%%EOF\n".encode())
+        size = f.tell()
+
+    return {"path": path, "pages": pages, "bytes": size, "chars": chars}
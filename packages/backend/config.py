@@ -16,4 +16,118 @@ R2_BUCKET_NAME = os.getenv("R2_BUCKET_NAME", "pdf-helper")
 R2_PUBLIC_URL = os.getenv("R2_PUBLIC_URL")  # Optional: Custom domain or public bucket URL
 
 CF_API_TOKEN = os.getenv("CF_API_TOKEN")
-D1_DATABASE_ID = os.getenv("D1_DATABASE_ID")
\ No newline at end of file
+D1_DATABASE_ID = os.getenv("D1_DATABASE_ID")
+
+# Where document and chunk rows live: "d1" (Cloudflare D1 over HTTPS) or
+# "sqlite" (a local file at SQLITE_PATH, same schema, for single-node
+# deployments and development)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "d1").lower()
+SQLITE_PATH = os.getenv("SQLITE_PATH", "data/pdfhelper.sqlite3")
+
+# Embedding batching: inputs per embeddings.create request and how many
+# requests run at once during uploads.
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "256"))
+EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", "4"))
+
+# Embedding cache: in-process LRU size and on-disk SQLite tier.
+# Set EMBEDDING_CACHE_PATH to an empty string to keep only the memory tier.
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "data/embedding_cache.sqlite3")
+EMBEDDING_CACHE_MEMORY_ITEMS = int(os.getenv("EMBEDDING_CACHE_MEMORY_ITEMS", "10000"))
+EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+# Embedding size requested from text-embedding-3 models (0 keeps the
+# model's full 1536). Fewer dimensions shrink storage and search cost;
+# documents embedded at another size must be re-ingested after a change.
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", "0"))
+
+# Stored embedding encoding in D1: "f32" (float32) or "f16" (float16)
+EMBEDDING_STORAGE_FORMAT = os.getenv("EMBEDDING_STORAGE_FORMAT", "f32")
+
+# Local replica of D1 chunks: seconds between incremental syncs, and
+# between reconciles that drop deleted documents.
+REPLICA_SYNC_INTERVAL = float(os.getenv("REPLICA_SYNC_INTERVAL", "2"))
+REPLICA_RECONCILE_INTERVAL = float(os.getenv("REPLICA_RECONCILE_INTERVAL", "60"))
+
+# Approximate nearest-neighbor search (IVF). nlist=0 picks ~4*sqrt(n)
+# lists; nprobe trades latency for recall. Below ANN_MIN_SIZE chunks the
+# search stays exact.
+ANN_ENABLED = os.getenv("ANN_ENABLED", "false").lower() == "true"
+ANN_NLIST = int(os.getenv("ANN_NLIST", "0"))
+ANN_NPROBE = int(os.getenv("ANN_NPROBE", "8"))
+ANN_MIN_SIZE = int(os.getenv("ANN_MIN_SIZE", "20000"))
+
+# Documents with fewer chunks than this share one in-memory index (one
+# matrix scan and one ANN engine for all of them); larger ones get an
+# index of their own
+PARTITION_MIN_SIZE = int(os.getenv("PARTITION_MIN_SIZE", "5000"))
+
+# In-memory vector representation: "float32", or "int8" (one scale per
+# vector, 4x smaller to scan). With int8 the best QUANTIZED_RERANK_FACTOR * k
+# candidates are re-scored in float32, which keeps a float32 copy (on disk
+# for local uploads); 0 skips the re-rank and keeps only the int8 rows.
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "float32").lower()
+QUANTIZED_RERANK_FACTOR = int(os.getenv("QUANTIZED_RERANK_FACTOR", "4"))
+
+# Threads available to blocking R2 (boto3) calls made from async routes
+R2_MAX_WORKERS = int(os.getenv("R2_MAX_WORKERS", "8"))
+# HTTP connections kept by the shared boto3 client; at least R2_MAX_WORKERS
+# so pool threads never wait on each other for a connection
+R2_MAX_POOL_CONNECTIONS = int(os.getenv("R2_MAX_POOL_CONNECTIONS", "32"))
+
+# Uploads: size limit, and the part size / parts in flight for multipart
+# uploads to R2 (R2 needs equal-size parts of at least 5MB)
+MAX_UPLOAD_MB = int(os.getenv("MAX_UPLOAD_MB", "200"))
+R2_PART_SIZE = int(os.getenv("R2_PART_SIZE_MB", "8")) * 1024 * 1024
+R2_UPLOAD_CONCURRENCY = int(os.getenv("R2_UPLOAD_CONCURRENCY", "4"))
+
+# Background ingestion: concurrent jobs, where job checkpoints live and
+# how long finished (completed or failed) jobs are kept for polling
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+JOBS_DIR = os.getenv("JOBS_DIR", "data/jobs")
+JOB_RETENTION_HOURS = float(os.getenv("JOB_RETENTION_HOURS", "168"))
+
+# PDF text extraction: worker processes (1 = in-process) and the
+# per-page time limit in seconds inside the pool
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(min(os.cpu_count() or 1, 8))))
+PDF_PAGE_TIMEOUT = float(os.getenv("PDF_PAGE_TIMEOUT", "30"))
+
+# Chunks buffered between PDF extraction and embedding in the streaming
+# ingestion pipeline; extraction pauses when the buffer is full
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "512"))
+
+# Chunk size budget for ingestion, in (estimated) tokens, and roughly how
+# much text neighbouring chunks share
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "300"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "40"))
+
+# Semantic answer cache: questions whose embeddings are at least this
+# similar, asked over the same documents, get the stored answer
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+ANSWER_CACHE_MAX_ITEMS = int(os.getenv("ANSWER_CACHE_MAX_ITEMS", "2000"))
+
+# Hybrid retrieval: BM25 over chunk text fused with vector search by
+# reciprocal rank fusion, and a lexical-only path for identifier queries
+# (part numbers, error codes) that skips the embedding call
+HYBRID_SEARCH_ENABLED = os.getenv("HYBRID_SEARCH_ENABLED", "true").lower() == "true"
+LEXICAL_FAST_PATH = os.getenv("LEXICAL_FAST_PATH", "true").lower() == "true"
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+# Context sent with each question: chunks retrieved, the token budget
+# their merged passages are packed into, and the MMR trade-off between
+# relevance (1.0) and diversity (0.0) when ordering them
+CONTEXT_CANDIDATES = int(os.getenv("CONTEXT_CANDIDATES", "8"))
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "1500"))
+CONTEXT_MMR_LAMBDA = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7"))
+
+# Persistent store for chunks of local uploads (memory-mapped vector files),
+# and how often a worker checks it for writes made by other workers.
+LOCAL_STORE_DIR = os.getenv("LOCAL_STORE_DIR", "data/local_store")
+LOCAL_STORE_REFRESH_INTERVAL = float(os.getenv("LOCAL_STORE_REFRESH_INTERVAL", "2"))
+
+# Logging level of the app, and per-request trace spans (JSON lines with
+# stage timings) written to TRACE_LOG_PATH, or stderr if it is empty
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+TRACE_LOG_ENABLED = os.getenv("TRACE_LOG_ENABLED", "false").lower() == "true"
+TRACE_LOG_PATH = os.getenv("TRACE_LOG_PATH", "")
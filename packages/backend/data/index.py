@@ -0,0 +1,912 @@
+"""
+In-memory vector index.
+Keeps embeddings in one contiguous float32 (or int8) matrix with a
+parallel metadata list, so a query is a single matrix-vector product.
+"""
+import json
+import logging
+import os
+import threading
+from typing import Optional
+import numpy as np
+from backend.config import (
+    ANN_ENABLED, ANN_NLIST, ANN_NPROBE, ANN_MIN_SIZE, HYBRID_SEARCH_ENABLED,
+    VECTOR_QUANTIZATION, QUANTIZED_RERANK_FACTOR, PARTITION_MIN_SIZE
+)
+from backend.data.ivf import IVFIndex
+from backend.data.quantize import quantize_int8, dequantize_int8, int8_scores
+from backend.data.lexical import BM25Index
+from backend.utils.rwlock import RWLock
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CAPACITY = 1024
+
+
+def normalize(vector) -> np.ndarray:
+    """
+    Return a float32 unit-length copy of the vector.
+    Zero vectors are returned unchanged so they score 0 against everything.
+    """
+    v = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(v)
+    if norm > 0:
+        v = v / norm
+    return v
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Return the indices of the k highest scores, best first.
+    Uses argpartition so only the k winners get sorted.
+    """
+    n = scores.shape[0]
+    if k <= 0 or n == 0:
+        return np.empty(0, dtype=np.int64)
+    if k < n:
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(n)
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+class VectorIndex:
+    """
+    Cosine similarity index.
+
+    Rows are L2-normalized on insert, so the dot product with a normalized
+    query is the cosine similarity. The matrix grows by doubling, which keeps
+    `add` amortized O(1).
+
+    With quantization="int8" rows are also kept as int8 codes with a
+    per-row scale (see data/quantize.py) and scanned in that form. The top
+    rerank * k candidates are then re-scored against the float32 rows;
+    with rerank=0 no float32 rows are kept at all.
+
+    An optional ANN engine (see data/ivf.py) is kept in step with every
+    change and takes over search once the index is large enough. Training
+    (k-means) runs on a background thread; until the new engine is swapped
+    in, searches use the previous one, or scan exactly if there is none.
+
+    A labeled index also stores an integer label per row (PartitionedIndex
+    labels rows by document), and search, removal and relabeling can be
+    restricted to some labels. Row ids per label are kept alongside, so a
+    search restricted to a few labels only scores their rows.
+
+    Changes hold the write side of `lock` and searches the read side, so
+    a search on a worker thread never sees a half-applied change.
+    """
+
+    def __init__(
+        self,
+        dim: Optional[int] = None,
+        capacity: int = DEFAULT_CAPACITY,
+        ann=None,
+        quantization: Optional[str] = None,
+        rerank: int = 0,
+        labeled: bool = False
+    ):
+        self.dim = dim
+        self.ann = ann
+        self.quantized = quantization == "int8"
+        self.rerank = rerank if self.quantized else 0
+        self.labeled = labeled
+        self._capacity = capacity
+        self._size = 0
+        self._vectors = None
+        self._codes = None
+        self._scales = None
+        self._labels = None
+        # label -> list of row id arrays, in the order they were added
+        self._label_rows = {}
+        self._meta = []
+        self.lock = RWLock()
+        # Background ANN training run, and a counter bumped whenever row ids
+        # move, so a run over rows that have since moved is thrown away
+        self._training: Optional[threading.Thread] = None
+        self._epoch = 0
+        if dim is not None:
+            self._allocate(capacity)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __iter__(self):
+        """
+        Yield chunks as dicts with their stored vector, for callers that
+        still expect the old list-of-dicts layout.
+        """
+        for i in range(self._size):
+            yield {**self._meta[i], "vector": self._rows(i, i + 1)[0]}
+
+    @property
+    def keeps_float(self) -> bool:
+        """Whether float32 rows are stored (always, unless int8 without re-rank)."""
+        return not self.quantized or self.rerank > 0
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """
+        Populated rows of the matrix: a view of the float32 rows, or
+        rows rebuilt from the int8 codes when only those are kept.
+        """
+        if self.dim is None or self._size == 0:
+            return np.empty((0, self.dim or 0), dtype=np.float32)
+        return self._rows(0, self._size)
+
+    @property
+    def metadata(self) -> list:
+        return self._meta
+
+    def _rows(self, start: int, end: int) -> np.ndarray:
+        if self.keeps_float:
+            return self._vectors[start:end]
+        return dequantize_int8(self._codes[start:end], self._scales[start:end])
+
+    def take(self, rows: np.ndarray) -> np.ndarray:
+        """Unit-length float32 vectors of the given row ids."""
+        if self.keeps_float:
+            return self._vectors[rows]
+        return dequantize_int8(self._codes[rows], self._scales[rows])
+
+    def _arrays(self) -> tuple:
+        return (self._vectors, self._codes, self._scales, self._labels)
+
+    def _allocate(self, capacity: int):
+        if self.keeps_float:
+            self._vectors = np.empty((capacity, self.dim), dtype=np.float32)
+        if self.quantized:
+            self._codes = np.empty((capacity, self.dim), dtype=np.int8)
+            self._scales = np.empty(capacity, dtype=np.float32)
+        if self.labeled:
+            self._labels = np.empty(capacity, dtype=np.int32)
+
+    def _grow(self, needed: int):
+        capacity = max(self._capacity, 1)
+        while capacity < needed:
+            capacity *= 2
+        old = self._arrays()
+        self._allocate(capacity)
+        for grown, previous in zip(self._arrays(), old):
+            if grown is not None:
+                grown[:self._size] = previous[:self._size]
+        self._capacity = capacity
+
+    def _store(self, start: int, block: np.ndarray):
+        """Write unit-length rows at [start, start + len(block))."""
+        end = start + block.shape[0]
+        if self.keeps_float:
+            self._vectors[start:end] = block
+        if self.quantized:
+            self._store_codes(start, block)
+
+    def _store_codes(self, start: int, block: np.ndarray):
+        end = start + block.shape[0]
+        self._codes[start:end], self._scales[start:end] = quantize_int8(block)
+
+    def _store_label(self, start: int, end: int, label: int):
+        if self.labeled:
+            self._labels[start:end] = label
+            self._label_rows.setdefault(label, []).append(np.arange(start, end))
+
+    def add(self, vector, metadata: dict, label: int = 0) -> int:
+        """
+        Append one vector and its metadata, under `label` if the index
+        is labeled.
+
+        Returns:
+            Row id of the new entry
+        """
+        v = np.asarray(vector, dtype=np.float32).ravel()
+        with self.lock.write():
+            if self.dim is None:
+                self.dim = v.shape[0]
+                self._allocate(self._capacity)
+            if v.shape[0] != self.dim:
+                raise ValueError(f"Expected a {self.dim}-dim vector, got {v.shape[0]}")
+            if self._size >= self._capacity:
+                self._grow(self._size + 1)
+
+            row = self._size
+            self._store(row, normalize(v)[None, :])
+            self._store_label(row, row + 1, label)
+            self._meta.append(metadata)
+            self._size += 1
+            self._update_ann(row)
+            return row
+
+    def add_many(self, vectors, metadata: list, label: int = 0) -> None:
+        """
+        Append a block of vectors with one copy into the matrix, all under
+        `label` if the index is labeled.
+        """
+        block = np.asarray(vectors, dtype=np.float32)
+        if block.ndim != 2 or block.shape[0] == 0:
+            return
+        if len(metadata) != block.shape[0]:
+            raise ValueError("vectors and metadata must have the same length")
+        norms = np.linalg.norm(block, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        block = block / norms
+
+        with self.lock.write():
+            if self.dim is None:
+                self.dim = block.shape[1]
+                self._allocate(self._capacity)
+            if block.shape[1] != self.dim:
+                raise ValueError(f"Expected {self.dim}-dim vectors, got {block.shape[1]}")
+
+            end = self._size + block.shape[0]
+            if end > self._capacity:
+                self._grow(end)
+
+            start = self._size
+            self._store(start, block)
+            self._store_label(start, end, label)
+            self._meta.extend(metadata)
+            self._size = end
+            self._update_ann(start)
+
+    def _update_ann(self, start: int):
+        """
+        Assign rows [start, size) in the ANN engine, and start training a
+        new engine in the background if one is due. Call with the write
+        lock held.
+        """
+        if self.ann is None:
+            return
+        self.ann.on_add(self._rows(start, self._size))
+        if self._training is None and self.ann.needs_training(self._size):
+            self._start_training()
+
+    def _start_training(self):
+        engine = IVFIndex(
+            nlist=self.ann.nlist, nprobe=self.ann.nprobe, min_size=self.ann.min_size, train_sample=self.ann.train_sample
+        )
+        size = self._size
+        # Rows past `size` may be written meanwhile and growth copies into
+        # new arrays, so these views stay valid; compaction bumps _epoch
+        if self.keeps_float:
+            rows = (self._vectors[:size],)
+        else:
+            rows = (self._codes[:size], self._scales[:size])
+        self._training = threading.Thread(
+            target=self._train, args=(engine, rows, size, self._epoch), name="ann-training", daemon=True
+        )
+        self._training.start()
+
+    def _train(self, engine: IVFIndex, rows: tuple, size: int, epoch: int):
+        """Train `engine` on the first `size` rows, then swap it in."""
+        try:
+            engine.train(rows[0] if len(rows) == 1 else dequantize_int8(*rows))
+        except Exception:
+            logger.exception("ANN training failed")
+            with self.lock.write():
+                self._training = None
+            return
+        with self.lock.write():
+            self._training = None
+            if epoch == self._epoch:
+                engine.on_add(self._rows(size, self._size))
+                self.ann = engine
+            # Rows were removed meanwhile, so the run's assignments were
+            # stale, or the index outgrew the new engine while it trained
+            if self.ann is not None and self.ann.needs_training(self._size):
+                self._start_training()
+
+    def wait_for_ann(self):
+        """Block until no background ANN training is running."""
+        while True:
+            thread = self._training
+            if thread is None:
+                return
+            thread.join()
+
+    def remove_where(self, field: str, value) -> int:
+        """
+        Drop every entry whose metadata[field] equals value, compacting
+        the matrix in place.
+
+        Returns:
+            Number of entries removed
+        """
+        return self.remove_if(lambda meta: meta.get(field) == value)
+
+    def remove_if(self, predicate, labels: Optional[list] = None) -> int:
+        """
+        Drop every entry whose metadata matches the predicate, only
+        looking at rows under `labels` when given.
+
+        Returns:
+            Number of entries removed
+        """
+        with self.lock.write():
+            if labels is None:
+                keep = np.fromiter(
+                    (not predicate(meta) for meta in self._meta),
+                    dtype=bool,
+                    count=self._size
+                )
+            else:
+                keep = np.ones(self._size, dtype=bool)
+                rows = self.label_rows(labels)
+                keep[rows] = [not predicate(self._meta[row]) for row in rows.tolist()]
+            return self._compact(keep)
+
+    def remove_labels(self, labels: list) -> int:
+        """
+        Drop every entry under the given labels.
+
+        Returns:
+            Number of entries removed
+        """
+        with self.lock.write():
+            keep = np.ones(self._size, dtype=bool)
+            keep[self.label_rows(labels)] = False
+            return self._compact(keep)
+
+    def _compact(self, keep: np.ndarray) -> int:
+        """Move the rows flagged in `keep` to the front, dropping the rest."""
+        removed = self._size - int(keep.sum())
+        if removed:
+            remaining = self._size - removed
+            for array in self._arrays():
+                if array is not None:
+                    array[:remaining] = array[:self._size][keep]
+            self._meta = [meta for meta, kept in zip(self._meta, keep) if kept]
+            self._size = remaining
+            self._epoch += 1
+            if self.labeled:
+                self._index_labels()
+            if self.ann is not None:
+                self.ann.on_remove(keep)
+        return removed
+
+    def _index_labels(self):
+        """Rebuild the row ids per label from the label column."""
+        labels = self._labels[:self._size]
+        order = np.argsort(labels, kind="stable")
+        codes, starts = np.unique(labels[order], return_index=True)
+        self._label_rows = {
+            int(code): [rows] for code, rows in zip(codes.tolist(), np.split(order, starts[1:]))
+        }
+
+    def label_rows(self, labels: list) -> np.ndarray:
+        """Ascending row ids of the entries under the given labels."""
+        parts = [part for label in labels for part in self._label_rows.get(label, ())]
+        if not parts:
+            return np.empty(0, dtype=np.int64)
+        rows = np.concatenate(parts)
+        return np.sort(rows) if len(parts) > 1 else rows
+
+    def relabel(self, old: int, new: int):
+        """Move the entries under label `old` to label `new`."""
+        with self.lock.write():
+            parts = self._label_rows.pop(old, [])
+            if parts:
+                self._labels[np.concatenate(parts)] = new
+                self._label_rows.setdefault(new, []).extend(parts)
+
+    def clear(self):
+        with self.lock.write():
+            self._size = 0
+            self._meta = []
+            self._label_rows = {}
+            self._epoch += 1
+            if self.ann is not None:
+                self.ann.reset()
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Bytes held in memory by the populated rows. Float32 rows mapped
+        from disk (see from_matrix) are not counted.
+        """
+        dim = self.dim or 0
+        per_row = 0
+        if self.keeps_float and not isinstance(self._vectors, np.memmap):
+            per_row += dim * 4
+        if self.quantized:
+            per_row += dim + 4
+        if self.labeled:
+            per_row += 8
+        return self._size * per_row
+
+    def _scores(self, query: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Scores of all rows, or of the given row ids, against the query."""
+        if self.quantized:
+            if rows is None:
+                return int8_scores(self._codes[:self._size], self._scales[:self._size], query)
+            return int8_scores(self._codes[rows], self._scales[rows], query)
+        if rows is None:
+            return self.vectors @ query
+        return self._vectors[rows] @ query
+
+    def search(
+        self,
+        query_vector,
+        k: int = 3,
+        nprobe: Optional[int] = None,
+        exact: bool = False,
+        with_vectors: bool = False,
+        labels: Optional[list] = None
+    ) -> list:
+        """
+        Find the k entries most similar to the query, among the entries
+        under `labels` when given. Uses the ANN engine when one is trained,
+        unless exact is set or the search is restricted to labels.
+
+        Returns:
+            List of (score, metadata) tuples, best first; with_vectors
+            adds each entry's unit-length float32 vector as a third item
+        """
+        with self.lock.read():
+            return self._search(normalize(query_vector), k, nprobe, exact, with_vectors, labels)
+
+    def _search(
+        self,
+        query: np.ndarray,
+        k: int,
+        nprobe: Optional[int],
+        exact: bool,
+        with_vectors: bool,
+        labels: Optional[list]
+    ) -> list:
+        if self._size == 0:
+            return []
+        if query.shape[0] != self.dim:
+            raise ValueError(f"Expected a {self.dim}-dim query, got {query.shape[0]}")
+
+        if labels is not None:
+            rows = self.label_rows(labels)
+            if rows.shape[0] == 0:
+                return []
+            scores = self._scores(query, rows)
+        elif not exact and self.ann is not None and self.ann.trained and self._size >= self.ann.min_size:
+            # Candidates come in cluster order, so score them by row id even
+            # when every row is probed
+            rows = self.ann.candidates(query, nprobe)
+            scores = self._scores(query, rows)
+        else:
+            rows = np.arange(self._size)
+            scores = self._scores(query)
+
+        if self.rerank:
+            # Re-score the int8 shortlist with the float32 rows
+            shortlist = rows[top_k(scores, k * self.rerank)]
+            scores = self._vectors[shortlist] @ query
+            rows = shortlist
+        best = top_k(scores, k)
+        if with_vectors:
+            return [(float(scores[i]), self._meta[rows[i]], self._rows(rows[i], rows[i] + 1)[0].copy()) for i in best]
+        return [(float(scores[i]), self._meta[rows[i]]) for i in best]
+
+    def save(self, directory: str):
+        """
+        Persist vectors, metadata and the ANN engine to a directory.
+        """
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, "vectors.npy"), self.vectors)
+        with open(os.path.join(directory, "metadata.json"), "w") as f:
+            json.dump(self._meta, f)
+        if self.ann is not None:
+            self.ann.save(os.path.join(directory, "ann.npz"))
+
+    @classmethod
+    def load(cls, directory: str, **options) -> "VectorIndex":
+        """
+        Reload an index written by save(), including a trained ANN engine.
+        `options` are as for the constructor and default to index_options(),
+        so a reloaded index uses the configured quantization.
+        """
+        vectors = np.load(os.path.join(directory, "vectors.npy"))
+        with open(os.path.join(directory, "metadata.json")) as f:
+            metadata = json.load(f)
+        options = options or index_options()
+        index = cls(dim=vectors.shape[1] if vectors.ndim == 2 else None, capacity=max(len(metadata), 1), **options)
+        if metadata:
+            index._store(0, vectors)
+            index._meta = metadata
+            index._size = len(metadata)
+        ann_path = os.path.join(directory, "ann.npz")
+        if os.path.exists(ann_path):
+            index.ann = IVFIndex.load(ann_path)
+        return index
+
+    @classmethod
+    def from_matrix(
+        cls,
+        vectors: np.ndarray,
+        metadata: list,
+        ann=None,
+        **options
+    ) -> "VectorIndex":
+        """
+        Wrap an existing matrix of unit-length rows without copying it,
+        e.g. a copy-on-write memory map. Appending later moves the rows
+        into memory; extend_mapped() takes a longer map instead.
+
+        With int8 quantization (`options` as for the constructor) codes
+        are computed from the matrix.
+        """
+        index = cls(ann=ann, **options)
+        index.dim = vectors.shape[1]
+        index._capacity = vectors.shape[0]
+        index._size = vectors.shape[0]
+        index._meta = metadata
+        if index.keeps_float:
+            index._vectors = vectors
+        if index.quantized:
+            index._codes = np.empty(vectors.shape, dtype=np.int8)
+            index._scales = np.empty(vectors.shape[0], dtype=np.float32)
+            # Quantize in blocks so a large map is never copied whole
+            for block_start in range(0, vectors.shape[0], 65536):
+                block = np.asarray(vectors[block_start:block_start + 65536], dtype=np.float32)
+                index._store_codes(block_start, block)
+        if vectors.shape[0]:
+            with index.lock.write():
+                index._update_ann(0)
+        return index
+
+    def extend_mapped(self, vectors: np.ndarray, metadata: list):
+        """
+        Switch a from_matrix() index to a longer matrix whose leading rows
+        are the ones already indexed, e.g. a fresh map of a file that was
+        appended to, and index the rows past them. Existing metadata and
+        int8 codes are kept, so the cost follows the new rows only.
+        """
+        with self.lock.write():
+            start, end = self._size, vectors.shape[0]
+            if end - start != len(metadata):
+                raise ValueError("metadata must cover exactly the new rows")
+            if self.keeps_float:
+                self._vectors = vectors
+            if self.quantized:
+                if end > self._codes.shape[0]:
+                    capacity = max(end, 2 * self._codes.shape[0])
+                    codes = np.empty((capacity, self.dim), dtype=np.int8)
+                    scales = np.empty(capacity, dtype=np.float32)
+                    codes[:start], scales[:start] = self._codes[:start], self._scales[:start]
+                    self._codes, self._scales = codes, scales
+                for block_start in range(start, end, 65536):
+                    block = np.asarray(vectors[block_start:min(end, block_start + 65536)], dtype=np.float32)
+                    self._store_codes(block_start, block)
+            self._capacity = end if self.keeps_float else self._codes.shape[0]
+            self._meta.extend(metadata)
+            self._size = end
+            self._update_ann(start)
+
+    @classmethod
+    def from_chunks(cls, chunks: list) -> "VectorIndex":
+        """
+        Build an index from a list of chunk dicts with a 'vector' key.
+        """
+        index = cls(capacity=max(len(chunks), 1))
+        chunks = [c for c in chunks if len(c.get("vector", [])) > 0]
+        if chunks:
+            index.add_many(
+                np.asarray([c["vector"] for c in chunks], dtype=np.float32),
+                [{k: v for k, v in c.items() if k != "vector"} for c in chunks]
+            )
+        return index
+
+
+def index_options() -> dict:
+    """Vector representation of new indexes, from VECTOR_QUANTIZATION."""
+    if VECTOR_QUANTIZATION == "int8":
+        return {"quantization": "int8", "rerank": QUANTIZED_RERANK_FACTOR}
+    if VECTOR_QUANTIZATION != "float32":
+        raise ValueError(f"Unknown VECTOR_QUANTIZATION: {VECTOR_QUANTIZATION}")
+    return {}
+
+
+def create_ann() -> Optional[IVFIndex]:
+    """An untrained IVF engine when ANN_ENABLED is set, else None."""
+    if ANN_ENABLED:
+        return IVFIndex(nlist=ANN_NLIST, nprobe=ANN_NPROBE, min_size=ANN_MIN_SIZE)
+    return None
+
+
+def create_index(labeled: bool = False) -> VectorIndex:
+    """
+    Build an empty index, with an IVF engine attached when ANN_ENABLED is set
+    and int8 rows when VECTOR_QUANTIZATION is "int8".
+    Collections smaller than ANN_MIN_SIZE are still searched exactly.
+    """
+    return VectorIndex(ann=create_ann(), labeled=labeled, **index_options())
+
+
+class PartitionedIndex:
+    """
+    Chunks grouped by a metadata field (document_id by default).
+
+    Documents smaller than min_partition_size share one labeled index
+    (`shared`), so an unscoped search over many small documents is a
+    single matrix scan, and the shared ANN engine trains once the corpus,
+    not any one document, is large. A document that grows past the
+    threshold moves to a VectorIndex of its own in `partitions`, and
+    partitions mapped from disk are always installed there (see attach).
+
+    A scoped query only scores the rows of the documents it names, so its
+    cost follows the size of those documents rather than the whole
+    corpus, and chunks from other documents can never be returned.
+
+    With HYBRID_SEARCH_ENABLED a BM25 index over the chunk text is kept
+    in step with every change (see data/lexical.py).
+
+    Changes hold the write side of `lock` and searches and size queries
+    the read side, so searches can run on worker threads while the event
+    loop keeps changing the index.
+    """
+
+    def __init__(self, key: str = "document_id", min_partition_size: int = PARTITION_MIN_SIZE):
+        self.key = key
+        self.min_partition_size = min_partition_size
+        self.partitions = {}
+        self.shared = create_index(labeled=True)
+        # name -> label of its rows in `shared`, and how many there are
+        self._labels = {}
+        self._shared_counts = {}
+        self._next_label = 0
+        self.lexical = BM25Index() if HYBRID_SEARCH_ENABLED else None
+        self.lock = RWLock()
+        # Bumped on every change; versions[name] is the value at the last
+        # change to that partition (kept after it is dropped), so callers
+        # can tell whether anything they depend on has moved
+        self.version = 0
+        self.versions = {}
+
+    def __len__(self) -> int:
+        with self.lock.read():
+            return len(self.shared) + sum(len(index) for index in self.partitions.values())
+
+    def __iter__(self):
+        yield from self.shared
+        for index in list(self.partitions.values()):
+            yield from index
+
+    def partition_names(self) -> set:
+        """Names of every partition holding chunks, shared or not."""
+        with self.lock.read():
+            return set(self.partitions) | set(self._labels)
+
+    @property
+    def metadata(self) -> list:
+        with self.lock.read():
+            return self.shared.metadata + [meta for index in self.partitions.values() for meta in index.metadata]
+
+    @property
+    def nbytes(self) -> int:
+        with self.lock.read():
+            return self.shared.nbytes + sum(index.nbytes for index in self.partitions.values())
+
+    def _touch(self, name):
+        self.version += 1
+        self.versions[name] = self.version
+
+    def _label(self, name) -> int:
+        label = self._labels.get(name)
+        if label is None:
+            label = self._labels[name] = self._next_label
+            self._next_label += 1
+            self._shared_counts[name] = 0
+        return label
+
+    def _forget_shared(self, name) -> int:
+        """Drop a name's rows from the shared index. Returns how many there were."""
+        label = self._labels.pop(name, None)
+        if label is None:
+            return 0
+        del self._shared_counts[name]
+        return self.shared.remove_labels([label])
+
+    def _promote(self, name) -> VectorIndex:
+        """Move a document's rows out of the shared index into its own."""
+        index = self.partitions[name] = create_index()
+        label = self._labels.get(name)
+        if label is not None:
+            rows = self.shared.label_rows([label])
+            index.add_many(self.shared.take(rows), [self.shared.metadata[row] for row in rows.tolist()])
+            self._forget_shared(name)
+        return index
+
+    def _insert(self, name, block: np.ndarray, group: list) -> int:
+        index = self.partitions.get(name)
+        if index is None and self._shared_counts.get(name, 0) + len(group) >= self.min_partition_size:
+            index = self._promote(name)
+        if index is not None:
+            row = len(index)
+            index.add_many(block, group)
+        else:
+            row = len(self.shared)
+            self.shared.add_many(block, group, label=self._label(name))
+            self._shared_counts[name] += len(group)
+        if self.lexical is not None:
+            self.lexical.add(name, group)
+        self._touch(name)
+        return row
+
+    def add(self, vector, metadata: dict) -> int:
+        with self.lock.write():
+            return self._insert(metadata.get(self.key), np.asarray(vector, dtype=np.float32).reshape(1, -1), [metadata])
+
+    def add_many(self, vectors, metadata: list) -> None:
+        block = np.asarray(vectors, dtype=np.float32)
+        groups = {}
+        for row, meta in enumerate(metadata):
+            groups.setdefault(meta.get(self.key), []).append(row)
+        with self.lock.write():
+            for name, rows in groups.items():
+                self._insert(name, block[rows], [metadata[row] for row in rows])
+
+    def remove_where(self, field: str, value) -> int:
+        """
+        Drop matching entries. Removing by the partition key drops the
+        whole partition without touching the others.
+        """
+        with self.lock.write():
+            if field == self.key:
+                if value not in self.partitions and value not in self._labels:
+                    return 0
+                index = self.partitions.pop(value, None)
+                removed = self._forget_shared(value) + (len(index) if index is not None else 0)
+                if self.lexical is not None:
+                    self.lexical.remove_partition(value)
+                self._touch(value)
+                return removed
+            removed = 0
+            for name in self.partition_names():
+                removed += self.remove_from(name, lambda meta: meta.get(field) == value)
+            return removed
+
+    def remove_from(self, name, predicate) -> int:
+        """
+        Drop entries of one partition whose metadata matches the predicate.
+        """
+        with self.lock.write():
+            removed = 0
+            index = self.partitions.get(name)
+            if index is not None:
+                removed += index.remove_if(predicate)
+            label = self._labels.get(name)
+            if label is not None:
+                shared_removed = self.shared.remove_if(predicate, labels=[label])
+                self._shared_counts[name] -= shared_removed
+                if not self._shared_counts[name]:
+                    self._forget_shared(name)
+                removed += shared_removed
+            if removed:
+                if self.lexical is not None:
+                    self.lexical.remove_if(name, predicate)
+                self._touch(name)
+            return removed
+
+    def attach(self, name, index: VectorIndex, added: list, replace: bool = False):
+        """
+        Install a prebuilt partition, e.g. one mapped from disk. It gets
+        an index of its own whatever its size, and replaces any rows the
+        name had in the shared index.
+
+        Args:
+            name: Partition key
+            index: The partition's full index
+            added: Entries that are new since the partition's last version
+            replace: The old version's entries are gone, not kept in `index`
+        """
+        with self.lock.write():
+            self._forget_shared(name)
+            if self.lexical is not None:
+                if replace:
+                    self.lexical.remove_partition(name)
+                self.lexical.add(name, added)
+            self.partitions[name] = index
+            self._touch(name)
+
+    def extend(self, name, vectors: np.ndarray, added: list):
+        """
+        Grow an attached partition in place: `vectors` is a longer matrix
+        of its rows and `added` the metadata of the rows past the old end
+        (see VectorIndex.extend_mapped).
+        """
+        with self.lock.write():
+            self.partitions[name].extend_mapped(vectors, added)
+            if self.lexical is not None:
+                self.lexical.add(name, added)
+            self._touch(name)
+
+    def rename(self, old_name, new_name) -> int:
+        """
+        Move a partition under a new key, rewriting the key field of its
+        entries. Entries already under the new key are kept alongside.
+        Returns the number of entries moved.
+        """
+        with self.lock.write():
+            if old_name not in self.partitions and old_name not in self._labels:
+                return 0
+            moved = 0
+            index = self.partitions.pop(old_name, None)
+            if index is not None:
+                for meta in index.metadata:
+                    meta[self.key] = new_name
+                target = self.partitions.get(new_name)
+                if target is None:
+                    self.partitions[new_name] = index
+                else:
+                    target.add_many(index.vectors, index.metadata)
+                moved += len(index)
+            label = self._labels.pop(old_name, None)
+            if label is not None:
+                count = self._shared_counts.pop(old_name)
+                for row in self.shared.label_rows([label]).tolist():
+                    self.shared.metadata[row][self.key] = new_name
+                if new_name in self._labels:
+                    self.shared.relabel(label, self._labels[new_name])
+                    self._shared_counts[new_name] += count
+                else:
+                    self._labels[new_name] = label
+                    self._shared_counts[new_name] = count
+                moved += count
+            if self.lexical is not None:
+                self.lexical.rename(old_name, new_name)
+            self._touch(old_name)
+            self._touch(new_name)
+            return moved
+
+    def clear(self):
+        with self.lock.write():
+            for name in set(self.partitions) | set(self._labels):
+                self._touch(name)
+            self.partitions = {}
+            self.shared.clear()
+            self._labels = {}
+            self._shared_counts = {}
+            if self.lexical is not None:
+                self.lexical.clear()
+
+    def wait_for_ann(self):
+        """Block until no partition is training an ANN engine."""
+        self.shared.wait_for_ann()
+        for index in list(self.partitions.values()):
+            index.wait_for_ann()
+
+    def snapshot(self, partitions: Optional[list] = None):
+        """
+        Version stamp of the named partitions (the whole index if None).
+        Equal stamps mean none of those partitions changed in between.
+        """
+        if partitions is None:
+            return self.version
+        return tuple(self.versions.get(name, 0) for name in partitions)
+
+    def search(self, query_vector, k: int = 3, partitions: Optional[list] = None, **kwargs) -> list:
+        """
+        Search the named partitions (all of them if None) and merge results.
+        Keyword arguments go to VectorIndex.search.
+
+        Returns:
+            List of (score, metadata) tuples, best first
+        """
+        with self.lock.read():
+            if partitions is None:
+                matches = self.shared.search(query_vector, k, **kwargs)
+                indexes = list(self.partitions.values())
+            else:
+                labels = [self._labels[name] for name in partitions if name in self._labels]
+                matches = self.shared.search(query_vector, k, labels=labels, **kwargs) if labels else []
+                indexes = [self.partitions[name] for name in partitions if name in self.partitions]
+            for index in indexes:
+                matches.extend(index.search(query_vector, k, **kwargs))
+        matches.sort(key=lambda m: m[0], reverse=True)
+        return matches[:k]
+
+    def search_text(self, query: str, k: int = 3, partitions: Optional[list] = None) -> list:
+        """
+        BM25 search over chunk text in the named partitions.
+
+        Returns:
+            List of (score, metadata) tuples, best first
+        """
+        if self.lexical is None:
+            return []
+        with self.lock.read():
+            return self.lexical.search(query, k, partitions)
@@ -0,0 +1,148 @@
+"""
+Inverted index over chunk text with BM25 scoring.
+
+Embeddings blur exact strings such as part numbers, error codes and
+identifiers; this catches them. Postings are kept per partition (document)
+so a scoped query only walks its own documents' lists, while document
+frequencies stay corpus-wide so scores are comparable across partitions.
+"""
+import heapq
+import math
+import re
+from collections import Counter
+from typing import Optional
+
+# Words joined by -, _, ., / or : stay one token ("ab-125", "err_conn_reset")
+# and are also indexed by their parts
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-_./:][a-z0-9]+)*")
+_SEPARATORS = re.compile(r"[-_./:]")
+
+# Too common to help ranking; skipping them keeps query postings short
+STOPWORDS = frozenset("""
+a an and are as at be but by can do does for from has have how i if in into is it its
+me my no not of on or so that the their then there these this to was what when where
+which who why will with you your
+""".split())
+
+
+def tokenize(text: str) -> list:
+    """Lowercase terms of a text, compound identifiers plus their parts."""
+    tokens = []
+    for match in TOKEN_PATTERN.finditer(text.lower()):
+        token = match.group()
+        if token in STOPWORDS:
+            continue
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(part for part in _SEPARATORS.split(token) if part and part not in STOPWORDS)
+    return tokens
+
+
+class BM25Index:
+    """
+    Incremental BM25 index attached to a PartitionedIndex.
+
+    The owning index calls add / remove_partition / remove_if / rename /
+    clear as it changes, passing the same metadata dicts it stores, and
+    search returns those dicts so results line up with vector search.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        # term -> partition -> {entry id: term frequency}
+        self._postings = {}
+        self._df = Counter()
+        # entry id -> (partition, metadata, length, terms)
+        self._entries = {}
+        self._partitions = {}
+        self._total_length = 0
+        self._next_id = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, partition, metadata: list):
+        """Index the text of new entries of a partition."""
+        ids = self._partitions.setdefault(partition, set())
+        for meta in metadata:
+            counts = Counter(tokenize(meta.get("text") or ""))
+            entry_id = self._next_id
+            self._next_id += 1
+            length = sum(counts.values())
+            self._entries[entry_id] = (partition, meta, length, tuple(counts))
+            ids.add(entry_id)
+            self._total_length += length
+            for term, tf in counts.items():
+                self._postings.setdefault(term, {}).setdefault(partition, {})[entry_id] = tf
+                self._df[term] += 1
+
+    def _remove(self, entry_id: int):
+        partition, _, length, terms = self._entries.pop(entry_id)
+        self._total_length -= length
+        for term in terms:
+            by_partition = self._postings[term]
+            postings = by_partition[partition]
+            del postings[entry_id]
+            if not postings:
+                del by_partition[partition]
+                if not by_partition:
+                    del self._postings[term]
+            self._df[term] -= 1
+            if not self._df[term]:
+                del self._df[term]
+
+    def remove_partition(self, partition):
+        for entry_id in self._partitions.pop(partition, ()):
+            self._remove(entry_id)
+
+    def remove_if(self, partition, predicate):
+        ids = self._partitions.get(partition, set())
+        for entry_id in [i for i in ids if predicate(self._entries[i][1])]:
+            self._remove(entry_id)
+            ids.discard(entry_id)
+
+    def rename(self, old_partition, new_partition):
+        ids = self._partitions.pop(old_partition, set())
+        for entry_id in ids:
+            _, meta, length, terms = self._entries[entry_id]
+            self._entries[entry_id] = (new_partition, meta, length, terms)
+            for term in terms:
+                by_partition = self._postings[term]
+                moved = by_partition.pop(old_partition, None)
+                if moved is not None:
+                    by_partition.setdefault(new_partition, {}).update(moved)
+        self._partitions.setdefault(new_partition, set()).update(ids)
+
+    def clear(self):
+        self.__init__(self.k1, self.b)
+
+    def search(self, query: str, k: int = 3, partitions: Optional[list] = None) -> list:
+        """
+        BM25 top-k over the named partitions (all of them if None).
+        Only the postings of the query's terms are visited.
+
+        Returns:
+            List of (score, metadata) tuples, best first
+        """
+        terms = [term for term in set(tokenize(query)) if term in self._postings]
+        if not terms or k <= 0:
+            return []
+        n = len(self._entries)
+        avg_length = self._total_length / n if n else 1.0
+        k1, b = self.k1, self.b
+
+        scores = {}
+        for term in terms:
+            df = self._df[term]
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            by_partition = self._postings[term]
+            names = by_partition.keys() if partitions is None else partitions
+            for name in names:
+                for entry_id, tf in by_partition.get(name, {}).items():
+                    length = self._entries[entry_id][2]
+                    weight = idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / avg_length))
+                    scores[entry_id] = scores.get(entry_id, 0.0) + weight
+
+        best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [(score, self._entries[entry_id][1]) for entry_id, score in best]
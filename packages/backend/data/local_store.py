@@ -0,0 +1,405 @@
+"""
+Persistent store for the chunks of local (non-D1) uploads.
+
+Every document gets a directory holding an append-only float32 vector
+file, an append-only JSON-lines metadata file and a manifest naming how
+many rows are committed. Vectors are opened with np.memmap (copy-on-write),
+so a restart maps the files instead of rebuilding them, and several
+worker processes searching the same store share one copy of the vectors
+through the OS page cache.
+
+Writes follow a commit protocol: bytes past the committed length are
+truncated, the new rows are appended and fsynced, then the manifest is
+atomically replaced. A crash at any point leaves the previous manifest
+and every row it names intact. Each manifest also carries the id of the
+partition it was created for, so a document deleted and uploaded again
+by another worker is reloaded rather than appended to.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import shutil
+import uuid
+from contextlib import contextmanager
+from typing import Optional
+import numpy as np
+
+from backend.config import LOCAL_STORE_DIR, LOCAL_STORE_REFRESH_INTERVAL
+from backend.data.index import PartitionedIndex, VectorIndex, create_ann, index_options
+from backend.utils.telemetry import registry
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process use only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = "manifest.json"
+VECTORS = "vectors.f32"
+METADATA = "metadata.jsonl"
+
+
+def _fsync_write(path: str, data: bytes):
+    """Write a file atomically: temp file, fsync, rename."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class LocalStore:
+    """
+    Disk-backed chunk store that keeps a PartitionedIndex (`index`) in
+    step with the files. All writes go through add_many / remove_document;
+    a background task (start / stop) picks up writes made by other
+    processes.
+
+    File work runs on worker threads and only reads what changed; the
+    index and `documents` are only changed on the event loop.
+    """
+
+    def __init__(self, directory: str = LOCAL_STORE_DIR, refresh_interval: float = LOCAL_STORE_REFRESH_INTERVAL):
+        self.directory = directory
+        self.refresh_interval = refresh_interval
+        self.index = PartitionedIndex("document_id")
+        # content hash -> local document info, see storage.register_local_document
+        self.documents = {}
+        # partition name -> manifest it was loaded from
+        self._loaded = {}
+        self._documents_mtime = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _partitions_dir(self) -> str:
+        return os.path.join(self.directory, "partitions")
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self._partitions_dir(), hashlib.sha1(name.encode("utf-8")).hexdigest())
+
+    @contextmanager
+    def _lock(self, path: str, create: bool = True):
+        """
+        Exclusive lock on a directory, shared by every worker process.
+        With create=False a missing directory raises FileNotFoundError
+        instead of being created.
+        """
+        if create:
+            os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, ".lock"), "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_manifest(self, path: str) -> Optional[dict]:
+        try:
+            with open(os.path.join(path, MANIFEST)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _map(self, path: str, manifest: dict) -> np.ndarray:
+        """Committed vectors of a partition as a copy-on-write memory map."""
+        if manifest["rows"] == 0:
+            return np.empty((0, manifest["dim"]), dtype=np.float32)
+        return np.memmap(
+            os.path.join(path, VECTORS),
+            dtype=np.float32,
+            mode="c",
+            shape=(manifest["rows"], manifest["dim"])
+        )
+
+    def _read_metadata(self, path: str, manifest: dict, start: int = 0) -> list:
+        """Metadata lines between byte `start` and the committed end."""
+        with open(os.path.join(path, METADATA), "rb") as f:
+            f.seek(start)
+            data = f.read(manifest["metadata_bytes"] - start)
+        return [json.loads(line) for line in data.splitlines() if line]
+
+    def _read_partition(self, path: str, manifest: dict, previous: Optional[dict]) -> dict:
+        """
+        What changed in a partition since `previous`, the manifest it was
+        last loaded from: only the rows past it when the same partition
+        grew, everything otherwise. Call with the partition lock held.
+        """
+        start = row = 0
+        if previous and previous["id"] == manifest["id"] and previous["rows"] <= manifest["rows"]:
+            start, row = previous["metadata_bytes"], previous["rows"]
+        return {
+            "manifest": manifest,
+            "vectors": self._map(path, manifest),
+            "metadata": self._read_metadata(path, manifest, start),
+            "start": row
+        }
+
+    def _apply(self, update: dict):
+        """
+        Bring the index up to a partition update read on a worker thread.
+        Rows the index already holds are skipped; an update read against
+        a partition that has been replaced since waits for the next refresh.
+        """
+        manifest = update["manifest"]
+        name = manifest["name"]
+        current = self._loaded.get(name)
+        if current is not None and current["id"] == manifest["id"] and name in self.index.partitions:
+            skip = current["rows"] - update["start"]
+            if manifest["rows"] <= current["rows"] or skip < 0:
+                return
+            self.index.extend(name, update["vectors"], update["metadata"][skip:])
+        elif update["start"] == 0:
+            index = VectorIndex.from_matrix(update["vectors"], update["metadata"], ann=create_ann(), **index_options())
+            self.index.attach(name, index, update["metadata"], replace=True)
+        else:
+            return
+        self._loaded[name] = manifest
+
+    def _scan(self, loaded: dict, sweep: bool = False) -> tuple:
+        """
+        Read every committed partition that differs from `loaded`, each
+        under its lock; partitions deleted meanwhile are skipped. With
+        sweep, leftover temp files are removed on the way. Runs on a
+        worker thread.
+
+        Returns:
+            (partition updates, names of every committed partition,
+            documents.json contents or None if unchanged)
+        """
+        updates = []
+        names = set()
+        for entry in os.scandir(self._partitions_dir()):
+            if not entry.is_dir() or ".deleted." in entry.name:
+                continue
+            try:
+                # Another worker may be mid-write: its temp manifest must
+                # survive the sweep, and the manifest read must see its commit
+                with self._lock(entry.path, create=False):
+                    manifest = self._read_manifest(entry.path)
+                    if manifest is None:
+                        continue
+                    if sweep:
+                        self._remove_stale_files(entry.path)
+                    names.add(manifest["name"])
+                    previous = loaded.get(manifest["name"])
+                    if previous is None or (previous["id"], previous["rows"]) != (manifest["id"], manifest["rows"]):
+                        updates.append(self._read_partition(entry.path, manifest, previous))
+            except FileNotFoundError:
+                # Deleted by another worker between the listing and the read
+                continue
+        return updates, names, self._read_documents()
+
+    def _sync(self, loaded: dict, scanned: tuple):
+        """
+        Apply a scan taken against `loaded` to the index, on the loop.
+        Partitions this process wrote or deleted since the scan started
+        are left alone: their state is newer than the scan's.
+        """
+        updates, names, documents = scanned
+        if documents is not None:
+            self._set_documents(*documents)
+        for update in updates:
+            name = update["manifest"]["name"]
+            if self._loaded.get(name) is loaded.get(name):
+                self._apply(update)
+        for name in set(loaded) - names:
+            if self._loaded.get(name) is loaded[name]:
+                self.index.remove_where(self.index.key, name)
+                del self._loaded[name]
+
+    def load(self):
+        """
+        Map every committed partition. Called on app startup.
+        """
+        os.makedirs(self._partitions_dir(), exist_ok=True)
+        loaded = dict(self._loaded)
+        self._sync(loaded, self._scan(loaded, sweep=True))
+
+    def _remove_stale_files(self, path: str):
+        """
+        Drop files that are not part of the partition, e.g. a temp
+        manifest left by a crashed writer. Call with the partition lock held.
+        """
+        keep = {MANIFEST, ".lock", VECTORS, METADATA}
+        for name in os.listdir(path):
+            if name not in keep:
+                try:
+                    os.remove(os.path.join(path, name))
+                except OSError:
+                    pass
+
+    async def refresh(self):
+        """
+        Pick up partitions written or deleted by other worker processes.
+        """
+        if not os.path.isdir(self._partitions_dir()):
+            return
+        loaded = dict(self._loaded)
+        self._sync(loaded, await asyncio.to_thread(self._scan, loaded))
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error("Local store refresh error: %s", e)
+
+    def start(self):
+        """Start the background refresh loop. Called on app startup."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the background refresh loop. Called on app shutdown."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _append(self, name: str, block: np.ndarray, metadata: list, previous: Optional[dict]) -> dict:
+        """
+        Durably append rows to a partition, then read back what changed
+        since `previous` (rows from other workers included). Runs without
+        touching the index, so it can be called from a worker thread.
+
+        Returns:
+            Partition update for _apply
+        """
+        path = self._path(name)
+        with self._lock(path):
+            manifest = self._read_manifest(path) or {
+                "name": name, "id": uuid.uuid4().hex, "dim": block.shape[1], "rows": 0, "metadata_bytes": 0
+            }
+            if block.shape[1] != manifest["dim"]:
+                raise ValueError(f"Expected {manifest['dim']}-dim vectors, got {block.shape[1]}")
+
+            with open(os.path.join(path, VECTORS), "ab") as f:
+                # Drop anything a crashed writer left past the commit point
+                f.truncate(manifest["rows"] * manifest["dim"] * 4)
+                f.write(np.ascontiguousarray(block, dtype=np.float32).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+            lines = b"".join(json.dumps(meta).encode("utf-8") + b"\n" for meta in metadata)
+            with open(os.path.join(path, METADATA), "ab") as f:
+                f.truncate(manifest["metadata_bytes"])
+                f.write(lines)
+                f.flush()
+                os.fsync(f.fileno())
+
+            manifest = {
+                **manifest,
+                "rows": manifest["rows"] + block.shape[0],
+                "metadata_bytes": manifest["metadata_bytes"] + len(lines)
+            }
+            _fsync_write(os.path.join(path, MANIFEST), json.dumps(manifest).encode("utf-8"))
+            return self._read_partition(path, manifest, previous)
+
+    async def add_many(self, vectors, metadata: list):
+        """
+        Append chunks, grouped into partitions by document_id, to disk and
+        then to the index. Rows are stored unit-length. The file writes
+        and fsyncs run on a worker thread.
+        """
+        block = np.asarray(vectors, dtype=np.float32)
+        if block.ndim != 2 or block.shape[0] == 0:
+            return
+        norms = np.linalg.norm(block, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        block = block / norms
+
+        groups = {}
+        for row, meta in enumerate(metadata):
+            groups.setdefault(meta.get(self.index.key), []).append(row)
+        for name, rows in groups.items():
+            update = await asyncio.to_thread(
+                self._append, name, block[rows], [metadata[row] for row in rows], self._loaded.get(name)
+            )
+            self._apply(update)
+
+    def _delete(self, name: str):
+        """Delete a partition's files and the content hashes registered for it."""
+        path = self._path(name)
+        if os.path.isdir(path):
+            with self._lock(path):
+                # Renaming first makes the delete atomic for readers
+                trash = f"{path}.deleted.{os.getpid()}"
+                os.replace(path, trash)
+            shutil.rmtree(trash, ignore_errors=True)
+        if os.path.isdir(self.directory):
+            with self._lock(self.directory):
+                self._load_documents()
+                hashes = [h for h, info in self.documents.items() if info.get("document_id") == name]
+                for content_hash in hashes:
+                    del self.documents[content_hash]
+                if hashes:
+                    self._write_documents()
+
+    async def remove_document(self, name: str) -> int:
+        """
+        Delete a partition and drop it from the index. The file work runs
+        on a worker thread, like add_many.
+
+        Returns:
+            Number of entries removed
+        """
+        await asyncio.to_thread(self._delete, name)
+        self._loaded.pop(name, None)
+        return self.index.remove_where(self.index.key, name)
+
+    def _documents_path(self) -> str:
+        return os.path.join(self.directory, "documents.json")
+
+    def _read_documents(self) -> Optional[tuple]:
+        """(mtime, contents) of documents.json, or None if missing or unchanged."""
+        try:
+            mtime = os.path.getmtime(self._documents_path())
+            if mtime == self._documents_mtime:
+                return None
+            with open(self._documents_path()) as f:
+                return mtime, json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _set_documents(self, mtime: float, documents: dict):
+        self.documents.clear()
+        self.documents.update(documents)
+        self._documents_mtime = mtime
+
+    def _load_documents(self):
+        documents = self._read_documents()
+        if documents is not None:
+            self._set_documents(*documents)
+
+    def register_document(self, content_hash: str, info: dict):
+        """Record a local document by content hash, on disk and in memory."""
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock(self.directory):
+            self._load_documents()
+            self.documents[content_hash] = info
+            self._write_documents()
+
+    def _write_documents(self):
+        _fsync_write(self._documents_path(), json.dumps(self.documents).encode("utf-8"))
+        self._documents_mtime = os.path.getmtime(self._documents_path())
+
+    def stats(self) -> dict:
+        return {
+            "partitions": len(self._loaded),
+            "rows": sum(m["rows"] for m in self._loaded.values()),
+            "vector_bytes": sum(m["rows"] * m["dim"] * 4 for m in self._loaded.values()),
+            "metadata_bytes": sum(m["metadata_bytes"] for m in self._loaded.values())
+        }
+
+
+local_store = LocalStore()
+registry.gauge("local_store_chunks", "Chunks of local uploads in the persistent store", lambda: len(local_store.index))
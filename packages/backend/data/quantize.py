@@ -0,0 +1,115 @@
+"""
+Int8 scalar quantization of unit vectors.
+
+Each row is stored as int8 codes plus one float32 scale (max |x| / 127),
+so a 1536-dim row takes 1540 bytes instead of 6144. Scores are computed
+against the float32 query straight from the codes, without expanding the
+matrix, and stay within ~1e-3 of the float32 cosine.
+
+Run `python -m backend.data.quantize` for a recall and latency report
+against full-precision search on synthetic data.
+"""
+import json
+import time
+import numpy as np
+
+
+def quantize_int8(vectors) -> tuple:
+    """
+    Quantize rows with a per-row scale.
+
+    Returns:
+        (codes, scales): (n, dim) int8 matrix and (n,) float32 scales
+    """
+    block = np.asarray(vectors, dtype=np.float32)
+    if block.ndim == 1:
+        block = block[None, :]
+    scales = (np.abs(block).max(axis=1, initial=0.0) / 127.0).astype(np.float32)
+    # Zero rows keep zero codes and score 0
+    scales[scales == 0] = 1.0
+    codes = np.rint(block / scales[:, None]).astype(np.int8)
+    return codes, scales
+
+
+def dequantize_int8(codes: np.ndarray, scales: np.ndarray) -> np.ndarray:
+    """Approximate float32 rows back from codes and scales."""
+    return codes.astype(np.float32) * scales[:, None]
+
+
+def int8_scores(codes: np.ndarray, scales: np.ndarray, query: np.ndarray) -> np.ndarray:
+    """
+    Approximate dot products of every row with a float32 query.
+    einsum reads the int8 codes directly instead of first copying the
+    matrix to float32.
+    """
+    if codes.shape[0] == 0:
+        return np.empty(0, dtype=np.float32)
+    return np.einsum("ij,j->i", codes, query) * scales
+
+
+def recall_report(vectors: np.ndarray, queries: np.ndarray, k: int = 10, rerank_factors: tuple = (0, 2, 4, 8)) -> dict:
+    """
+    Compare int8 search, with and without a float32 re-rank of the top
+    rerank_factor * k candidates, against exact float32 search.
+
+    Args:
+        vectors: (n, dim) unit-length rows
+        queries: (q, dim) unit-length queries
+        k: Results per query
+        rerank_factors: Candidate multipliers to sweep (0 = no re-rank)
+
+    Returns:
+        dict with bytes per row, exact latency, and recall@k / latency per
+        re-rank factor
+    """
+    from backend.data.index import VectorIndex
+
+    metadata = [{"row": i} for i in range(vectors.shape[0])]
+    exact_index = VectorIndex()
+    exact_index.add_many(vectors, metadata)
+    started = time.perf_counter()
+    exact = [{meta["row"] for _, meta in exact_index.search(q, k)} for q in queries]
+    exact_ms = (time.perf_counter() - started) * 1000 / len(queries)
+
+    rows = []
+    for factor in rerank_factors:
+        index = VectorIndex(quantization="int8", rerank=factor)
+        index.add_many(vectors, metadata)
+        started = time.perf_counter()
+        approx = [{meta["row"] for _, meta in index.search(q, k)} for q in queries]
+        latency_ms = (time.perf_counter() - started) * 1000 / len(queries)
+        recall = float(np.mean([len(a & e) / len(e) for a, e in zip(approx, exact)]))
+        rows.append({
+            "rerank_factor": factor,
+            "recall": recall,
+            "latency_ms": latency_ms,
+            "bytes_per_row": index.nbytes / len(index)
+        })
+
+    return {
+        "size": vectors.shape[0],
+        "dim": vectors.shape[1],
+        "k": k,
+        "float32_bytes_per_row": exact_index.nbytes / len(exact_index),
+        "exact_latency_ms": exact_ms,
+        "int8": rows
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Int8 quantization recall vs float32 on synthetic clustered vectors")
+    parser.add_argument("--size", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    centers = rng.normal(size=(200, args.dim)).astype(np.float32)
+    data = centers[rng.integers(0, 200, args.size)] + 0.5 * rng.normal(size=(args.size, args.dim)).astype(np.float32)
+    data /= np.linalg.norm(data, axis=1, keepdims=True)
+    queries = data[rng.integers(0, args.size, args.queries)] + 0.1 * rng.normal(size=(args.queries, args.dim)).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    print(json.dumps(recall_report(data, queries, k=args.k), indent=2))
@@ -0,0 +1,166 @@
+"""
+Process-local replica of the D1 chunk table.
+
+Chat searches the replica instead of downloading every chunk from D1 per
+request. New rows are pulled incrementally past a rowid watermark; deleted
+documents are dropped by document-level invalidation, either directly
+(when this process deletes them) or by a periodic reconcile against D1.
+"""
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from backend.config import REPLICA_SYNC_INTERVAL, REPLICA_RECONCILE_INTERVAL
+from backend.data.index import PartitionedIndex
+from backend.services.d1 import get_chunk_vectors_since, get_chunk_stats
+from backend.utils.telemetry import registry
+
+logger = logging.getLogger(__name__)
+
+
+class ChunkReplica:
+    """
+    Incrementally synced copy of D1 chunks, partitioned by document.
+    """
+
+    def __init__(self, page_size: int = 500):
+        self.page_size = page_size
+        self.index = PartitionedIndex("document_id")
+        self.watermark = 0
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._last_sync: Optional[float] = None
+        self._last_reconcile: Optional[float] = None
+        self._last_sync_rows = 0
+        self._last_sync_seconds = 0.0
+        self._full_rebuilds = 0
+
+    async def sync(self) -> int:
+        """
+        Pull rows inserted since the watermark.
+
+        Returns:
+            Number of rows added
+        """
+        async with self._lock:
+            return await self._pull()
+
+    async def _pull(self) -> int:
+        started = time.monotonic()
+        added = 0
+        while True:
+            matrix, metadata, last_rowid = await get_chunk_vectors_since(self.watermark, self.page_size)
+            if last_rowid is None:
+                break
+            if metadata:
+                self.index.add_many(matrix, metadata)
+            self.watermark = max(self.watermark, last_rowid)
+            added += len(metadata)
+            if len(metadata) < self.page_size:
+                break
+        self._last_sync = time.monotonic()
+        self._last_sync_rows = added
+        self._last_sync_seconds = self._last_sync - started
+        return added
+
+    async def reconcile(self):
+        """
+        Drop documents that no longer exist in D1, then verify the row
+        count. Missing rows (e.g. rowids reused after deletes) trigger a
+        full rebuild.
+        """
+        async with self._lock:
+            stats = await get_chunk_stats()
+            local_docs = self.index.partition_names()
+            for document_id in local_docs - stats["document_ids"]:
+                self.index.remove_where("document_id", document_id)
+            self.watermark = max((meta["rowid"] for meta in self.index.metadata), default=0)
+            await self._pull()
+
+            # Rows inserted since the count was taken can only make the
+            # replica larger; fewer rows means it missed some.
+            if len(self.index) < stats["count"]:
+                self.index.clear()
+                self.watermark = 0
+                self._full_rebuilds += 1
+                await self._pull()
+            self._last_reconcile = time.monotonic()
+
+    def invalidate_document(self, document_id: str) -> int:
+        """
+        Drop a document's chunks from the replica.
+
+        Returns:
+            Number of chunks removed
+        """
+        return self.index.remove_where("document_id", document_id)
+
+    def rename_document(self, old_id: str, new_id: str) -> int:
+        """
+        Move a document's chunks to another document ID, matching a
+        reassignment in D1 (rowids are unchanged, so sync won't see it).
+
+        Returns:
+            Number of chunks moved
+        """
+        return self.index.rename(old_id, new_id)
+
+    def invalidate_chunks(self, document_id: str, start_index: int) -> int:
+        """
+        Drop a document's chunks at or after start_index from the replica.
+
+        Returns:
+            Number of chunks removed
+        """
+        return self.index.remove_from(document_id, lambda meta: (meta.get("chunk_index") or 0) >= start_index)
+
+    async def ensure_fresh(self, max_staleness: float = REPLICA_SYNC_INTERVAL):
+        """
+        Sync if the last sync is older than max_staleness seconds.
+        """
+        if self._last_sync is None or time.monotonic() - self._last_sync > max_staleness:
+            await self.sync()
+
+    async def _run(self):
+        while True:
+            try:
+                if self._last_reconcile is None or time.monotonic() - self._last_reconcile > REPLICA_RECONCILE_INTERVAL:
+                    await self.reconcile()
+                else:
+                    await self.sync()
+            except Exception as e:
+                logger.error("Replica sync error: %s", e)
+            await asyncio.sleep(REPLICA_SYNC_INTERVAL)
+
+    def start(self):
+        """Start the background sync loop. Called on app startup."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the background sync loop. Called on app shutdown."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            "rows": len(self.index),
+            "bytes": self.index.nbytes,
+            "documents": len(self.index.partition_names()),
+            "watermark": self.watermark,
+            "sync_lag_seconds": now - self._last_sync if self._last_sync is not None else None,
+            "last_sync_rows": self._last_sync_rows,
+            "last_sync_seconds": self._last_sync_seconds,
+            "full_rebuilds": self._full_rebuilds
+        }
+
+
+replica = ChunkReplica()
+registry.gauge("replica_chunks", "Chunks held in the local replica of D1", lambda: len(replica.index))
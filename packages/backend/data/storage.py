@@ -2,54 +2,198 @@
 Storage layer for chunk data.
 Wraps D1 database operations for persistent embedding storage.
 """
-from backend.services.d1 import save_chunk as d1_save_chunk, get_all_chunks as d1_get_all_chunks
+import time
+from backend.services.d1 import (
+    save_chunks as d1_save_chunks,
+    delete_document as d1_delete_document,
+    delete_chunks_by_document as d1_delete_chunks_by_document,
+    delete_chunks_from as d1_delete_chunks_from,
+    get_user_documents as d1_get_user_documents,
+    get_documents as d1_get_documents,
+    get_linked_documents as d1_get_linked_documents,
+    reassign_chunks as d1_reassign_chunks,
+    PROVENANCE_FIELDS
+)
+from backend.data.local_store import local_store
+from backend.data.replica import replica
 
-# Keep in-memory fallback for backward compatibility with local uploads
+# Local uploads (no D1) are kept in the persistent local store, which maps
+# its vector files into indexes partitioned by document, so a restart
+# doesn't lose them and a scoped search only touches its own documents.
+# "documents" maps the SHA-256 of each local upload to its document.
 DB_MEMORY = {
-    "documents": {}, 
-    "chunks": []
+    "documents": local_store.documents,
+    "chunks": local_store.index
 }
 
-async def add_chunk(text: str, vector: list, source_doc: str, document_id: str = None):
-    """
-    Save a chunk of text and its vector embedding.
-    If document_id is provided, saves to D1 (cloud).
-    Otherwise, saves to in-memory storage (local).
-    """
-    if document_id:
-        # Save to D1 for cloud uploads
-        chunk_index = len(DB_MEMORY["chunks"])  # Use current count as index
-        await d1_save_chunk(
-            text=text,
-            embedding=vector,
-            source_doc=source_doc,
-            document_id=document_id,
-            chunk_index=chunk_index
-        )
-    else:
-        # Save to memory for local uploads (backward compatibility)
-        DB_MEMORY["chunks"].append({
-            "text": text,
-            "vector": vector,
-            "source": source_doc
-        })
+# user_id -> (fetched_at, document ids); avoids a D1 round trip per chat
+USER_DOCUMENTS_TTL = 30.0
+_user_documents = {}
+
+# document id -> (fetched_at, id of the document whose chunks it uses);
+# the owner is the document itself unless it is a deduplicated upload
+_chunk_owners = {}
+
+# Work skipped by serving duplicate uploads from existing chunks, since start
+DEDUP_STATS = {"uploads": 0, "bytes_saved": 0, "embeddings_saved": 0}
 
 
-async def get_all_chunks():
+def local_document_id(content_hash: str) -> str:
     """
-    Retrieve all chunks for searching.
-    Combines both D1 chunks and in-memory chunks.
+    Partition key for chunks from a local (non-D1) upload. Keyed on the
+    content, so uploads that share a filename never share a partition.
     """
-    d1_chunks = await d1_get_all_chunks()
-    
-    all_chunks = d1_chunks + DB_MEMORY["chunks"]
+    return f"local:{content_hash}"
+
+
+def is_local_document(document_id: str) -> bool:
+    return document_id.startswith("local:")
+
+
+async def add_chunks(chunks: list, source_doc: str, document_id: str, start_index: int = 0) -> int:
+    """
+    Save many (chunk, vector) pairs at once, where each chunk is a dict
+    from the chunker (text plus page and character provenance).
+    D1 gets multi-row INSERTs; the local store gets one block append
+    (document_id is then a local_document_id()). start_index is the
+    chunk_index of the first pair.
     
-    return all_chunks
+    Returns:
+        Number of chunks saved
+    """
+    if not chunks:
+        return 0
+    if not is_local_document(document_id):
+        saved = await d1_save_chunks(chunks, source_doc, document_id=document_id, start_index=start_index)
+        # Make the new chunks searchable right away
+        await replica.sync()
+        return saved
+
+    await local_store.add_many(
+        [vector for _, vector in chunks],
+        [
+            {
+                "text": chunk["text"],
+                "source": source_doc,
+                "document_id": document_id,
+                "chunk_index": start_index + i,
+                **{field: chunk.get(field) for field in PROVENANCE_FIELDS}
+            }
+            for i, (chunk, _) in enumerate(chunks)
+        ]
+    )
+    return len(chunks)
+
+
+async def get_search_indexes() -> list:
+    """
+    Return the vector indexes to search: the local store's index plus
+    the local replica of D1 chunks. The local store picks up other
+    workers' writes in the background (see LocalStore.start).
+    """
+    await replica.ensure_fresh()
+    return [DB_MEMORY["chunks"], replica.index]
+
+
+async def get_scope_version(document_ids: list = None) -> tuple:
+    """
+    Version stamp of the chunks a search over document_ids (None for
+    everything) would see. It changes whenever any of those documents
+    gains, loses or moves chunks, in memory or in the replica.
+    """
+    return tuple(index.snapshot(document_ids) for index in await get_search_indexes())
+
 
+async def get_user_document_ids(user_id: str) -> list:
+    """
+    IDs of the documents owned by a user, cached for USER_DOCUMENTS_TTL seconds.
+    """
+    cached = _user_documents.get(user_id)
+    if cached and time.monotonic() - cached[0] < USER_DOCUMENTS_TTL:
+        return cached[1]
+    documents = await d1_get_user_documents(user_id)
+    _remember_chunk_owners(documents)
+    document_ids = [doc["id"] for doc in documents]
+    _user_documents[user_id] = (time.monotonic(), document_ids)
+    return document_ids
+
+
+def _remember_chunk_owners(documents: list):
+    now = time.monotonic()
+    for doc in documents:
+        _chunk_owners[doc["id"]] = (now, doc.get("source_document_id") or doc["id"])
+
+
+async def get_chunk_partitions(document_ids: list) -> list:
+    """
+    Map document IDs to the partitions holding their chunks, cached for
+    USER_DOCUMENTS_TTL seconds. A deduplicated upload maps to the
+    document it was linked to.
+    """
+    now = time.monotonic()
+    unknown = [
+        doc_id for doc_id in document_ids
+        if not is_local_document(doc_id)
+        and (doc_id not in _chunk_owners or now - _chunk_owners[doc_id][0] >= USER_DOCUMENTS_TTL)
+    ]
+    if unknown:
+        _remember_chunk_owners(await d1_get_documents(unknown))
+    partitions = []
+    for doc_id in document_ids:
+        owner = _chunk_owners[doc_id][1] if doc_id in _chunk_owners else doc_id
+        if owner not in partitions:
+            partitions.append(owner)
+    return partitions
+
+
+def find_local_document(content_hash: str):
+    """Local upload with the given content hash, or None."""
+    return DB_MEMORY["documents"].get(content_hash)
 
-def get_all_chunks_sync():
+
+def register_local_document(content_hash: str, document_id: str, filename: str, file_size: int, chunks_count: int):
+    local_store.register_document(content_hash, {
+        "document_id": document_id,
+        "filename": filename,
+        "file_size": file_size,
+        "chunks_count": chunks_count
+    })
+
+
+def record_dedup(file_size: int, chunks_count: int):
+    """Count an upload that reused existing chunks instead of ingesting."""
+    DEDUP_STATS["uploads"] += 1
+    DEDUP_STATS["bytes_saved"] += file_size or 0
+    DEDUP_STATS["embeddings_saved"] += chunks_count or 0
+
+
+async def discard_chunks_from(document_id: str, start_index: int):
     """
-    Synchronous version - returns only in-memory chunks.
-    Used for backward compatibility.
+    Delete a document's chunks at or after start_index from D1 and the
+    local replica, so an interrupted batch can be written again.
     """
-    return DB_MEMORY["chunks"]
\ No newline at end of file
+    await d1_delete_chunks_from(document_id, start_index)
+    replica.invalidate_chunks(document_id, start_index)
+
+
+async def delete_document(document_id: str):
+    """
+    Delete a document and its chunks from D1 and the local replica.
+    If deduplicated uploads still use its chunks, the chunks are handed
+    to the oldest of them instead of being deleted. A local upload is
+    removed from the local store instead.
+    """
+    if is_local_document(document_id):
+        await local_store.remove_document(document_id)
+        return
+    links = await d1_get_linked_documents(document_id)
+    if links:
+        heir = links[0]["id"]
+        await d1_reassign_chunks(document_id, heir)
+        replica.rename_document(document_id, heir)
+    else:
+        await d1_delete_chunks_by_document(document_id)
+        replica.invalidate_document(document_id)
+    await d1_delete_document(document_id)
+    _user_documents.clear()
+    _chunk_owners.clear()
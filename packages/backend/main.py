@@ -1,14 +1,45 @@
+import asyncio
 import sys
 import os
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from backend.routes import upload, chat
+from backend.services import d1
+from backend.data.local_store import local_store
+from backend.data.replica import replica
+from backend.services.jobs import job_queue
+from backend.services.pdf import shutdown_pool
+from backend.services.llm import CHAT_MODEL
+from backend.services.embedding import EMBEDDING_MODEL
+from backend.utils import tokens
+from backend.utils.telemetry import registry, configure_logging, TelemetryMiddleware
+from backend.config import LOG_LEVEL, TRACE_LOG_ENABLED, TRACE_LOG_PATH
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 
-app = FastAPI()
+configure_logging(LOG_LEVEL, TRACE_LOG_ENABLED, TRACE_LOG_PATH)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # May download encodings on first run; counts are estimated without them
+    await asyncio.to_thread(tokens.load, CHAT_MODEL, EMBEDDING_MODEL)
+    await d1.open_client()
+    local_store.load()
+    local_store.start()
+    replica.start()
+    await job_queue.start()
+    yield
+    await job_queue.stop()
+    shutdown_pool()
+    await replica.stop()
+    await local_store.stop()
+    await d1.close_client()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -16,7 +47,9 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Trace-Id"],
 )
+app.add_middleware(TelemetryMiddleware)
 
 app.include_router(upload.router, prefix="/api/v1")
 app.include_router(chat.router, prefix="/api/v1")
@@ -28,6 +61,11 @@ app.mount("/uploads", StaticFiles(directory="data/uploads"), name="uploads")
 def home():
     return {"message": "PDFHelper API is running"}
 
+@app.get("/metrics")
+def metrics():
+    """Counters and latency histograms in the Prometheus text format."""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -1,33 +1,197 @@
-from fastapi import APIRouter, HTTPException
+import json
+import logging
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from backend.services.embedding import get_embedding
-from backend.services.search import search_similar_chunks
-from backend.services.llm import generate_answer
+from typing import Optional
+from backend.services.embedding import get_embedding_async, get_cache_stats
+from backend.services.search import search_similar_chunks, resolve_scope, looks_like_identifier
+from backend.services.llm import generate_answer_async, generate_answer_stream
+from backend.services.context import build_context
+from backend.services.answer_cache import answer_cache
+from backend.data.replica import replica
+from backend.data.storage import get_scope_version
+from backend.config import ANSWER_CACHE_ENABLED, HYBRID_SEARCH_ENABLED, LEXICAL_FAST_PATH, CONTEXT_CANDIDATES
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+NO_DOCUMENTS_ANSWER = "I don't have any documents loaded yet. Please upload a PDF first."
+
 class ChatRequest(BaseModel):
     question: str
+    document_ids: Optional[list[str]] = None
+    user_id: Optional[str] = None
+
+def _format_sources(chunks: list) -> list:
+  return [c['text'][:100] + "..." for c in chunks]
+
+def _format_citations(chunks: list) -> list:
+  """
+  Where each source chunk came from: document, pages and character range.
+  Page fields are None for chunks stored before provenance was recorded.
+  """
+  return [
+    {
+      "source": c.get("source"),
+      "document_id": c.get("document_id"),
+      "chunk_index": c.get("chunk_index"),
+      "page_start": c.get("page_start"),
+      "page_end": c.get("page_end"),
+      "char_start": c.get("char_start"),
+      "char_end": c.get("char_end"),
+      "score": c.get("score"),
+      "vector_score": c.get("vector_score"),
+      "lexical_score": c.get("lexical_score")
+    }
+    for c in chunks
+  ]
+
+async def _prepare(request: ChatRequest) -> dict:
+  """
+  Resolve the scope, embed the question and check the answer cache.
+  On a miss, also find the most relevant chunks in scope and build the
+  context passages from them (merged, diversified, token-budgeted).
+  Identifier-like questions (part numbers, error codes) try a lexical
+  search first and skip the embedding call when it finds matches.
+  """
+  scope = await resolve_scope(request.document_ids, request.user_id)
+  if scope is not None:
+    scope = sorted(set(scope))
+  if HYBRID_SEARCH_ENABLED and LEXICAL_FAST_PATH and looks_like_identifier(request.question):
+    chunks = await search_similar_chunks(None, limit=CONTEXT_CANDIDATES, document_ids=scope, query_text=request.question)
+    if chunks:
+      return {"scope": scope, "query_vector": None, "version": None, "cached": None, "chunks": build_context(chunks)}
+
+  query_vector = await get_embedding_async(request.question)
+  if not query_vector:
+    raise HTTPException(status_code=500, detail="Failed to generate embedding")
+
+  context = {"scope": scope, "query_vector": query_vector, "version": None, "cached": None, "chunks": []}
+  if ANSWER_CACHE_ENABLED:
+    context["version"] = await get_scope_version(scope)
+    context["cached"] = answer_cache.get(scope, query_vector, context["version"])
+  if context["cached"]:
+    context["chunks"] = context["cached"]["chunks"]
+  else:
+    chunks = await search_similar_chunks(
+      query_vector, limit=CONTEXT_CANDIDATES, document_ids=scope, query_text=request.question, with_vectors=True
+    )
+    context["chunks"] = build_context(chunks)
+  return context
+
+def _remember(context: dict, answer: str):
+  """Cache a freshly generated answer for similar questions."""
+  if ANSWER_CACHE_ENABLED and context["query_vector"] and context["chunks"] and not answer.startswith("Error communicating with AI"):
+    answer_cache.put(context["scope"], context["query_vector"], context["version"], answer, context["chunks"])
 
 @router.post("/chat")
 async def chat_endpoint(request: ChatRequest):
   try:
     user_question = request.question
-    query_vector = get_embedding(user_question)
-    if not query_vector:
-      raise HTTPException(status_code=500, detail="Failed to generate embedding")
-    relevant_chunks = await search_similar_chunks(query_vector, limit=3)
+    context = await _prepare(request)
+    relevant_chunks = context["chunks"]
+    if context["cached"]:
+      return {
+        "answer": context["cached"]["answer"],
+        "sources": _format_sources(relevant_chunks),
+        "citations": _format_citations(relevant_chunks),
+        "cached": True
+      }
     if not relevant_chunks:
       return {
-        "answer": "I don't have any documents loaded yet. Please upload a PDF first.",
-        "sources": []
+        "answer": NO_DOCUMENTS_ANSWER,
+        "sources": [],
+        "citations": []
       }
       
-    ai_answer = generate_answer(user_question, relevant_chunks)
+    ai_answer = await generate_answer_async(user_question, relevant_chunks)
+    _remember(context, ai_answer)
     return {
       "answer": ai_answer,
-      "sources": [c['text'][:100] + "..." for c in relevant_chunks] 
+      "sources": _format_sources(relevant_chunks),
+      "citations": _format_citations(relevant_chunks),
+      "cached": False
     }
   except Exception as e:
-    print(f"Error: {e}")
-    raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+    logger.exception("Chat request failed: %s", e)
+    raise HTTPException(status_code=500, detail=str(e))
+
+def _sse(event: str, data) -> str:
+  return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@router.post("/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest, http_request: Request):
+  """
+  Streaming chat over Server-Sent Events.
+  Sends `sources` and `citations` events first, then one `token` event per
+  piece of the answer, then `done`. Generation stops if the client disconnects.
+  A cached answer is sent as a single token.
+  """
+  try:
+    context = await _prepare(request)
+    relevant_chunks = context["chunks"]
+  except HTTPException:
+    raise
+  except Exception as e:
+    logger.exception("Chat stream request failed: %s", e)
+    raise HTTPException(status_code=500, detail=str(e))
+
+  async def event_stream():
+    yield _sse("sources", _format_sources(relevant_chunks))
+    yield _sse("citations", _format_citations(relevant_chunks))
+    if context["cached"]:
+      yield _sse("token", {"text": context["cached"]["answer"]})
+      yield _sse("done", {"cached": True})
+      return
+    if not relevant_chunks:
+      yield _sse("token", {"text": NO_DOCUMENTS_ANSWER})
+      yield _sse("done", {})
+      return
+
+    tokens = generate_answer_stream(request.question, relevant_chunks)
+    pieces = []
+    try:
+      async for token in tokens:
+        if await http_request.is_disconnected():
+          break
+        pieces.append(token)
+        yield _sse("token", {"text": token})
+      else:
+        _remember(context, "".join(pieces))
+        yield _sse("done", {})
+    except Exception as e:
+      logger.error("Streaming error: %s", e)
+      yield _sse("error", {"detail": str(e)})
+    finally:
+      await tokens.aclose()
+
+  return StreamingResponse(
+    event_stream(),
+    media_type="text/event-stream",
+    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+  )
+
+@router.get("/cache/stats")
+async def cache_stats():
+  """
+  Embedding cache hit/miss counters.
+  """
+  return get_cache_stats()
+
+
+@router.get("/cache/answers/stats")
+async def answer_cache_stats():
+  """
+  Hit/miss counters of the semantic answer cache.
+  """
+  return answer_cache.stats()
+
+
+@router.get("/replica/status")
+async def replica_status():
+  """
+  Size and sync lag of the local D1 chunk replica.
+  """
+  return replica.stats()
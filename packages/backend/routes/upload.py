@@ -1,136 +1,330 @@
+import asyncio
+import hashlib
+import logging
 import shutil
 import os
 import tempfile
+import uuid
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
 from fastapi import APIRouter, UploadFile, File, HTTPException
-from backend.services.pdf import process_pdf
-from backend.services.embedding import get_embedding
-from backend.data.storage import add_chunk
-from backend.services.r2 import upload_to_r2, download_from_r2
-from backend.services.d1 import save_document, update_document_status, init_schema
+from backend.services.pipeline import ingest_pdf
+from backend.data.storage import (
+    local_document_id,
+    is_local_document,
+    find_local_document,
+    register_local_document,
+    record_dedup,
+    delete_document,
+    DEDUP_STATS
+)
+from backend.data.local_store import local_store
+from backend.services.r2 import upload_stream_to_r2_async, delete_from_r2_async
+from backend.services.d1 import (
+    save_document, init_schema, migrate_embeddings, find_documents_by_hash, get_dedup_stats, get_document
+)
+from backend.services.jobs import job_queue
+from backend.config import MAX_UPLOAD_MB, R2_PART_SIZE
 import httpx
 from fastapi.responses import StreamingResponse
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 UPLOAD_DIR = "data/uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-# 6MB limit for now, this will be fixed sometime later
-MAX_FILE_SIZE = 6 * 1024 * 1024 
+# Uploads are streamed, so memory per request stays bounded at any size
+MAX_FILE_SIZE = MAX_UPLOAD_MB * 1024 * 1024
 
 def check_file_size(file: UploadFile):
     """Checks if the uploaded file is within the size limit."""
     if file.size and file.size > MAX_FILE_SIZE:
         raise HTTPException(
             status_code=413, 
-            detail=f"File too large ({file.size / 1024 / 1024:.1f}MB). Max limit is 5MB."
+            detail=f"File too large ({file.size / 1024 / 1024:.1f}MB). Max limit is {MAX_UPLOAD_MB}MB."
         )
 
+def _save_upload(src, file_path: str) -> tuple:
+  """Copy an upload to disk, hashing it on the way. Returns (sha256, size)."""
+  digest = hashlib.sha256()
+  size = 0
+  with open(file_path, "wb") as out:
+    while data := src.read(1024 * 1024):
+      out.write(data)
+      digest.update(data)
+      size += len(data)
+  return digest.hexdigest(), size
+
+def _write_part(out, digest, data: bytes):
+  out.write(data)
+  digest.update(data)
+
+async def _spool_upload(file: UploadFile, out, digest) -> AsyncIterator[bytes]:
+  """
+  Read an upload in R2-part-sized blocks, copying each block to `out` and
+  hashing it on the way through. Raises 413 as soon as the running size
+  passes MAX_FILE_SIZE, even if the client lied about Content-Length.
+  """
+  size = 0
+  while True:
+    data = await file.read(R2_PART_SIZE)
+    if not data:
+      return
+    size += len(data)
+    if size > MAX_FILE_SIZE:
+      raise HTTPException(
+          status_code=413,
+          detail=f"File content exceeds the {MAX_UPLOAD_MB}MB limit."
+      )
+    await asyncio.to_thread(_write_part, out, digest, data)
+    yield data
+
+# content hash -> [lock, users]: concurrent uploads of the same bytes
+# take turns, so only the first ingests them and the rest reuse its chunks
+_local_ingests = {}
+
+@asynccontextmanager
+async def _ingest_slot(content_hash: str):
+  entry = _local_ingests.setdefault(content_hash, [asyncio.Lock(), 0])
+  entry[1] += 1
+  try:
+    async with entry[0]:
+      yield
+  finally:
+    entry[1] -= 1
+    if not entry[1]:
+      del _local_ingests[content_hash]
+
 @router.post("/upload")
 async def upload_document(file: UploadFile = File(...)):
   """
-  1. Save file locally
-  2. Extract Text & Chunk
-  3. Embed & Store in Memory
+  1. Save file locally, under its content hash
+  2. Stream Text -> Chunks -> Embeddings -> Memory
+
+  The filename is only kept as metadata, so two different PDFs with the
+  same name get separate files and documents.
   """
   check_file_size(file)
+  tmp_path = f"{UPLOAD_DIR}/tmp_{uuid.uuid4()}.pdf"
   try:
-    file_path = f"{UPLOAD_DIR}/{file.filename}"
-    with open(file_path, "wb") as buffer:
-      shutil.copyfileobj(file.file, buffer) 
-    print(f"Saved file to {file_path}")
-
-    text_chunks = process_pdf(file_path)
-    if not text_chunks:
-      raise HTTPException(status_code=400, detail="Could not extract text from PDF.")
-    
-    print(f"Generating embeddings for {len(text_chunks)} chunks...")
-    count = 0
-    for chunk_text in text_chunks:
-        vector = get_embedding(chunk_text)
-        if vector:
-            await add_chunk(chunk_text, vector, file.filename)
-            count += 1
-            
+    content_hash, file_size = await asyncio.to_thread(_save_upload, file.file, tmp_path)
+
+    async with _ingest_slot(content_hash):
+      existing = find_local_document(content_hash)
+      if existing:
+        logger.info("%s matches %s, reusing its chunks", file.filename, existing["filename"])
+        record_dedup(file_size, existing["chunks_count"])
+        os.remove(tmp_path)
+        return {
+            "status": "success",
+            "filename": file.filename,
+            "document_id": existing["document_id"],
+            "chunks_processed": 0,
+            "chunks_reused": existing["chunks_count"],
+            "chunks_failed": [],
+            "deduplicated": True,
+            "message": "Document ready for chatting!"
+        }
+
+      file_path = f"{UPLOAD_DIR}/{content_hash}.pdf"
+      os.replace(tmp_path, file_path)
+      logger.info("Saved %s to %s", file.filename, file_path)
+
+      document_id = local_document_id(content_hash)
+      stats = await ingest_pdf(file_path, file.filename, document_id)
+      if stats["chunks_seen"] == 0:
+        os.remove(file_path)
+        raise HTTPException(status_code=400, detail="Could not extract text from PDF.")
+      logger.info("Stored %d of %d chunks", stats["chunks_stored"], stats["chunks_seen"])
+      register_local_document(content_hash, document_id, file.filename, file_size, stats["chunks_stored"])
+
     return {
         "status": "success",
         "filename": file.filename,
-        "chunks_processed": count,
+        "document_id": document_id,
+        "chunks_processed": stats["chunks_stored"],
+        "chunks_failed": stats["failed_chunks"],
+        "deduplicated": False,
         "message": "Document ready for chatting!"
     }
+  except HTTPException:
+    if os.path.exists(tmp_path):
+      os.remove(tmp_path)
+    raise
   except Exception as e:
-    print(f"Error while uploading document: {e}")
+    logger.exception("Error while uploading document: %s", e)
+    if os.path.exists(tmp_path):
+      os.remove(tmp_path)
     raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.post("/upload/cloud")
+async def _link_duplicate(content_hash: str, original_filename: str, r2_result: dict, user_id: str = None):
+  """
+  If these bytes were already processed, answer from the existing chunks:
+  the user's own copy if they have one, otherwise a new document linked
+  to the original's chunks. The object just streamed to R2 is dropped.
+  Returns the upload response, or None if the content is new.
+  """
+  existing = await find_documents_by_hash(content_hash)
+  if not existing:
+    return None
+
+  # The hash is only known once the upload has streamed through
+  try:
+    await delete_from_r2_async(r2_result['r2_key'])
+  except Exception as e:
+    logger.warning("Could not delete duplicate upload %s: %s", r2_result["r2_key"], e)
+
+  doc_record = next((doc for doc in existing if doc.get('user_id') == user_id), None)
+  if doc_record is None:
+    original = existing[0]
+    logger.info("%s matches document %s, linking to its chunks", original_filename, original["id"])
+    doc_record = await save_document(
+        filename=original['filename'],
+        original_name=original_filename,
+        r2_key=original['r2_key'],
+        r2_url=original['r2_url'],
+        file_size=r2_result['file_size'],
+        user_id=user_id,
+        content_hash=content_hash,
+        source_document_id=original.get('source_document_id') or original['id'],
+        status="processed",
+        chunks_count=original.get('chunks_count') or 0
+    )
+  record_dedup(r2_result['file_size'], doc_record.get('chunks_count'))
+  return {
+      "status": "processed",
+      "id": doc_record['id'],
+      "job_id": None,
+      "url": doc_record['r2_url'],
+      "sha256": content_hash,
+      "deduplicated": True,
+      "chunks_reused": doc_record.get('chunks_count') or 0
+  }
+
+
+@router.post("/upload/cloud", status_code=202)
 async def upload_to_cloud(file: UploadFile = File(...), user_id: str = None):
   """
-  Upload PDF to R2, save metadata to D1, and extract/embed text.
+  Upload PDF to R2 and save metadata to D1, then queue a background job
+  to extract/embed text. Poll /jobs/{job_id} for progress.
   """
   check_file_size(file)
+  # Local copy for the ingestion job, written while the upload streams to R2
+  tmp_path = f"{UPLOAD_DIR}/tmp_{uuid.uuid4()}.pdf"
   try:
-    file_content = await file.read()
-    
-    if len(file_content) > MAX_FILE_SIZE:
-        raise HTTPException(
-            status_code=413, 
-            detail="File content exceeds the 15MB limit."
-        )
-        
     original_filename = file.filename
+    digest = hashlib.sha256()
     
-    print(f"Uploading {original_filename} to R2...")
-    r2_result = upload_to_r2(file_content, original_filename, file.content_type or "application/pdf")
+    logger.info("Uploading %s to R2", original_filename)
+    with open(tmp_path, "wb") as out:
+      r2_result = await upload_stream_to_r2_async(
+          _spool_upload(file, out, digest),
+          original_filename,
+          file.content_type or "application/pdf"
+      )
     
-    print(f"Saving metadata to D1...")
+    content_hash = digest.hexdigest()
+    duplicate = await _link_duplicate(content_hash, original_filename, r2_result, user_id)
+    if duplicate:
+      os.remove(tmp_path)
+      return duplicate
+
+    logger.debug("Saving metadata of %s to D1", original_filename)
     doc_record = await save_document(
         filename=r2_result['r2_key'].split('/')[-1],
         original_name=original_filename,
         r2_key=r2_result['r2_key'],
         r2_url=r2_result['r2_url'],
         file_size=r2_result['file_size'],
-        user_id=user_id
+        user_id=user_id,
+        content_hash=content_hash
     )
 
-    tmp_path = f"data/uploads/tmp_{doc_record['id']}.pdf"
-    with open(tmp_path, "wb") as f:
-        f.write(file_content)
-    
-    text_chunks = process_pdf(tmp_path)
-    os.remove(tmp_path)
-
-    if not text_chunks:
-        await update_document_status(doc_record['id'], 'error')
-        raise HTTPException(status_code=400, detail="Could not extract text from PDF (Empty or Scanned).")
-    
-    print(f"Embedding {len(text_chunks)} chunks...")
-    count = 0
-    total = len(text_chunks)
-    for i, chunk_text in enumerate(text_chunks):
-        # Log embedding progress every 50 chunks
-        if (i + 1) % 50 == 0 or (i + 1) == total:
-            print(f"Embedding progress: {i + 1}/{total} chunks...")
-            
-        vector = get_embedding(chunk_text)
-        if vector:
-            await add_chunk(chunk_text, vector, original_filename, document_id=doc_record['id'])
-            count += 1
-    
-    await update_document_status(doc_record['id'], 'processed', count)
+    job = await job_queue.submit(
+        document_id=doc_record['id'],
+        filename=original_filename,
+        r2_key=r2_result['r2_key'],
+        file_path=tmp_path
+    )
     
     return {
-        "status": "success",
+        "status": "accepted",
         "id": doc_record['id'],
+        "job_id": job['id'],
         "url": r2_result['r2_url'],
-        "chunks_processed": count
+        "sha256": content_hash,
+        "deduplicated": False
     }
     
+  except HTTPException:
+    if os.path.exists(tmp_path):
+      os.remove(tmp_path)
+    raise
   except Exception as e:
-    print(f"Cloud Upload Error: {str(e)}")
+    logger.exception("Cloud upload error: %s", e)
+    if os.path.exists(tmp_path):
+      os.remove(tmp_path)
     raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.delete("/documents/{document_id}")
+async def delete_uploaded_document(document_id: str):
+  """
+  Delete a document and its chunks. The PDF goes too (R2 object or local
+  file), unless a deduplicated upload still points at the same bytes;
+  chunks still used by such an upload are handed over to it.
+  """
+  if is_local_document(document_id):
+    content_hash = document_id[len(local_document_id("")):]
+    if find_local_document(content_hash) is None and document_id not in local_store.index.partition_names():
+      raise HTTPException(status_code=404, detail="Document not found")
+    await delete_document(document_id)
+    file_path = f"{UPLOAD_DIR}/{content_hash}.pdf"
+    if os.path.exists(file_path):
+      os.remove(file_path)
+    return {"status": "deleted", "id": document_id}
+
+  doc = await get_document(document_id)
+  if doc is None:
+    raise HTTPException(status_code=404, detail="Document not found")
+  await delete_document(document_id)
+  remaining = await find_documents_by_hash(doc["content_hash"]) if doc.get("content_hash") else []
+  if doc.get("r2_key") and not any(other.get("r2_key") == doc["r2_key"] for other in remaining):
+    try:
+      await delete_from_r2_async(doc["r2_key"])
+    except Exception as e:
+      logger.warning("Could not delete %s from R2: %s", doc["r2_key"], e)
+  return {"status": "deleted", "id": document_id}
+
+
+@router.get("/dedup/stats")
+async def dedup_stats():
+  """
+  Uploads answered from existing chunks, and the bytes and embeddings
+  that were not processed again: since this process started, and in
+  total for cloud documents.
+  """
+  try:
+    cloud = await get_dedup_stats()
+  except Exception as e:
+    logger.error("Error reading dedup stats: %s", e)
+    cloud = None
+  return {"process": DEDUP_STATS, "cloud": cloud}
+
+
+@router.get("/jobs/{job_id}")
+async def get_job_status(job_id: str):
+  """
+  Progress of a background ingestion job.
+  """
+  job = job_queue.get(job_id)
+  if job is None:
+    raise HTTPException(status_code=404, detail="Job not found")
+  return job
+
+
 @router.post("/init-db")
 async def initialize_database():
   """
@@ -141,7 +335,21 @@ async def initialize_database():
     await init_schema()
     return {"status": "success", "message": "Database schema initialized"}
   except Exception as e:
-    print(f"Error initializing database: {e}")
+    logger.error("Error initializing database: %s", e)
+    raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/migrate-embeddings")
+async def migrate_embedding_storage():
+  """
+  Convert stored embeddings to the compact binary encoding.
+  Safe to call repeatedly; rows already converted are skipped.
+  """
+  try:
+    converted = await migrate_embeddings()
+    return {"status": "success", "converted": converted}
+  except Exception as e:
+    logger.error("Error migrating embeddings: %s", e)
     raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -160,7 +368,7 @@ async def proxy_pdf(url: str):
                     async for chunk in response.aiter_bytes():
                         yield chunk
             except Exception as e:
-                print(f"Proxy error: {e}")
+                logger.error("Proxy error: %s", e)
                 raise HTTPException(status_code=500, detail=str(e))
 
     return StreamingResponse(stream_file(), media_type="application/pdf")
\ No newline at end of file
@@ -0,0 +1,134 @@
+"""
+Semantic cache for chat answers.
+Answers are keyed on the document scope and the question embedding; a
+new question reuses a stored answer when it was asked over the same
+documents and its embedding is close enough to the stored question's.
+Entries carry the version stamp of their documents, so any change to
+those documents invalidates them.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+import numpy as np
+from backend.config import ANSWER_CACHE_THRESHOLD, ANSWER_CACHE_TTL, ANSWER_CACHE_MAX_ITEMS
+from backend.data.index import normalize
+from backend.utils.telemetry import registry
+
+
+def scope_key(document_ids: Optional[list]):
+    """Order-independent key for a search scope; None means everything."""
+    if document_ids is None:
+        return None
+    return tuple(sorted(set(document_ids)))
+
+
+class AnswerCache:
+    """
+    LRU + TTL cache of answers, searched by cosine similarity within a scope.
+    """
+
+    def __init__(self, threshold: float = ANSWER_CACHE_THRESHOLD, ttl: float = ANSWER_CACHE_TTL, max_items: int = ANSWER_CACHE_MAX_ITEMS):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_items = max_items
+        # entry id -> entry dict, least recently used first
+        self._entries = OrderedDict()
+        # scope key -> entry ids
+        self._scopes = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._stale = 0
+        self._evictions = 0
+
+    def _drop(self, entry_id: int):
+        entry = self._entries.pop(entry_id)
+        ids = self._scopes[entry["scope"]]
+        ids.remove(entry_id)
+        if not ids:
+            del self._scopes[entry["scope"]]
+
+    def get(self, document_ids: Optional[list], query_vector, version) -> Optional[dict]:
+        """
+        Find the stored answer for the closest earlier question in the
+        same scope.
+
+        Args:
+            document_ids: Search scope (None for everything)
+            query_vector: Question embedding
+            version: Current version stamp of the scope's documents
+
+        Returns:
+            dict with answer, chunks and similarity, or None on a miss
+        """
+        scope = scope_key(document_ids)
+        query = normalize(query_vector)
+        now = time.monotonic()
+        with self._lock:
+            ids = list(self._scopes.get(scope, ()))
+            live = []
+            for entry_id in ids:
+                entry = self._entries[entry_id]
+                if entry["version"] != version or now - entry["created_at"] > self.ttl:
+                    self._drop(entry_id)
+                    self._stale += 1
+                else:
+                    live.append(entry_id)
+            if live:
+                scores = np.stack([self._entries[entry_id]["vector"] for entry_id in live]) @ query
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    entry_id = live[best]
+                    self._entries.move_to_end(entry_id)
+                    self._hits += 1
+                    entry = self._entries[entry_id]
+                    return {"answer": entry["answer"], "chunks": entry["chunks"], "similarity": float(scores[best])}
+            self._misses += 1
+            return None
+
+    def put(self, document_ids: Optional[list], query_vector, version, answer: str, chunks: list):
+        """
+        Store an answer and the chunks it was generated from.
+        """
+        scope = scope_key(document_ids)
+        entry = {
+            "scope": scope,
+            "vector": normalize(query_vector),
+            "version": version,
+            "answer": answer,
+            "chunks": [dict(chunk) for chunk in chunks],
+            "created_at": time.monotonic()
+        }
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = entry
+            self._scopes.setdefault(scope, []).append(entry_id)
+            while len(self._entries) > self.max_items:
+                self._drop(next(iter(self._entries)))
+                self._evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._scopes.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "items": len(self._entries),
+                "scopes": len(self._scopes),
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+                "stale": self._stale,
+                "evictions": self._evictions,
+                "threshold": self.threshold
+            }
+
+
+answer_cache = AnswerCache()
+registry.gauge("answer_cache_hit_rate", "Share of chat questions answered from the cache", lambda: answer_cache.stats()["hit_rate"])
@@ -0,0 +1,221 @@
+"""
+Context assembly for answer generation.
+
+Retrieved chunks overlap: neighbouring chunks of a document share text
+(CHUNK_OVERLAP_TOKENS), so sending them verbatim pays for it twice. The
+builder merges overlapping or adjacent chunks of a document into one
+passage, orders passages by maximal marginal relevance (MMR) over their
+embeddings so near-duplicates don't crowd out other evidence, and packs
+them into a token budget counted with the chat model's tokenizer.
+"""
+import time
+from typing import Optional
+import numpy as np
+
+from backend.config import CONTEXT_MAX_TOKENS, CONTEXT_MMR_LAMBDA
+from backend.services.llm import CHAT_MODEL, CONTEXT_SEPARATOR
+from backend.utils import tokens as tokenizer
+from backend.utils.telemetry import registry, emit_span
+
+CONTEXT_TOKENS = registry.histogram(
+    "context_tokens", "Tokens of retrieved context sent with a question",
+    buckets=(64, 128, 256, 512, 1024, 2048, 4096, 8192)
+)
+
+# A passage cut to fit the budget must keep at least this many tokens
+MIN_PASSAGE_TOKENS = 64
+
+
+def count_tokens(text: str) -> int:
+    """Tokens of text for the chat model."""
+    return tokenizer.count_tokens(text, CHAT_MODEL)
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """The longest prefix of text within max_tokens of the chat model."""
+    return tokenizer.truncate_tokens(text, max_tokens, CHAT_MODEL)
+
+
+def _text_overlap(first: str, second: str) -> int:
+    """
+    Length of the longest suffix of `first` that starts `second`, for
+    chunks stored without character offsets.
+    """
+    probe = second[:32]
+    if not probe:
+        return 0
+    pos = first.find(probe, max(0, len(first) - 2000))
+    while pos != -1:
+        if second.startswith(first[pos:]):
+            return len(first) - pos
+        pos = first.find(probe, pos + 1)
+    return 0
+
+
+def _joinable(passage: dict, chunk: dict) -> bool:
+    """Whether chunk overlaps or directly follows the passage in its document."""
+    if passage["char_end"] is not None and chunk.get("char_start") is not None:
+        if chunk["char_start"] <= passage["char_end"]:
+            return True
+    last = passage["chunk_indexes"][-1]
+    return last is not None and chunk.get("chunk_index") == last + 1
+
+
+def _extend(passage: dict, chunk: dict):
+    """Append a chunk's text to a passage, skipping the text they share."""
+    text = chunk["text"]
+    if passage["char_end"] is not None and chunk.get("char_start") is not None:
+        shared = passage["char_end"] - chunk["char_start"]
+        if shared >= 0:
+            passage["text"] += text[shared:]
+        else:
+            passage["text"] += "\n" + text
+    else:
+        shared = _text_overlap(passage["text"], text)
+        passage["text"] += text[shared:] if shared else " " + text
+
+    for field, pick in (("page_start", min), ("page_end", max), ("char_start", min), ("char_end", max)):
+        values = [v for v in (passage.get(field), chunk.get(field)) if v is not None]
+        passage[field] = pick(values) if values else None
+    for field in ("score", "vector_score", "lexical_score"):
+        values = [v for v in (passage.get(field), chunk.get(field)) if v is not None]
+        passage[field] = max(values) if values else None
+    passage["chunk_indexes"].append(chunk.get("chunk_index"))
+    passage["vectors"].append(chunk.get("vector"))
+
+
+def merge_chunks(chunks: list) -> list:
+    """
+    Merge chunks of the same document that overlap or are consecutive
+    into passages, in document order.
+
+    Returns:
+        Passage dicts with the chunk fields (text, source, document_id,
+        pages and character range spanning the merged chunks, best
+        scores), plus chunk_indexes and vectors of the merged chunks
+    """
+    groups = {}
+    for chunk in chunks:
+        groups.setdefault(chunk.get("document_id") or chunk.get("source"), []).append(chunk)
+
+    passages = []
+    for group in groups.values():
+        group.sort(key=lambda c: (
+            c.get("char_start") is None, c.get("char_start") or 0, c.get("chunk_index") or 0
+        ))
+        current = None
+        for chunk in group:
+            if current is not None and _joinable(current, chunk):
+                _extend(current, chunk)
+                continue
+            current = {key: value for key, value in chunk.items() if key != "vector"}
+            current.setdefault("char_start", None)
+            current.setdefault("char_end", None)
+            current["chunk_indexes"] = [chunk.get("chunk_index")]
+            current["vectors"] = [chunk.get("vector")]
+            passages.append(current)
+    return passages
+
+
+def _passage_vectors(passages: list) -> Optional[np.ndarray]:
+    """
+    Unit-length mean of each passage's chunk vectors; zero rows for
+    passages without any. None if no passage has one.
+    """
+    dims = {len(v) for p in passages for v in p["vectors"] if v is not None}
+    if len(dims) != 1:
+        return None
+    matrix = np.zeros((len(passages), dims.pop()), dtype=np.float32)
+    for row, passage in enumerate(passages):
+        vectors = [v for v in passage["vectors"] if v is not None]
+        if vectors:
+            mean = np.mean(np.asarray(vectors, dtype=np.float32), axis=0)
+            norm = np.linalg.norm(mean)
+            matrix[row] = mean / norm if norm > 0 else mean
+    return matrix
+
+
+def mmr_order(passages: list, lambda_: float = CONTEXT_MMR_LAMBDA) -> list:
+    """
+    Order passages by maximal marginal relevance: each pick maximizes
+    lambda * relevance - (1 - lambda) * (highest cosine similarity to an
+    earlier pick). Relevance is the retrieval score scaled to the best
+    one; passages without vectors count as dissimilar to everything.
+    """
+    if len(passages) <= 1:
+        return list(passages)
+    scores = np.asarray([p.get("score") or 0.0 for p in passages], dtype=np.float32)
+    top = scores.max()
+    relevance = scores / top if top > 0 else scores
+    matrix = _passage_vectors(passages)
+    similarity = matrix @ matrix.T if matrix is not None else np.zeros((len(passages), len(passages)), dtype=np.float32)
+
+    order = []
+    redundancy = np.zeros(len(passages), dtype=np.float32)
+    remaining = list(range(len(passages)))
+    while remaining:
+        gains = lambda_ * relevance[remaining] - (1 - lambda_) * redundancy[remaining]
+        pick = remaining.pop(int(np.argmax(gains)))
+        order.append(passages[pick])
+        redundancy = np.maximum(redundancy, similarity[pick])
+    return order
+
+
+def pack(passages: list, max_tokens: int) -> list:
+    """
+    Take passages in order while they fit in max_tokens, counting the
+    separators between them. The first passage that doesn't fit is cut
+    to the remaining room if that leaves MIN_PASSAGE_TOKENS, and filling
+    stops there; otherwise smaller later passages still get a chance.
+    """
+    separator_tokens = count_tokens(CONTEXT_SEPARATOR)
+    packed = []
+    used = 0
+    for passage in passages:
+        overhead = separator_tokens if packed else 0
+        tokens = count_tokens(passage["text"])
+        if used + overhead + tokens <= max_tokens:
+            packed.append({**passage, "tokens": tokens})
+            used += overhead + tokens
+            continue
+        room = max_tokens - used - overhead
+        if room >= MIN_PASSAGE_TOKENS:
+            text = truncate_tokens(passage["text"], room)
+            packed.append({**passage, "text": text, "tokens": count_tokens(text), "truncated": True})
+            break
+
+    # Token counts of the parts can differ by a token or so from the
+    # joined text's; trim the last passage until the whole fits
+    while packed and count_tokens(CONTEXT_SEPARATOR.join(p["text"] for p in packed)) > max_tokens:
+        last = packed[-1]
+        excess = count_tokens(CONTEXT_SEPARATOR.join(p["text"] for p in packed)) - max_tokens
+        if last["tokens"] - excess < MIN_PASSAGE_TOKENS:
+            packed.pop()
+            continue
+        last["text"] = truncate_tokens(last["text"], last["tokens"] - excess)
+        last["tokens"] = count_tokens(last["text"])
+        last["truncated"] = True
+    return packed
+
+
+def build_context(chunks: list, max_tokens: int = CONTEXT_MAX_TOKENS) -> list:
+    """
+    Turn retrieved chunks (best first, optionally with their "vector")
+    into the passages to send to the model.
+
+    Args:
+        chunks: Search results
+        max_tokens: Budget for the joined passage texts
+
+    Returns:
+        Passages in the order to present them, without vectors, each with
+        its token count
+    """
+    started = time.perf_counter()
+    passages = pack(mmr_order(merge_chunks(chunks)), max_tokens)
+    for passage in passages:
+        passage.pop("vectors", None)
+    total = count_tokens(CONTEXT_SEPARATOR.join(p["text"] for p in passages)) if passages else 0
+    CONTEXT_TOKENS.observe(total)
+    emit_span("context.build", time.perf_counter() - started, chunks=len(chunks), passages=len(passages), tokens=total)
+    return passages
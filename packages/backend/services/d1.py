@@ -1,11 +1,40 @@
+import asyncio
+import logging
+import time
 import httpx
-from backend.config import CF_ACCOUNT_ID, CF_API_TOKEN, D1_DATABASE_ID
+import numpy as np
+from backend.config import (
+    CF_ACCOUNT_ID, CF_API_TOKEN, D1_DATABASE_ID, EMBEDDING_STORAGE_FORMAT, EMBEDDING_DIMENSIONS, STORAGE_BACKEND, SQLITE_PATH
+)
+from backend.services.sqlite_db import SQLiteBackend
+from backend.utils.embedding_codec import (
+    encode_embedding, encode_embedding_blob, decode_embedding, decode_embeddings, embedding_format
+)
+from backend.utils.telemetry import registry, emit_span
 from typing import Optional
 import uuid
 from datetime import datetime
 
+logger = logging.getLogger(__name__)
+
+D1_SECONDS = registry.histogram("d1_query_seconds", "Latency of D1 queries, retries included", ("status",))
+D1_RETRIES = registry.counter("d1_retries_total", "D1 requests retried after a transient failure")
+
 D1_API_BASE = f"https://api.cloudflare.com/client/v4/accounts/{CF_ACCOUNT_ID}/d1/database/{D1_DATABASE_ID}"
 
+# D1 caps bound parameters per query at 100; keep request bodies well
+# under the REST API payload limit.
+D1_MAX_PARAMS = 100
+D1_MAX_PAYLOAD_BYTES = 1024 * 1024
+D1_MAX_RETRIES = 3
+D1_BULK_CONCURRENCY = 4
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+# Where each chunk came from: 1-based page range and [start, end)
+# character offsets in the extracted document text
+PROVENANCE_FIELDS = ("page_start", "page_end", "char_start", "char_end")
+CHUNK_COLUMNS = "rowid AS rowid, id, document_id, text, embedding, chunk_index, source_doc, page_start, page_end, char_start, char_end"
+
 def _get_headers():
     """Get headers for D1 API requests."""
     return {
@@ -13,30 +42,179 @@ def _get_headers():
         "Content-Type": "application/json"
     }
 
+def _create_client() -> httpx.AsyncClient:
+    """
+    Build a keep-alive client. Uses HTTP/2 when the h2 package is installed.
+    """
+    limits = httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=60.0)
+    try:
+        return httpx.AsyncClient(http2=True, limits=limits, headers=_get_headers(), timeout=30.0)
+    except ImportError:
+        return httpx.AsyncClient(limits=limits, headers=_get_headers(), timeout=30.0)
+
+def _chunk_batches(rows: list, columns: int) -> list:
+    """
+    Split rows into groups that fit in one multi-row INSERT under the
+    D1 parameter and payload limits.
+    """
+    max_rows = max(1, D1_MAX_PARAMS // columns)
+    batches = []
+    current = []
+    current_bytes = 0
+    for row in rows:
+        row_bytes = sum(len(str(value)) for value in row) + 16 * columns
+        if current and (len(current) >= max_rows or current_bytes + row_bytes > D1_MAX_PAYLOAD_BYTES):
+            batches.append(current)
+            current = []
+            current_bytes = 0
+        current.append(row)
+        current_bytes += row_bytes
+    if current:
+        batches.append(current)
+    return batches
+
+class D1Backend:
+    """
+    Cloudflare D1 over its REST API, through one long-lived pooled client
+    opened and closed by the app lifespan.
+
+    Storage backends (this one and sqlite_db.SQLiteBackend) share one
+    interface: open(), close(), execute(sql, params) returning the D1
+    response shape, insert_rows(table, columns, rows), and
+    binary_embeddings, telling whether embeddings are stored as BLOBs.
+    """
+
+    name = "d1"
+    binary_embeddings = False
+
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """Return the shared client, creating it lazily outside the app lifespan."""
+        if self._client is None:
+            self._client = _create_client()
+        return self._client
+
+    async def open(self):
+        """Open the shared D1 client."""
+        self._get_client()
+
+    async def close(self):
+        """Close the shared D1 client."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def execute(self, sql: str, params: list = None) -> dict:
+        """
+        Execute a SQL query on D1.
+        Retries transient failures (network errors, 429 and 5xx) with backoff.
+
+        Args:
+            sql: SQL query string
+            params: Optional list of parameters for prepared statements
+
+        Returns:
+            API response dict
+        """
+        payload = {"sql": sql}
+        if params:
+            payload["params"] = params
+
+        client = self._get_client()
+        started = time.perf_counter()
+        status = "error"
+        try:
+            for attempt in range(D1_MAX_RETRIES + 1):
+                try:
+                    response = await client.post(f"{D1_API_BASE}/query", json=payload)
+                    if response.status_code in RETRYABLE_STATUS and attempt < D1_MAX_RETRIES:
+                        D1_RETRIES.inc()
+                        await asyncio.sleep(0.5 * 2 ** attempt)
+                        continue
+                    response.raise_for_status()
+                    status = "ok"
+                    return response.json()
+                except httpx.TransportError:
+                    if attempt >= D1_MAX_RETRIES:
+                        raise
+                    D1_RETRIES.inc()
+                    await asyncio.sleep(0.5 * 2 ** attempt)
+        finally:
+            duration = time.perf_counter() - started
+            D1_SECONDS.observe(duration, status=status)
+            emit_span("d1.query", duration, status=status, statement=sql.split(None, 1)[0].upper() if sql.strip() else "")
+
+    async def insert_rows(self, table: str, columns: tuple, rows: list) -> int:
+        """
+        Insert many rows with multi-row INSERTs sized to the D1 limits,
+        a few requests in flight at once.
+
+        Returns:
+            Number of rows written
+        """
+        semaphore = asyncio.Semaphore(D1_BULK_CONCURRENCY)
+
+        async def insert(batch: list):
+            placeholders = ", ".join(["(" + ", ".join("?" * len(columns)) + ")"] * len(batch))
+            sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES {placeholders};"
+            params = [value for row in batch for value in row]
+            async with semaphore:
+                # Through the module function, which is what tests and benchmarks replace
+                await execute_sql(sql, params)
+
+        await asyncio.gather(*(insert(batch) for batch in _chunk_batches(rows, len(columns))))
+        return len(rows)
+
+def _create_backend():
+    if STORAGE_BACKEND == "sqlite":
+        return SQLiteBackend(SQLITE_PATH)
+    if STORAGE_BACKEND != "d1":
+        raise ValueError(f"Unknown STORAGE_BACKEND: {STORAGE_BACKEND}")
+    return D1Backend()
+
+# Selected by STORAGE_BACKEND; every query below goes through it
+backend = _create_backend()
+
+async def open_client():
+    """Open the storage backend. Called on app startup."""
+    await backend.open()
+
+async def close_client():
+    """Close the storage backend. Called on app shutdown."""
+    await backend.close()
+
 async def execute_sql(sql: str, params: list = None) -> dict:
     """
-    Execute a SQL query on D1.
+    Execute a SQL query on the configured storage backend.
     
     Args:
         sql: SQL query string
         params: Optional list of parameters for prepared statements
         
     Returns:
-        API response dict
+        Response dict in the D1 REST API shape
     """
-    async with httpx.AsyncClient() as client:
-        payload = {"sql": sql}
-        if params:
-            payload["params"] = params
-            
-        response = await client.post(
-            f"{D1_API_BASE}/query",
-            headers=_get_headers(),
-            json=payload,
-            timeout=30.0
-        )
-        response.raise_for_status()
-        return response.json()
+    return await backend.execute(sql, params)
+
+def _encode(embedding, fmt: str = EMBEDDING_STORAGE_FORMAT):
+    """Encode an embedding for the backend's column: BLOB bytes or text."""
+    if backend.binary_embeddings:
+        return encode_embedding_blob(embedding, fmt)
+    return encode_embedding(embedding, fmt)
+
+def _rows(result: dict) -> list:
+    if result.get("result") and result["result"][0].get("results"):
+        return result["result"][0]["results"]
+    return []
+
+async def _add_missing_columns(table: str, columns: dict):
+    """Add columns (name -> SQL type) that an older table is missing."""
+    existing = {row["name"] for row in _rows(await execute_sql(f"PRAGMA table_info({table});"))}
+    for name, sql_type in columns.items():
+        if name not in existing:
+            await execute_sql(f"ALTER TABLE {table} ADD COLUMN {name} {sql_type};")
 
 async def init_schema():
     """
@@ -55,6 +233,8 @@ async def init_schema():
         user_id TEXT,
         chunks_count INTEGER DEFAULT 0,
         status TEXT DEFAULT 'pending',
+        content_hash TEXT,
+        source_document_id TEXT,
         created_at TEXT DEFAULT CURRENT_TIMESTAMP,
         updated_at TEXT DEFAULT CURRENT_TIMESTAMP
     );
@@ -69,17 +249,27 @@ async def init_schema():
         embedding TEXT NOT NULL,
         chunk_index INTEGER,
         source_doc TEXT,
+        page_start INTEGER,
+        page_end INTEGER,
+        char_start INTEGER,
+        char_end INTEGER,
         created_at TEXT DEFAULT CURRENT_TIMESTAMP,
         FOREIGN KEY (document_id) REFERENCES documents(id) ON DELETE CASCADE
     );
     """
     await execute_sql(chunks_sql)
+
+    # Tables created before chunk provenance and content hashes were stored
+    await _add_missing_columns("chunks", {field: "INTEGER" for field in PROVENANCE_FIELDS})
+    await _add_missing_columns("documents", {"content_hash": "TEXT", "source_document_id": "TEXT"})
     
     await execute_sql("CREATE INDEX IF NOT EXISTS idx_documents_user_id ON documents(user_id);")
     await execute_sql("CREATE INDEX IF NOT EXISTS idx_documents_status ON documents(status);")
+    await execute_sql("CREATE INDEX IF NOT EXISTS idx_documents_content_hash ON documents(content_hash);")
+    await execute_sql("CREATE INDEX IF NOT EXISTS idx_documents_source_document_id ON documents(source_document_id);")
     await execute_sql("CREATE INDEX IF NOT EXISTS idx_chunks_document_id ON chunks(document_id);")
     
-    print("D1 schema initialized")
+    logger.info("D1 schema initialized")
 
 async def save_document(
     filename: str,
@@ -88,11 +278,20 @@ async def save_document(
     r2_url: str,
     file_size: int,
     user_id: Optional[str] = None,
-    mime_type: str = "application/pdf"
+    mime_type: str = "application/pdf",
+    content_hash: Optional[str] = None,
+    source_document_id: Optional[str] = None,
+    status: str = "pending",
+    chunks_count: int = 0
 ) -> dict:
     """
     Save document metadata to D1.
     
+    Args:
+        content_hash: SHA-256 of the file content, used for deduplication
+        source_document_id: Document whose chunks this one shares, for
+            a duplicate upload linked to an existing chunk set
+    
     Returns:
         Document record with ID
     """
@@ -100,10 +299,14 @@ async def save_document(
     now = datetime.utcnow().isoformat()
     
     sql = """
-    INSERT INTO documents (id, filename, original_name, r2_key, r2_url, file_size, mime_type, user_id, created_at, updated_at)
-    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
+    INSERT INTO documents (id, filename, original_name, r2_key, r2_url, file_size, mime_type, user_id,
+                           content_hash, source_document_id, status, chunks_count, created_at, updated_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
     """
-    params = [doc_id, filename, original_name, r2_key, r2_url, file_size, mime_type, user_id, now, now]
+    params = [
+        doc_id, filename, original_name, r2_key, r2_url, file_size, mime_type, user_id,
+        content_hash, source_document_id, status, chunks_count, now, now
+    ]
     
     await execute_sql(sql, params)
     
@@ -116,10 +319,70 @@ async def save_document(
         "file_size": file_size,
         "mime_type": mime_type,
         "user_id": user_id,
-        "status": "pending",
+        "content_hash": content_hash,
+        "source_document_id": source_document_id,
+        "status": status,
+        "chunks_count": chunks_count,
         "created_at": now
     }
 
+async def find_documents_by_hash(content_hash: str) -> list:
+    """
+    Get processed documents with the given content hash, originals first.
+    """
+    sql = """
+    SELECT * FROM documents WHERE content_hash = ? AND status = 'processed'
+    ORDER BY source_document_id IS NOT NULL, created_at;
+    """
+    return _rows(await execute_sql(sql, [content_hash]))
+
+async def get_documents(doc_ids: list) -> list:
+    """
+    Get many documents by ID.
+    """
+    rows = []
+    for start in range(0, len(doc_ids), D1_MAX_PARAMS):
+        batch = doc_ids[start:start + D1_MAX_PARAMS]
+        sql = f"SELECT * FROM documents WHERE id IN ({', '.join('?' * len(batch))});"
+        rows.extend(_rows(await execute_sql(sql, batch)))
+    return rows
+
+async def get_linked_documents(doc_id: str) -> list:
+    """
+    Get documents that share the chunks of the given document.
+    """
+    sql = "SELECT * FROM documents WHERE source_document_id = ? ORDER BY created_at;"
+    return _rows(await execute_sql(sql, [doc_id]))
+
+async def reassign_chunks(from_doc_id: str, to_doc_id: str) -> bool:
+    """
+    Move a document's chunks, and the links to them, to one of its
+    linked documents so they survive deleting the original.
+    """
+    now = datetime.utcnow().isoformat()
+    await execute_sql("UPDATE chunks SET document_id = ? WHERE document_id = ?;", [to_doc_id, from_doc_id])
+    await execute_sql(
+        "UPDATE documents SET source_document_id = NULL, updated_at = ? WHERE id = ?;",
+        [now, to_doc_id]
+    )
+    await execute_sql(
+        "UPDATE documents SET source_document_id = ?, updated_at = ? WHERE source_document_id = ?;",
+        [to_doc_id, now, from_doc_id]
+    )
+    return True
+
+async def get_dedup_stats() -> dict:
+    """
+    Totals for documents served from another document's chunks.
+    """
+    sql = """
+    SELECT COUNT(*) AS documents, COALESCE(SUM(file_size), 0) AS bytes_saved,
+           COALESCE(SUM(chunks_count), 0) AS embeddings_saved
+    FROM documents WHERE source_document_id IS NOT NULL;
+    """
+    rows = _rows(await execute_sql(sql))
+    return rows[0] if rows else {"documents": 0, "bytes_saved": 0, "embeddings_saved": 0}
+
 async def update_document_status(doc_id: str, status: str, chunks_count: int = None) -> bool:
     """
     Update document processing status.
@@ -173,55 +436,11 @@ async def delete_document(doc_id: str) -> bool:
     await execute_sql(sql, [doc_id])
     return True
 
-async def save_chunk(
-    text: str,
-    embedding: list,
-    source_doc: str,
-    document_id: Optional[str] = None,
-    chunk_index: int = 0
-) -> dict:
-    """
-    Save a chunk with its embedding to D1.
-    
-    Args:
-        text: The chunk text
-        embedding: Vector embedding as a list
-        source_doc: Source document filename
-        document_id: Optional document ID for association
-        chunk_index: Position of chunk in document
-        
-    Returns:
-        Chunk record with ID
-    """
-    import json
-    
-    chunk_id = str(uuid.uuid4())
-    embedding_json = json.dumps(embedding)
-    now = datetime.utcnow().isoformat()
-    
-    sql = """
-    INSERT INTO chunks (id, document_id, text, embedding, chunk_index, source_doc, created_at)
-    VALUES (?, ?, ?, ?, ?, ?, ?);
-    """
-    params = [chunk_id, document_id, text, embedding_json, chunk_index, source_doc, now]
-    
-    await execute_sql(sql, params)
-    
-    return {
-        "id": chunk_id,
-        "document_id": document_id,
-        "text": text,
-        "chunk_index": chunk_index,
-        "source_doc": source_doc
-    }
-
-
 async def get_chunks_by_document(document_id: str) -> list:
     """
     Get all chunks for a specific document.
+    Embeddings are decoded into float32 NumPy arrays.
     """
-    import json
-    
     sql = "SELECT * FROM chunks WHERE document_id = ? ORDER BY chunk_index;"
     result = await execute_sql(sql, [document_id])
     
@@ -229,33 +448,109 @@ async def get_chunks_by_document(document_id: str) -> list:
         chunks = result["result"][0]["results"]
         for chunk in chunks:
             if chunk.get("embedding"):
-                chunk["embedding"] = json.loads(chunk["embedding"])
+                chunk["embedding"] = decode_embedding(chunk["embedding"])
         return chunks
     return []
 
 
-async def get_all_chunks() -> list:
+def _rows_to_vectors(rows: list) -> tuple:
+    """
+    Decode chunk rows into an embedding matrix plus per-row metadata.
+    Rows whose embedding is not EMBEDDING_DIMENSIONS-dim (when set) or
+    of the batch's common dimension are left out.
     """
-    Get all chunks from D1 for search.
-    Returns chunks with parsed embeddings.
+    rows = [row for row in rows if row.get("embedding")]
+    matrix, kept = decode_embeddings([row["embedding"] for row in rows], EMBEDDING_DIMENSIONS or None)
+    rows = [rows[i] for i in kept]
+    metadata = [
+        {
+            "text": row["text"],
+            "source": row["source_doc"],
+            "document_id": row["document_id"],
+            "chunk_index": row.get("chunk_index"),
+            "rowid": row.get("rowid"),
+            **{field: row.get(field) for field in PROVENANCE_FIELDS}
+        }
+        for row in rows
+    ]
+    return matrix, metadata
+
+
+async def get_chunk_vectors_since(rowid: int, limit: int = 500) -> tuple:
     """
-    import json
+    Get chunks inserted after the given rowid watermark, oldest first.
     
-    sql = "SELECT id, document_id, text, embedding, source_doc FROM chunks;"
-    result = await execute_sql(sql)
+    Returns:
+        (matrix, metadata, last_rowid): float32 (n, dim) embedding
+        matrix, metadata[i] describing matrix row i, and the highest
+        rowid read (None if there were no rows). Rows skipped for their
+        embedding still count, so the watermark moves past them.
+    """
+    sql = f"""
+    SELECT {CHUNK_COLUMNS}
+    FROM chunks WHERE rowid > ? ORDER BY rowid LIMIT ?;
+    """
+    result = await execute_sql(sql, [rowid, limit])
     
     if result.get("result") and result["result"][0].get("results"):
-        chunks = result["result"][0]["results"]
-        parsed_chunks = []
-        for chunk in chunks:
-            if chunk.get("embedding"):
-                parsed_chunks.append({
-                    "text": chunk["text"],
-                    "vector": json.loads(chunk["embedding"]),
-                    "source": chunk["source_doc"]
-                })
-        return parsed_chunks
-    return []
+        rows = result["result"][0]["results"]
+        matrix, metadata = _rows_to_vectors(rows)
+        return matrix, metadata, max(row["rowid"] for row in rows)
+    return np.empty((0, 0), dtype=np.float32), [], None
+
+
+async def get_chunk_stats() -> dict:
+    """
+    Get the chunk count and the set of document IDs that have chunks.
+    Used to reconcile local replicas against D1.
+    """
+    result = await execute_sql("SELECT document_id, COUNT(*) AS n FROM chunks GROUP BY document_id;")
+    
+    rows = result["result"][0].get("results") if result.get("result") else None
+    rows = rows or []
+    return {
+        "count": sum(row["n"] for row in rows),
+        "document_ids": {row["document_id"] for row in rows}
+    }
+
+
+async def migrate_embeddings(fmt: str = EMBEDDING_STORAGE_FORMAT, batch_size: int = 200) -> int:
+    """
+    Re-encode stored embeddings that are not yet in the given format
+    (legacy JSON rows, or the other binary width).
+    Rows are rewritten in bulk with CASE updates.
+    
+    Returns:
+        Number of rows converted
+    """
+    converted = 0
+    rows_per_update = D1_MAX_PARAMS // 3
+    while True:
+        # A prefix test that works on text and BLOB columns (LIKE doesn't on BLOBs)
+        result = await execute_sql(
+            "SELECT id, embedding FROM chunks WHERE CAST(substr(embedding, 1, ?) AS TEXT) != ? LIMIT ?;",
+            [len(fmt) + 1, f"{fmt}:", batch_size]
+        )
+        rows = result["result"][0].get("results") if result.get("result") else None
+        if not rows:
+            break
+
+        updates = [
+            [row["id"], _encode(decode_embedding(row["embedding"]), fmt)]
+            for row in rows
+            if embedding_format(row["embedding"]) != fmt
+        ]
+        for start in range(0, len(updates), rows_per_update):
+            part = updates[start:start + rows_per_update]
+            cases = " ".join(["WHEN ? THEN ?"] * len(part))
+            placeholders = ", ".join("?" * len(part))
+            sql = f"UPDATE chunks SET embedding = CASE id {cases} END WHERE id IN ({placeholders});"
+            params = [value for pair in part for value in pair] + [pair[0] for pair in part]
+            await execute_sql(sql, params)
+        converted += len(updates)
+        if len(rows) < batch_size:
+            break
+    return converted
 
 
 async def delete_chunks_by_document(document_id: str) -> bool:
@@ -265,3 +560,44 @@ async def delete_chunks_by_document(document_id: str) -> bool:
     sql = "DELETE FROM chunks WHERE document_id = ?;"
     await execute_sql(sql, [document_id])
     return True
+
+
+async def delete_chunks_from(document_id: str, start_index: int) -> bool:
+    """
+    Delete a document's chunks at or after start_index.
+    Used to drop a partially written batch before resuming ingestion.
+    """
+    sql = "DELETE FROM chunks WHERE document_id = ? AND chunk_index >= ?;"
+    await execute_sql(sql, [document_id, start_index])
+    return True
+
+
+async def save_chunks(chunks: list, source_doc: str, document_id: Optional[str] = None, start_index: int = 0) -> int:
+    """
+    Save many chunks in bulk: multi-row INSERTs on D1, one transaction
+    on SQLite.
+    
+    Args:
+        chunks: List of (chunk, embedding) tuples in document order, where
+            chunk is a chunker dict with text and provenance fields
+        source_doc: Source document filename
+        document_id: Optional document ID for association
+        start_index: chunk_index of the first chunk
+        
+    Returns:
+        Number of chunks written
+    """
+    now = datetime.utcnow().isoformat()
+    rows = [
+        [
+            str(uuid.uuid4()), document_id, chunk["text"], _encode(embedding),
+            start_index + i, source_doc, *(chunk.get(field) for field in PROVENANCE_FIELDS), now
+        ]
+        for i, (chunk, embedding) in enumerate(chunks)
+    ]
+    columns = (
+        "id", "document_id", "text", "embedding", "chunk_index", "source_doc",
+        *PROVENANCE_FIELDS, "created_at"
+    )
+    await backend.insert_rows("chunks", columns, rows)
+    return len(rows)
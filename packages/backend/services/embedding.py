@@ -1,29 +1,355 @@
+import asyncio
+import logging
+import time
 import openai
 import numpy as np
-from backend.config import OPENAI_API_KEY
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator
+from backend.config import (
+  OPENAI_API_KEY,
+  EMBEDDING_BATCH_SIZE,
+  EMBEDDING_CONCURRENCY,
+  EMBEDDING_CACHE_PATH,
+  EMBEDDING_CACHE_MEMORY_ITEMS,
+  EMBEDDING_CACHE_MAX_BYTES,
+  EMBEDDING_DIMENSIONS
+)
+from backend.services.embedding_cache import EmbeddingCache, normalize_text
+from backend.utils.tokens import count_tokens
+from backend.utils.telemetry import registry, emit_span, SIZE_BUCKETS
+
+logger = logging.getLogger(__name__)
 
 client = openai.OpenAI(api_key=OPENAI_API_KEY)
+async_client = openai.AsyncOpenAI(api_key=OPENAI_API_KEY)
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+# text-embedding-3 models return shortened embeddings when asked for fewer
+# dimensions; the cache keys them apart from full-size ones
+EMBEDDING_OPTIONS = {"dimensions": EMBEDDING_DIMENSIONS} if EMBEDDING_DIMENSIONS else {}
+CACHE_MODEL = f"{EMBEDDING_MODEL}/{EMBEDDING_DIMENSIONS}" if EMBEDDING_DIMENSIONS else EMBEDDING_MODEL
+
+# Shared by uploads and chat, so repeat chunks and repeat questions are free
+cache = EmbeddingCache(
+  EMBEDDING_CACHE_PATH or None,
+  max_memory_items=EMBEDDING_CACHE_MEMORY_ITEMS,
+  max_disk_bytes=EMBEDDING_CACHE_MAX_BYTES
+)
+
+EMBEDDING_SECONDS = registry.histogram(
+  "embedding_request_seconds", "Latency of embeddings.create requests", ("status",)
+)
+EMBEDDING_BATCH_INPUTS = registry.histogram(
+  "embedding_batch_inputs", "Inputs per embeddings.create request", buckets=SIZE_BUCKETS
+)
+registry.gauge("embedding_cache_hit_rate", "Share of embedding lookups served from the cache", lambda: cache.stats()["hit_rate"])
+
+# OpenAI limits for a single embeddings.create request
+MAX_BATCH_INPUTS = 2048
+MAX_BATCH_TOKENS = 300_000
+MAX_INPUT_TOKENS = 8191
+
+def _record(started: float, inputs: int, status: str):
+  """Time one embeddings.create request ("ok", "rejected" or "error")."""
+  duration = time.perf_counter() - started
+  EMBEDDING_SECONDS.observe(duration, status=status)
+  EMBEDDING_BATCH_INPUTS.observe(inputs)
+  emit_span("embedding.request", duration, status=status, inputs=inputs)
+
 
 def get_embedding(text: str):
 
   try:
-    print(f"DEBUG: Generating embedding for text replacement... Text length: {len(text)}")
-    clean_text = text.replace("\n", " ")
-    print("DEBUG: Replacement successful.")
+    clean_text = normalize_text(text)
+    cached = cache.get(CACHE_MODEL, clean_text)
+    if cached is not None:
+      return cached
+
+    started = time.perf_counter()
+    try:
+      response = client.embeddings.create(
+        input=[clean_text],
+        model=EMBEDDING_MODEL,
+        **EMBEDDING_OPTIONS
+      )
+    except Exception:
+      _record(started, 1, "error")
+      raise
+    _record(started, 1, "ok")
+
+    embedding = response.data[0].embedding
+    cache.put(CACHE_MODEL, clean_text, embedding)
+    return embedding
+  except Exception as e:
+    logger.error("Error occurred while fetching an embedding: %s", e)
+    return []
+
+
+def _make_batches(token_counts: list[int], batch_size: int) -> list[list[int]]:
+  """
+  Group input positions into batches that respect the per-request
+  input count and token limits.
+  """
+  batches = []
+  current = []
+  current_tokens = 0
+  for i, tokens in enumerate(token_counts):
+    tokens = min(tokens, MAX_INPUT_TOKENS)
+    if current and (len(current) >= batch_size or current_tokens + tokens > MAX_BATCH_TOKENS):
+      batches.append(current)
+      current = []
+      current_tokens = 0
+    current.append(i)
+    current_tokens += tokens
+  if current:
+    batches.append(current)
+  return batches
+
+
+def _embed_batch(indices: list[int], texts: list[str]) -> dict:
+  """
+  Embed one batch. If the API rejects the request, split it in half and
+  retry so a single bad input only fails itself. Other errors (rate limits,
+  network) are already retried by the client and fail the whole batch.
+
+  Returns:
+    dict mapping input position to {"embedding", "error"}
+  """
+  started = time.perf_counter()
+  try:
     response = client.embeddings.create(
-      input=[clean_text],
-      model="text-embedding-3-small"
+      input=[texts[i] for i in indices],
+      model=EMBEDDING_MODEL,
+      **EMBEDDING_OPTIONS
     )
+    _record(started, len(indices), "ok")
+    return {
+      indices[item.index]: {"embedding": item.embedding, "error": None}
+      for item in response.data
+    }
+  except openai.BadRequestError as e:
+    _record(started, len(indices), "rejected")
+    if len(indices) == 1:
+      return {indices[0]: {"embedding": None, "error": str(e)}}
+    mid = len(indices) // 2
+    results = _embed_batch(indices[:mid], texts)
+    results.update(_embed_batch(indices[mid:], texts))
+    return results
+  except Exception as e:
+    _record(started, len(indices), "error")
+    logger.error("Error occurred while embedding a batch of %d: %s", len(indices), e)
+    return {i: {"embedding": None, "error": str(e)} for i in indices}
+
+
+def _prepare(texts: list[str], batch_size: int) -> tuple:
+  """
+  Normalize texts, fill in cache hits and invalid inputs, and group the
+  rest into API batches.
+
+  Returns:
+    (results, clean_texts, pending positions, batches of positions)
+  """
+  results = [None] * len(texts)
+  clean_texts = [normalize_text(text) for text in texts]
+  cached = cache.get_many(CACHE_MODEL, clean_texts)
+  token_counts = {}
+  for i, clean_text in enumerate(clean_texts):
+    if cached[i] is not None:
+      results[i] = {"embedding": cached[i], "error": None}
+    elif not clean_text:
+      results[i] = {"embedding": None, "error": "empty input"}
+    else:
+      token_counts[i] = count_tokens(clean_text, EMBEDDING_MODEL)
+      if token_counts[i] > MAX_INPUT_TOKENS:
+        results[i] = {"embedding": None, "error": "input exceeds model token limit"}
+
+  pending = [i for i in range(len(texts)) if results[i] is None]
+  batches = [
+    [pending[j] for j in batch]
+    for batch in _make_batches([token_counts[i] for i in pending], min(batch_size, MAX_BATCH_INPUTS))
+  ]
+  return results, clean_texts, pending, batches
+
+
+def _finish(results: list, clean_texts: list, pending: list) -> list:
+  """
+  Mark inputs the API skipped as failed and cache the new embeddings.
+  """
+  fresh = []
+  for i in pending:
+    if results[i] is None:
+      results[i] = {"embedding": None, "error": "missing from API response"}
+    elif results[i]["embedding"]:
+      fresh.append(i)
+  cache.put_many(
+    CACHE_MODEL,
+    [clean_texts[i] for i in fresh],
+    [results[i]["embedding"] for i in fresh]
+  )
+  return results
+
+
+def get_embeddings(texts: list[str], batch_size: int = EMBEDDING_BATCH_SIZE, max_workers: int = EMBEDDING_CONCURRENCY) -> list[dict]:
+  """
+  Embed many texts with as few API calls as possible.
 
-    return response.data[0].embedding
+  Args:
+    texts: Texts to embed.
+    batch_size: Max inputs per embeddings.create request.
+    max_workers: How many batch requests run at once.
+
+  Returns:
+    One {"embedding": list | None, "error": str | None} per input,
+    in the same order as texts.
+  """
+  results, clean_texts, pending, batches = _prepare(texts, batch_size)
+
+  with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+    for batch_results in pool.map(lambda batch: _embed_batch(batch, clean_texts), batches):
+      for i, result in batch_results.items():
+        results[i] = result
+
+  return _finish(results, clean_texts, pending)
+
+
+async def get_embedding_async(text: str):
+  """
+  Async version of get_embedding using the async OpenAI client.
+  """
+  try:
+    clean_text = normalize_text(text)
+    cached = await asyncio.to_thread(cache.get, CACHE_MODEL, clean_text)
+    if cached is not None:
+      return cached
+
+    started = time.perf_counter()
+    try:
+      response = await async_client.embeddings.create(
+        input=[clean_text],
+        model=EMBEDDING_MODEL,
+        **EMBEDDING_OPTIONS
+      )
+    except Exception:
+      _record(started, 1, "error")
+      raise
+    _record(started, 1, "ok")
+
+    embedding = response.data[0].embedding
+    await asyncio.to_thread(cache.put, CACHE_MODEL, clean_text, embedding)
+    return embedding
   except Exception as e:
-    print(f"Error occured while embedding fetch: {e}")
+    logger.error("Error occurred while fetching an embedding: %s", e)
     return []
 
+
+async def _embed_batch_async(indices: list[int], texts: list[str], semaphore: asyncio.Semaphore) -> dict:
+  """
+  Async version of _embed_batch; the semaphore bounds requests in flight.
+  """
+  started = None
+  try:
+    async with semaphore:
+      started = time.perf_counter()
+      response = await async_client.embeddings.create(
+        input=[texts[i] for i in indices],
+        model=EMBEDDING_MODEL,
+        **EMBEDDING_OPTIONS
+      )
+    _record(started, len(indices), "ok")
+    return {
+      indices[item.index]: {"embedding": item.embedding, "error": None}
+      for item in response.data
+    }
+  except openai.BadRequestError as e:
+    _record(started, len(indices), "rejected")
+    if len(indices) == 1:
+      return {indices[0]: {"embedding": None, "error": str(e)}}
+    mid = len(indices) // 2
+    halves = await asyncio.gather(
+      _embed_batch_async(indices[:mid], texts, semaphore),
+      _embed_batch_async(indices[mid:], texts, semaphore)
+    )
+    return {**halves[0], **halves[1]}
+  except Exception as e:
+    if started is not None:
+      _record(started, len(indices), "error")
+    logger.error("Error occurred while embedding a batch of %d: %s", len(indices), e)
+    return {i: {"embedding": None, "error": str(e)} for i in indices}
+
+
+async def get_embeddings_async(texts: list[str], batch_size: int = EMBEDDING_BATCH_SIZE, max_concurrency: int = EMBEDDING_CONCURRENCY) -> list[dict]:
+  """
+  Async version of get_embeddings. Batches run concurrently on the event
+  loop instead of a thread pool; cache I/O runs off the loop.
+  """
+  results, clean_texts, pending, batches = await asyncio.to_thread(_prepare, texts, batch_size)
+
+  semaphore = asyncio.Semaphore(max(1, max_concurrency))
+  for batch_results in await asyncio.gather(*(_embed_batch_async(batch, clean_texts, semaphore) for batch in batches)):
+    for i, result in batch_results.items():
+      results[i] = result
+
+  return await asyncio.to_thread(_finish, results, clean_texts, pending)
+
+
+async def embed_stream(
+  texts: AsyncIterator[str],
+  batch_size: int = EMBEDDING_BATCH_SIZE,
+  max_concurrency: int = EMBEDDING_CONCURRENCY,
+  first_batch_size: int = 16
+) -> AsyncIterator[tuple]:
+  """
+  Embed an async stream of texts batch by batch.
+
+  Batches start small and double up to batch_size, so the first results
+  arrive quickly. Up to max_concurrency batches are in flight at once;
+  results are yielded in input order.
+
+  Yields:
+    (batch texts, batch results) with results as in get_embeddings
+  """
+  in_flight = deque()
+  batch = []
+  size = min(first_batch_size, batch_size)
+
+  def launch(texts_batch: list):
+    in_flight.append((texts_batch, asyncio.create_task(get_embeddings_async(texts_batch, batch_size, 1))))
+
+  try:
+    async for text in texts:
+      batch.append(text)
+      if len(batch) >= size:
+        launch(batch)
+        batch = []
+        size = min(size * 2, batch_size)
+        if len(in_flight) >= max(1, max_concurrency):
+          texts_batch, task = in_flight.popleft()
+          yield texts_batch, await task
+    if batch:
+      launch(batch)
+    while in_flight:
+      texts_batch, task = in_flight.popleft()
+      yield texts_batch, await task
+  finally:
+    for _, task in in_flight:
+      task.cancel()
+
+
+def get_cache_stats() -> dict:
+  """Hit/miss counters and sizes of the embedding cache."""
+  return cache.stats()
+
 # Adding a comment here so that this doesn't kill me in the future
 # Cosine similarity is a metric used to measure how similar two things are in this case, pieces of text.
 # Think of each piece of text (like a user's question or a paragraph from a PDF) as an arrow pointing in a specific direction in a multi-dimensional space.
 # Similar meanings = arrows point in roughly the same direction (small angle).
 # Different meanings = arrows point in different directions (large angle).
 def cosine_similarity(a, b):
-    return np.dot(a, b)
+    a = np.asarray(a, dtype=np.float32)
+    b = np.asarray(b, dtype=np.float32)
+    denom = np.linalg.norm(a) * np.linalg.norm(b)
+    if denom == 0:
+        return 0.0
+    return float(np.dot(a, b) / denom)
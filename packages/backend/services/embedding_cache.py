@@ -0,0 +1,200 @@
+"""
+Content-addressed cache for embeddings.
+Two tiers: a bounded in-process LRU and a persistent SQLite file with
+size-based eviction. Keys are (model, normalized text) hashes, so repeat
+uploads and repeat questions never reach the API.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+import numpy as np
+
+
+def normalize_text(text: str) -> str:
+    """Collapse all whitespace runs to single spaces."""
+    return " ".join(text.split())
+
+
+def cache_key(model: str, text: str) -> str:
+    """Hash of the model name and normalized text."""
+    digest = hashlib.sha256()
+    digest.update(model.encode("utf-8"))
+    digest.update(b"\x00")
+    digest.update(normalize_text(text).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Two-tier embedding cache.
+
+    Vectors are kept as float32 in both tiers. The disk tier tracks its
+    total payload size and evicts least-recently-used rows once it grows
+    past max_disk_bytes.
+    """
+
+    def __init__(self, path: Optional[str], max_memory_items: int = 10000, max_disk_bytes: int = 512 * 1024 * 1024):
+        self.max_memory_items = max_memory_items
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits_memory = 0
+        self._hits_disk = 0
+        self._misses = 0
+        self._evictions = 0
+
+        self._db = None
+        self._disk_bytes = 0
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL;")
+            self._db.execute("PRAGMA synchronous=NORMAL;")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    key TEXT PRIMARY KEY,
+                    vector BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_used REAL NOT NULL
+                );
+            """)
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used);")
+            self._db.commit()
+            row = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings;").fetchone()
+            self._disk_bytes = row[0]
+
+    def _remember(self, key: str, vector: np.ndarray):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def get_many(self, model: str, texts: list[str]) -> list[Optional[list]]:
+        """
+        Look up several texts at once.
+
+        Returns:
+            One vector (as a list) or None per text, in order
+        """
+        keys = [cache_key(model, text) for text in texts]
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    found[key] = self._memory[key]
+
+            missing = [key for key in set(keys) if key not in found]
+            if missing and self._db is not None:
+                now = time.time()
+                for start in range(0, len(missing), 500):
+                    part = missing[start:start + 500]
+                    placeholders = ",".join("?" * len(part))
+                    rows = self._db.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders});", part
+                    ).fetchall()
+                    for key, blob in rows:
+                        vector = np.frombuffer(blob, dtype=np.float32)
+                        found[key] = vector
+                        self._remember(key, vector)
+                    if rows:
+                        self._db.executemany(
+                            "UPDATE embeddings SET last_used = ? WHERE key = ?;",
+                            [(now, key) for key, _ in rows]
+                        )
+                self._db.commit()
+                disk_keys = set(missing) & set(found)
+            else:
+                disk_keys = set()
+
+            results = []
+            for key in keys:
+                vector = found.get(key)
+                if vector is None:
+                    self._misses += 1
+                    results.append(None)
+                else:
+                    if key in disk_keys:
+                        self._hits_disk += 1
+                    else:
+                        self._hits_memory += 1
+                    results.append(vector.tolist())
+        return results
+
+    def get(self, model: str, text: str) -> Optional[list]:
+        return self.get_many(model, [text])[0]
+
+    def put_many(self, model: str, texts: list[str], vectors: list):
+        """
+        Store vectors for texts in both tiers, evicting from disk if needed.
+        """
+        now = time.time()
+        # key -> row; a text repeated in the batch is written (and
+        # counted against the disk budget) once
+        rows = {}
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                key = cache_key(model, text)
+                array = np.asarray(vector, dtype=np.float32)
+                self._remember(key, array)
+                blob = array.tobytes()
+                rows[key] = (key, blob, len(blob), now)
+            rows = list(rows.values())
+
+            if self._db is None or not rows:
+                return
+            for key, _, size, _ in rows:
+                existing = self._db.execute("SELECT size FROM embeddings WHERE key = ?;", (key,)).fetchone()
+                if existing:
+                    self._disk_bytes -= existing[0]
+            self._db.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, size, last_used) VALUES (?, ?, ?, ?);", rows
+            )
+            self._disk_bytes += sum(size for _, _, size, _ in rows)
+            if self._disk_bytes > self.max_disk_bytes:
+                self._evict()
+            self._db.commit()
+
+    def put(self, model: str, text: str, vector: list):
+        self.put_many(model, [text], [vector])
+
+    def _evict(self):
+        """
+        Drop least-recently-used rows until the disk tier is back under
+        90% of its budget, so eviction doesn't run on every insert.
+        """
+        target = int(self.max_disk_bytes * 0.9)
+        while self._disk_bytes > target:
+            rows = self._db.execute(
+                "SELECT key, size FROM embeddings ORDER BY last_used LIMIT 256;"
+            ).fetchall()
+            if not rows:
+                self._disk_bytes = 0
+                break
+            victims = []
+            for key, size in rows:
+                if self._disk_bytes <= target:
+                    break
+                victims.append((key,))
+                self._disk_bytes -= size
+            self._db.executemany("DELETE FROM embeddings WHERE key = ?;", victims)
+            self._evictions += len(victims)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._hits_memory + self._hits_disk + self._misses
+            return {
+                "memory_hits": self._hits_memory,
+                "disk_hits": self._hits_disk,
+                "misses": self._misses,
+                "hit_rate": (self._hits_memory + self._hits_disk) / lookups if lookups else 0.0,
+                "memory_items": len(self._memory),
+                "disk_bytes": self._disk_bytes,
+                "evictions": self._evictions
+            }
@@ -0,0 +1,311 @@
+"""
+Background ingestion jobs for cloud uploads.
+
+The upload route stores the PDF and its document row, then hands the rest
+(the streaming extract/embed/store pipeline) to a bounded pool of worker
+tasks and returns 202. Each job checkpoints to disk after every stored
+batch of chunks, so a job interrupted by a crash resumes where it stopped
+without re-embedding finished chunks. Finished jobs are kept for
+JOB_RETENTION_HOURS, then dropped along with their files.
+
+Several worker processes can share JOBS_DIR: a process only runs a job
+while it holds an exclusive flock on the job's .lock file, so an
+unfinished job is resumed by exactly one of them, and any process can
+answer a status poll from the job's checkpoint file.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process use only
+    fcntl = None
+
+from backend.config import INGEST_WORKERS, JOBS_DIR, JOB_RETENTION_HOURS
+from backend.data.storage import discard_chunks_from
+from backend.services.d1 import update_document_status
+from backend.services.pipeline import ingest_pdf
+from backend.services.r2 import download_from_r2_async
+from backend.utils.telemetry import registry, emit_span, trace_id
+
+logger = logging.getLogger(__name__)
+
+JOB_SECONDS = registry.histogram("ingest_job_seconds", "Duration of background ingestion jobs", ("status",))
+
+# Seconds between sweeps for expired job files
+PRUNE_INTERVAL = 3600.0
+
+
+class JobQueue:
+    """
+    Job queue and worker pool. `jobs` holds the unfinished jobs this
+    process has claimed; finished jobs only live in their checkpoint files.
+    """
+
+    def __init__(self, jobs_dir: str = JOBS_DIR, workers: int = INGEST_WORKERS, retention_hours: float = JOB_RETENTION_HOURS):
+        self.jobs_dir = jobs_dir
+        self.workers = workers
+        self.retention = timedelta(hours=retention_hours)
+        self.jobs = {}
+        # job id -> open .lock file whose flock marks the job as ours
+        self._claims = {}
+        self._last_prune = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks = []
+
+    def _path(self, job_id: str, suffix: str = "json") -> str:
+        return os.path.join(self.jobs_dir, f"{job_id}.{suffix}")
+
+    def _checkpoint(self, job: dict):
+        """Write the job state atomically."""
+        job["updated_at"] = datetime.utcnow().isoformat()
+        tmp_path = self._path(job["id"], "json.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(job, f)
+        os.replace(tmp_path, self._path(job["id"]))
+
+    def _expired(self, job: dict, now: datetime) -> bool:
+        """Whether a finished job has outlived the retention window."""
+        if job["stage"] not in ("completed", "failed"):
+            return False
+        return now - datetime.fromisoformat(job["updated_at"]) > self.retention
+
+    def _claim(self, job_id: str) -> bool:
+        """
+        Take the job's flock without waiting. False if another process
+        holds it; the lock is released when that process exits.
+        """
+        lock_file = open(self._path(job_id, "lock"), "a")
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock_file.close()
+                return False
+        self._claims[job_id] = lock_file
+        return True
+
+    def _release(self, job_id: str):
+        """Forget a job and give up its claim."""
+        self.jobs.pop(job_id, None)
+        lock_file = self._claims.pop(job_id, None)
+        if lock_file is not None:
+            lock_file.close()
+
+    def _read(self, path: str) -> Optional[dict]:
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _prune(self):
+        """
+        Delete the files of expired jobs, whichever process ran them.
+        Runs on a worker thread.
+        """
+        now = datetime.utcnow()
+        for name in os.listdir(self.jobs_dir):
+            if not name.endswith(".json"):
+                continue
+            job = self._read(os.path.join(self.jobs_dir, name))
+            if job is None or not self._expired(job, now):
+                continue
+            for suffix in ("json", "lock"):
+                try:
+                    os.remove(self._path(job["id"], suffix))
+                except FileNotFoundError:
+                    pass
+
+    async def _maybe_prune(self):
+        now = time.monotonic()
+        if self._last_prune is None or now - self._last_prune > PRUNE_INTERVAL:
+            self._last_prune = now
+            await asyncio.to_thread(self._prune)
+
+    async def submit(self, document_id: str, filename: str, r2_key: str, file_path: str) -> dict:
+        """
+        Register a job for an uploaded document and queue it.
+
+        Args:
+            document_id: D1 document ID
+            filename: Original filename, used as the chunk source
+            r2_key: Key of the PDF in R2, used if the local copy is gone
+            file_path: Local copy of the PDF
+
+        Returns:
+            The job record
+        """
+        now = datetime.utcnow().isoformat()
+        job = {
+            "id": str(uuid.uuid4()),
+            "document_id": document_id,
+            "filename": filename,
+            "r2_key": r2_key,
+            "file_path": file_path,
+            "stage": "queued",
+            "pages_total": 0,
+            "pages_extracted": 0,
+            "chunks_total": 0,
+            "chunks_embedded": 0,
+            "chunks_stored": 0,
+            "next_chunk": 0,
+            "failed_chunks": [],
+            "error": None,
+            "created_at": now,
+            "updated_at": now
+        }
+        await self._maybe_prune()
+        self._claim(job["id"])
+        self.jobs[job["id"]] = job
+        self._checkpoint(job)
+        await self._queue.put(job["id"])
+        return job
+
+    def get(self, job_id: str) -> Optional[dict]:
+        """
+        A job's state: live if this process is running it, otherwise its
+        last checkpoint, which may be another process's job.
+        """
+        job = self.jobs.get(job_id)
+        if job is not None:
+            return job
+        try:
+            uuid.UUID(job_id)
+        except ValueError:
+            return None
+        return self._read(self._path(job_id))
+
+    async def _run_job(self, job: dict):
+        document_id = job["document_id"]
+        await update_document_status(document_id, "processing")
+
+        job["stage"] = "processing"
+        self._checkpoint(job)
+        if not os.path.exists(job["file_path"]):
+            content = await download_from_r2_async(job["r2_key"])
+            with open(job["file_path"], "wb") as f:
+                f.write(content)
+        # Rows past the last checkpoint may be from a half-written batch
+        await discard_chunks_from(document_id, job["chunks_stored"])
+
+        def on_progress(done: int, total: int):
+            job["pages_extracted"] = done
+            job["pages_total"] = total
+
+        failed_before = len(job["failed_chunks"])
+
+        async def on_batch(stats: dict):
+            job["next_chunk"] = stats["chunks_seen"]
+            job["chunks_stored"] = stats["chunks_stored"]
+            job["chunks_embedded"] = stats["chunks_stored"]
+            job["failed_chunks"] = job["failed_chunks"][:failed_before] + stats["failed_chunks"]
+            self._checkpoint(job)
+
+        # Chunks before next_chunk were embedded and stored by an earlier
+        # attempt; they are re-extracted but not re-embedded
+        stats = await ingest_pdf(
+            job["file_path"],
+            job["filename"],
+            document_id=document_id,
+            skip_chunks=job["next_chunk"],
+            start_index=job["chunks_stored"],
+            on_progress=on_progress,
+            on_batch=on_batch
+        )
+        if stats["chunks_seen"] == 0:
+            raise ValueError("Could not extract text from PDF (Empty or Scanned).")
+
+        job["chunks_total"] = stats["chunks_seen"]
+        await update_document_status(document_id, "processed", job["chunks_stored"])
+        job["stage"] = "completed"
+        self._checkpoint(job)
+        self._cleanup(job)
+        self._release(job["id"])
+
+    def _cleanup(self, job: dict):
+        if os.path.exists(job["file_path"]):
+            os.remove(job["file_path"])
+
+    def _record(self, job: dict, started: float):
+        duration = time.perf_counter() - started
+        status = "completed" if job["stage"] == "completed" else "failed"
+        JOB_SECONDS.observe(duration, status=status)
+        emit_span("ingest.job", duration, status=status, document_id=job["document_id"])
+
+    async def _worker(self):
+        while True:
+            job = self.jobs.get(await self._queue.get())
+            started = time.perf_counter()
+            try:
+                if job is not None:
+                    # Spans of the job's stages share the job id as trace id
+                    trace_id.set(job["id"])
+                    await self._run_job(job)
+                    self._record(job, started)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Ingestion job %s failed: %s", job["id"], e)
+                job["stage"] = "failed"
+                job["error"] = str(e)
+                self._record(job, started)
+                self._checkpoint(job)
+                self._cleanup(job)
+                self._release(job["id"])
+                try:
+                    await update_document_status(job["document_id"], "error")
+                except Exception as status_err:
+                    logger.error("Could not mark document %s as failed: %s", job["document_id"], status_err)
+            finally:
+                self._queue.task_done()
+
+    async def start(self):
+        """
+        Start the workers and requeue unfinished jobs that no other
+        process has claimed, i.e. jobs left by a process that exited.
+        Called on app startup.
+        """
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        self._queue = asyncio.Queue()
+        await self._maybe_prune()
+        for name in sorted(os.listdir(self.jobs_dir)):
+            if not name.endswith(".json"):
+                continue
+            job = self._read(os.path.join(self.jobs_dir, name))
+            if job is None or job["stage"] in ("completed", "failed") or job["id"] in self.jobs:
+                continue
+            job_id = job["id"]
+            if not self._claim(job_id):
+                continue
+            # Re-read under the claim: the previous owner may have
+            # finished the job after the first read
+            job = self._read(os.path.join(self.jobs_dir, name))
+            if job is None or job["stage"] in ("completed", "failed"):
+                self._release(job_id)
+                continue
+            logger.info("Resuming ingestion job %s at stage %s", job["id"], job["stage"])
+            self.jobs[job["id"]] = job
+            await self._queue.put(job["id"])
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """
+        Cancel the workers and give up the claims. Unfinished jobs resume
+        on the next start of any process.
+        """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for job_id in list(self._claims):
+            self._release(job_id)
+
+
+job_queue = JobQueue()
@@ -1,13 +1,30 @@
+import time
 import openai
 from backend.config import OPENAI_API_KEY
+from backend.utils.telemetry import registry, emit_span
 
 client = openai.OpenAI(api_key=OPENAI_API_KEY)
+async_client = openai.AsyncOpenAI(api_key=OPENAI_API_KEY)
 
-def generate_answer(question: str, context_chunks: list):
+CHAT_MODEL = "gpt-4o-mini" # Or "gpt-3.5-turbo" if you want cheaper
+
+# Between context passages in the prompt (services/context.py counts it
+# against the token budget)
+CONTEXT_SEPARATOR = "\n\n---\n\n"
+
+LLM_SECONDS = registry.histogram("llm_response_seconds", "Time to a complete chat completion", ("mode", "status"))
+LLM_FIRST_TOKEN_SECONDS = registry.histogram("llm_first_token_seconds", "Time to the first streamed answer token")
+
+def _record(started: float, mode: str, status: str):
+    duration = time.perf_counter() - started
+    LLM_SECONDS.observe(duration, mode=mode, status=status)
+    emit_span("llm.response", duration, mode=mode, status=status)
+
+def _build_messages(question: str, context_chunks: list) -> list:
     """
-    Constructs a prompt with context and gets answer from GPT.
+    Constructs the system and user messages with the retrieved context.
     """
-    context_text = "\n\n---\n\n".join([c['text'] for c in context_chunks])
+    context_text = CONTEXT_SEPARATOR.join([c['text'] for c in context_chunks])
     
     system_prompt = "You are a helpful assistant. Answer the user's question based ONLY on the context provided below. If the answer is not in the context, say 'I don't know'."
     
@@ -17,16 +34,77 @@ def generate_answer(question: str, context_chunks: list):
     
     User Question: 
     {question}
-    """    
+    """
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt}
+    ]
+
+def generate_answer(question: str, context_chunks: list):
+    """
+    Constructs a prompt with context and gets answer from GPT.
+    """
+    started = time.perf_counter()
     try:
         response = client.chat.completions.create(
-            model="gpt-4o-mini", # Or "gpt-3.5-turbo" if you want cheaper
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
+            model=CHAT_MODEL,
+            messages=_build_messages(question, context_chunks),
             temperature=0.7
         )
+        _record(started, "complete", "ok")
         return response.choices[0].message.content
     except Exception as e:
-        return f"Error communicating with AI: {e}"
\ No newline at end of file
+        _record(started, "complete", "error")
+        return f"Error communicating with AI: {e}"
+
+async def generate_answer_async(question: str, context_chunks: list):
+    """
+    Async version of generate_answer using the async OpenAI client.
+    """
+    started = time.perf_counter()
+    try:
+        response = await async_client.chat.completions.create(
+            model=CHAT_MODEL,
+            messages=_build_messages(question, context_chunks),
+            temperature=0.7
+        )
+        _record(started, "complete", "ok")
+        return response.choices[0].message.content
+    except Exception as e:
+        _record(started, "complete", "error")
+        return f"Error communicating with AI: {e}"
+
+async def generate_answer_stream(question: str, context_chunks: list):
+    """
+    Streaming variant of generate_answer.
+    Yields answer text pieces as the model produces them. Closing the
+    generator closes the HTTP stream, which stops the completion.
+    Time to the first token and to the end of the stream are recorded.
+    """
+    started = time.perf_counter()
+    first_token = None
+    status = "error"
+    try:
+        stream = await async_client.chat.completions.create(
+            model=CHAT_MODEL,
+            messages=_build_messages(question, context_chunks),
+            temperature=0.7,
+            stream=True
+        )
+        try:
+            async for event in stream:
+                if event.choices and event.choices[0].delta.content:
+                    if first_token is None:
+                        first_token = time.perf_counter() - started
+                        LLM_FIRST_TOKEN_SECONDS.observe(first_token)
+                    yield event.choices[0].delta.content
+            status = "ok"
+        finally:
+            await stream.close()
+    except GeneratorExit:
+        status = "cancelled"
+        raise
+    finally:
+        _record(started, "stream", status)
+        if first_token is not None:
+            emit_span("llm.first_token", first_token)
@@ -1,39 +1,249 @@
+import logging
+import multiprocessing
+import signal
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Iterator, Optional
 from PyPDF2 import PdfReader
-from backend.utils.chunker import chunk_text
+from backend.config import PDF_WORKERS, PDF_PAGE_TIMEOUT
+from backend.utils.chunker import iter_page_chunks
+from backend.utils.telemetry import registry
 
-def process_pdf(file_path: str) -> list[str]:
+logger = logging.getLogger(__name__)
+
+PDF_PAGES = registry.counter("pdf_pages_total", "Pages extracted from PDFs")
+PDF_EXTRACT_SECONDS = registry.histogram("pdf_extract_seconds", "Time spent extracting the text of a PDF")
+CHUNKING_SECONDS = registry.histogram("chunking_seconds", "Time spent splitting a PDF's text into chunks")
+
+# Fewer pages than this are extracted in-process; the pool isn't worth it
+MIN_PARALLEL_PAGES = 32
+
+# Extractions run on pipeline threads, so creating, discarding and
+# shutting down the shared pool is serialized
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+class PageTimeout(Exception):
+  pass
+
+
+def _on_alarm(signum, frame):
+  raise PageTimeout()
+
+
+def _extract_range(file_path: str, start: int, end: int, page_timeout: float) -> list[str]:
   """
-  Extracts text from PDF and splits into chunks.
-  Optimized for large files with page-level logging.
+  Extract pages [start, end) in a worker process.
+  The worker opens the file itself so no parsed objects cross the process
+  boundary. A page that fails or exceeds page_timeout yields "".
   """
-  try:
-    print(f"Opening PDF: {file_path}")
-    reader = PdfReader(file_path)
-    num_pages = len(reader.pages)
-    print(f"Found {num_pages} pages.")
-    
-    text = ""
+  use_alarm = page_timeout > 0 and hasattr(signal, "setitimer")
+  if use_alarm:
+    signal.signal(signal.SIGALRM, _on_alarm)
+
+  reader = PdfReader(file_path)
+  texts = []
+  for i in range(start, end):
+    try:
+      if use_alarm:
+        signal.setitimer(signal.ITIMER_REAL, page_timeout)
+      texts.append(reader.pages[i].extract_text() or "")
+    except PageTimeout:
+      logger.warning("Page %d timed out after %ss", i + 1, page_timeout)
+      texts.append("")
+    except Exception as page_err:
+      logger.warning("Could not extract page %d: %s", i + 1, page_err)
+      texts.append("")
+    finally:
+      if use_alarm:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+  return texts
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+  """
+  Shared process pool, created on first use. Uses spawn so workers never
+  inherit locks held by the server's threads at fork time.
+  """
+  global _pool
+  pool = _pool
+  if pool is None:
+    with _pool_lock:
+      if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+      pool = _pool
+  return pool
+
+
+def _discard_pool(pool: ProcessPoolExecutor):
+  """
+  Drop a pool whose worker died (out of memory, a crash in the PDF
+  parser), so the next extraction starts a fresh one instead of failing
+  with BrokenProcessPool until the server restarts.
+  """
+  global _pool
+  with _pool_lock:
+    if _pool is pool:
+      _pool = None
+  pool.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown_pool():
+  """Stop the extraction workers. Called on app shutdown."""
+  global _pool
+  with _pool_lock:
+    pool, _pool = _pool, None
+  if pool is not None:
+    pool.shutdown(cancel_futures=True)
+
+
+def iter_pages(
+  file_path: str,
+  workers: int = PDF_WORKERS,
+  page_timeout: float = PDF_PAGE_TIMEOUT,
+  on_progress: Optional[Callable[[int, int], None]] = None
+) -> Iterator[str]:
+  """
+  Yield the text of every page, in page order, as soon as it is available.
+
+  With workers > 1 the pages are split into ranges and extracted across a
+  process pool, keeping only a few ranges in flight so memory stays flat;
+  otherwise they are extracted here, one after another (per-page timeouts
+  only apply in the pool).
+  """
+  reader = PdfReader(file_path)
+  num_pages = len(reader.pages)
+  logger.info("Found %d pages in %s", num_pages, file_path)
+
+  if workers <= 1 or num_pages < MIN_PARALLEL_PAGES:
     for i, page in enumerate(reader.pages):
       try:
-        if (i + 1) % 50 == 0 or (i + 1) == num_pages:
-          print(f"Extracting text: {i + 1}/{num_pages} pages...")
-          
-        page_text = page.extract_text()
-        if page_text:
-          text += page_text + "\n"
+        text = page.extract_text() or ""
       except Exception as page_err:
-        print(f"Warning: Could not extract page {i+1}: {page_err}")
-        continue
-    
-    if not text.strip():
-      print(f"Error: No readable text found in {file_path}")
+        logger.warning("Could not extract page %d: %s", i + 1, page_err)
+        text = ""
+      PDF_PAGES.inc()
+      if on_progress:
+        on_progress(i + 1, num_pages)
+      yield text
+    return
+  del reader
+
+  # A dead worker breaks the whole pool; the pages not yet yielded get
+  # one more try in a fresh pool. In-process extraction is not an option
+  # here, since whatever killed the worker would take the server down.
+  done = 0
+  for attempt in range(2):
+    pool = _get_pool(workers)
+    try:
+      for texts in _extract_in_pool(pool, file_path, done, num_pages, workers, page_timeout):
+        done += len(texts)
+        PDF_PAGES.inc(len(texts))
+        logger.debug("Extracted %d/%d pages", done, num_pages)
+        if on_progress:
+          on_progress(done, num_pages)
+        yield from texts
+      return
+    except BrokenProcessPool:
+      _discard_pool(pool)
+      if attempt:
+        raise
+      logger.warning("A PDF worker died on %s, retrying pages %d-%d in a new pool", file_path, done + 1, num_pages)
+
+
+def _extract_in_pool(
+  pool: ProcessPoolExecutor,
+  file_path: str,
+  first_page: int,
+  num_pages: int,
+  workers: int,
+  page_timeout: float
+) -> Iterator[list[str]]:
+  """Yield the texts of pages [first_page, num_pages), range by range, in order."""
+  # Several small ranges per worker so one slow range doesn't leave
+  # the other workers idle at the end
+  range_size = max(1, -(-(num_pages - first_page) // (workers * 4)))
+  ranges = iter([(start, min(start + range_size, num_pages)) for start in range(first_page, num_pages, range_size)])
+  in_flight = deque()
+
+  def submit_next():
+    next_range = next(ranges, None)
+    if next_range is not None:
+      in_flight.append(pool.submit(_extract_range, file_path, next_range[0], next_range[1], page_timeout))
+
+  for _ in range(workers * 2):
+    submit_next()
+
+  try:
+    while in_flight:
+      texts = in_flight.popleft().result()
+      submit_next()
+      yield texts
+  finally:
+    for future in in_flight:
+      future.cancel()
+
+
+def extract_pages(
+  file_path: str,
+  workers: int = PDF_WORKERS,
+  page_timeout: float = PDF_PAGE_TIMEOUT,
+  on_progress: Optional[Callable[[int, int], None]] = None
+) -> list[str]:
+  """
+  Extract the text of every page, in page order. See iter_pages.
+  """
+  return list(iter_pages(file_path, workers, page_timeout, on_progress))
+
+
+def process_pdf(file_path: str, on_progress: Optional[Callable[[int, int], None]] = None) -> list[str]:
+  """
+  Extracts text from PDF and splits into chunks.
+  Extraction and chunking are timed into PDF_EXTRACT_SECONDS and
+  CHUNKING_SECONDS.
+  on_progress, if given, is called with (pages_done, pages_total) after each page.
+  """
+  try:
+    with PDF_EXTRACT_SECONDS.time(span="pdf.extract") as span:
+      pages = extract_pages(file_path, on_progress=on_progress)
+      span["pages"] = len(pages)
+
+    if not any(page.strip() for page in pages):
+      logger.error("No readable text found in %s", file_path)
       return []
 
-    print(f"Chunking {len(text)} characters of text...")
-    chunks = chunk_text(text, chunk_size=1000, overlap=200)
-    print(f"Success: Extracted {len(chunks)} chunks.")
+    with CHUNKING_SECONDS.time(span="pdf.chunk") as span:
+      chunks = [chunk["text"] for chunk in iter_page_chunks(pages)]
+      span["chunks"] = len(chunks)
+    logger.info("Extracted %d chunks from %d pages of %s", len(chunks), len(pages), file_path)
     return chunks
 
   except Exception as e:
-    print(f"PyPDF2 Fatal Error: {str(e)}")
+    logger.exception("PyPDF2 fatal error on %s: %s", file_path, e)
     return []
+
+
+if __name__ == "__main__":
+  import argparse
+  import json
+  import time
+
+  parser = argparse.ArgumentParser(description="Time page extraction with different worker counts")
+  parser.add_argument("file", help="PDF to extract")
+  parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+  args = parser.parse_args()
+
+  results = []
+  baseline = None
+  for workers in args.workers:
+    shutdown_pool()
+    started = time.perf_counter()
+    pages = extract_pages(args.file, workers=workers)
+    elapsed = time.perf_counter() - started
+    baseline = baseline or elapsed
+    results.append({"workers": workers, "pages": len(pages), "seconds": elapsed, "speedup": baseline / elapsed})
+  shutdown_pool()
+  print(json.dumps(results, indent=2))
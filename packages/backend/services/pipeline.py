@@ -0,0 +1,146 @@
+"""
+Streaming ingestion pipeline: extract -> chunk -> embed -> store.
+
+Pages stream out of the PDF extractor into the chunker on a worker
+thread; chunks cross into the event loop through a bounded queue, are
+embedded in growing batches with a few requests in flight, and each batch
+is stored as soon as it is embedded. Memory stays flat in document size
+and the first chunks are searchable long before the last page is parsed.
+"""
+import asyncio
+import threading
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Optional
+
+from backend.config import PIPELINE_QUEUE_SIZE
+from backend.data.storage import add_chunks
+from backend.services.embedding import embed_stream
+from backend.services.pdf import iter_pages, PDF_EXTRACT_SECONDS, CHUNKING_SECONDS
+from backend.utils.chunker import iter_page_chunks
+from backend.utils.telemetry import registry, emit_span, TimedIterator
+
+_DONE = object()
+
+INGEST_CHUNKS = registry.counter("ingest_chunks_total", "Chunks through the ingestion pipeline", ("status",))
+STORE_SECONDS = registry.histogram("ingest_store_seconds", "Time to store one embedded batch of chunks")
+
+
+async def _stream_chunks(
+    file_path: str,
+    skip: int = 0,
+    on_progress: Optional[Callable[[int, int], None]] = None
+) -> AsyncIterator[dict]:
+    """
+    Yield chunks of a PDF (see iter_page_chunks) from a producer thread
+    through a bounded queue.
+    The first `skip` chunks are produced but not yielded.
+    Extraction and chunking time are recorded separately when it ends.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    stop = threading.Event()
+    failure = []
+    pages = TimedIterator(iter_pages(file_path, on_progress=on_progress))
+    chunks = TimedIterator(iter_page_chunks(pages))
+
+    def produce():
+        try:
+            for i, chunk in enumerate(chunks):
+                if stop.is_set():
+                    return
+                if i >= skip:
+                    # Blocks while the queue is full: backpressure on extraction
+                    asyncio.run_coroutine_threadsafe(queue.put(chunk), loop).result()
+        except Exception as e:
+            failure.append(e)
+        finally:
+            if not stop.is_set():
+                asyncio.run_coroutine_threadsafe(queue.put(_DONE), loop).result()
+
+    producer = loop.run_in_executor(None, produce)
+    try:
+        while True:
+            chunk = await queue.get()
+            if chunk is _DONE:
+                break
+            yield chunk
+        await producer
+        if failure:
+            raise failure[0]
+    finally:
+        if not producer.done():
+            stop.set()
+            # Free a slot so a producer blocked on put() can see the stop flag
+            while not queue.empty():
+                queue.get_nowait()
+        # Time inside the chunker includes pulling pages from the extractor
+        PDF_EXTRACT_SECONDS.observe(pages.seconds)
+        CHUNKING_SECONDS.observe(chunks.seconds - pages.seconds)
+        emit_span("pdf.extract", pages.seconds, pages=pages.items)
+        emit_span("pdf.chunk", chunks.seconds - pages.seconds, chunks=chunks.items)
+
+
+async def ingest_pdf(
+    file_path: str,
+    source_doc: str,
+    document_id: str,
+    skip_chunks: int = 0,
+    start_index: int = 0,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+    on_batch: Optional[Callable[[dict], Awaitable[None]]] = None
+) -> dict:
+    """
+    Extract, chunk, embed and store a PDF as a stream.
+
+    Args:
+        file_path: Local path of the PDF
+        source_doc: Source filename recorded on each chunk
+        document_id: D1 document ID, or a local_document_id() for the local store
+        skip_chunks: Chunks at the start that are already stored (resume)
+        start_index: chunk_index for the first stored chunk
+        on_progress: Called with (pages_done, pages_total)
+        on_batch: Awaited with the running totals after each stored batch
+
+    Returns:
+        dict with chunks_seen, chunks_stored and failed_chunks
+    """
+    stats = {
+        "chunks_seen": skip_chunks,
+        "chunks_stored": start_index,
+        "failed_chunks": []
+    }
+    chunks = _stream_chunks(file_path, skip=skip_chunks, on_progress=on_progress)
+    # Chunks whose text has gone to the embedder, in order, waiting for
+    # their vectors
+    pending = deque()
+
+    async def texts():
+        async for chunk in chunks:
+            pending.append(chunk)
+            yield chunk["text"]
+
+    batches = embed_stream(texts())
+    try:
+        async for batch_texts, results in batches:
+            embedded = []
+            for offset, result in enumerate(results):
+                chunk = pending.popleft()
+                if result["embedding"]:
+                    embedded.append((chunk, result["embedding"]))
+                else:
+                    stats["failed_chunks"].append({"chunk_index": stats["chunks_seen"] + offset, "error": result["error"]})
+            with STORE_SECONDS.time(span="ingest.store") as span:
+                stored = await add_chunks(
+                    embedded, source_doc, document_id=document_id, start_index=stats["chunks_stored"]
+                )
+                span["chunks"] = stored
+            stats["chunks_stored"] += stored
+            INGEST_CHUNKS.inc(stored, status="stored")
+            INGEST_CHUNKS.inc(len(batch_texts) - len(embedded), status="failed")
+            stats["chunks_seen"] += len(batch_texts)
+            if on_batch:
+                await on_batch(stats)
+    finally:
+        await batches.aclose()
+        await chunks.aclose()
+    return stats
@@ -1,29 +1,109 @@
+import asyncio
+import contextvars
+import logging
+import threading
+import time
 import boto3
 from botocore.config import Config
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from backend.config import (
     CF_ACCOUNT_ID,
     R2_ACCESS_KEY_ID,
     R2_SECRET_ACCESS_KEY,
     R2_BUCKET_NAME,
-    R2_PUBLIC_URL
+    R2_PUBLIC_URL,
+    R2_MAX_WORKERS,
+    R2_MAX_POOL_CONNECTIONS,
+    R2_UPLOAD_CONCURRENCY
 )
+from backend.utils.telemetry import registry, emit_span
+from collections import OrderedDict
+from typing import AsyncIterator
 import uuid
 from datetime import datetime
 
+logger = logging.getLogger(__name__)
+
+R2_SECONDS = registry.histogram("r2_request_seconds", "Latency of R2 API calls", ("operation", "status"))
+
+# boto3 is blocking; async callers run R2 calls on this bounded pool so
+# they never stall the event loop or spawn unbounded threads.
+_executor = ThreadPoolExecutor(max_workers=R2_MAX_WORKERS, thread_name_prefix="r2")
+
+# Presigned URLs are reused until this close to expiry (at most half
+# their lifetime), so a cached URL always has time left to be used
+PRESIGN_REFRESH_MARGIN = 300
+PRESIGN_CACHE_SIZE = 10000
+
+# Process-wide client; boto3 clients are thread-safe and own a
+# connection pool, so one is shared by every executor thread
+_client = None
+_client_lock = threading.Lock()
+
+# (r2_key, expires_in) -> (url, refresh_at)
+_presigned = OrderedDict()
+_presigned_lock = threading.Lock()
+
+async def _run(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    # Carry the caller's context (its trace id) into the worker thread
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(_executor, partial(context.run, func, *args, **kwargs))
+
+def _start_timer(context: dict, **kwargs):
+    context["telemetry_started"] = time.perf_counter()
+
+def _stop_timer(event_name: str, context: dict, http_response=None, **kwargs):
+    """Record one S3 API call, from botocore's after-call(-error) events."""
+    started = context.get("telemetry_started")
+    if started is None:
+        return
+    duration = time.perf_counter() - started
+    operation = event_name.rsplit(".", 1)[-1]
+    status = "ok" if http_response is not None and http_response.status_code < 400 else "error"
+    R2_SECONDS.observe(duration, operation=operation, status=status)
+    emit_span("r2.request", duration, operation=operation, status=status)
+
 def get_r2_client():
     """
-    Create and return a boto3 S3 client configured for Cloudflare R2.
-    """
-    return boto3.client(
-        's3',
-        endpoint_url=f'https://{CF_ACCOUNT_ID}.r2.cloudflarestorage.com',
-        aws_access_key_id=R2_ACCESS_KEY_ID,
-        aws_secret_access_key=R2_SECRET_ACCESS_KEY,
-        config=Config(
-            signature_version='s3v4',
-            retries={'max_attempts': 3}
-        )
-    )
+    Return the shared boto3 S3 client for Cloudflare R2, creating it on
+    first use.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = boto3.client(
+                    's3',
+                    endpoint_url=f'https://{CF_ACCOUNT_ID}.r2.cloudflarestorage.com',
+                    aws_access_key_id=R2_ACCESS_KEY_ID,
+                    aws_secret_access_key=R2_SECRET_ACCESS_KEY,
+                    config=Config(
+                        signature_version='s3v4',
+                        retries={'max_attempts': 3},
+                        max_pool_connections=R2_MAX_POOL_CONNECTIONS
+                    )
+                )
+                _client.meta.events.register("before-call.s3", _start_timer)
+                _client.meta.events.register("after-call.s3", _stop_timer)
+                _client.meta.events.register("after-call-error.s3", _stop_timer)
+    return _client
+
+def new_r2_key(original_filename: str) -> str:
+    """
+    Build a unique, date-prefixed object key for an upload.
+    """
+    timestamp = datetime.utcnow().strftime('%Y/%m/%d')
+    unique_id = str(uuid.uuid4())[:8]
+    safe_filename = original_filename.replace(' ', '_')
+    return f"uploads/{timestamp}/{unique_id}_{safe_filename}"
+
+def _object_url(r2_key: str) -> str:
+    """
+    Public URL of an uploaded object, or a presigned URL valid for 7 days.
+    """
+    return get_r2_url(r2_key, expires_in=604800)
 
 def upload_to_r2(file_bytes: bytes, original_filename: str, content_type: str = "application/pdf") -> dict:
     """
@@ -38,11 +118,7 @@ def upload_to_r2(file_bytes: bytes, original_filename: str, content_type: str =
         dict with r2_key, r2_url, and file_size
     """
     client = get_r2_client()
-    
-    timestamp = datetime.utcnow().strftime('%Y/%m/%d')
-    unique_id = str(uuid.uuid4())[:8]
-    safe_filename = original_filename.replace(' ', '_')
-    r2_key = f"uploads/{timestamp}/{unique_id}_{safe_filename}"
+    r2_key = new_r2_key(original_filename)
     
     # Upload to R2
     client.put_object(
@@ -52,26 +128,16 @@ def upload_to_r2(file_bytes: bytes, original_filename: str, content_type: str =
         ContentType=content_type
     )
     
-    # Generate URL
-    if R2_PUBLIC_URL:
-        r2_url = f"{R2_PUBLIC_URL.rstrip('/')}/{r2_key}"
-    else:
-        # Generate a presigned URL valid for 7 days
-        r2_url = client.generate_presigned_url(
-            'get_object',
-            Params={'Bucket': R2_BUCKET_NAME, 'Key': r2_key},
-            ExpiresIn=604800  # 7 days
-        )
-    
     return {
         "r2_key": r2_key,
-        "r2_url": r2_url,
+        "r2_url": _object_url(r2_key),
         "file_size": len(file_bytes)
     }
 
 def get_r2_url(r2_key: str, expires_in: int = 3600) -> str:
     """
     Generate a presigned URL for accessing a file in R2.
+    URLs are cached and reused until shortly before they expire.
     
     Args:
         r2_key: The key/path of the file in R2
@@ -82,13 +148,45 @@ def get_r2_url(r2_key: str, expires_in: int = 3600) -> str:
     """
     if R2_PUBLIC_URL:
         return f"{R2_PUBLIC_URL.rstrip('/')}/{r2_key}"
-    
-    client = get_r2_client()
-    return client.generate_presigned_url(
+
+    cache_key = (r2_key, expires_in)
+    now = time.monotonic()
+    with _presigned_lock:
+        cached = _presigned.get(cache_key)
+        if cached and cached[1] > now:
+            _presigned.move_to_end(cache_key)
+            return cached[0]
+
+    url = get_r2_client().generate_presigned_url(
         'get_object',
         Params={'Bucket': R2_BUCKET_NAME, 'Key': r2_key},
         ExpiresIn=expires_in
     )
+    refresh_at = now + expires_in - min(PRESIGN_REFRESH_MARGIN, expires_in / 2)
+    with _presigned_lock:
+        _presigned[cache_key] = (url, refresh_at)
+        _presigned.move_to_end(cache_key)
+        while len(_presigned) > PRESIGN_CACHE_SIZE:
+            _presigned.popitem(last=False)
+    return url
+
+def get_r2_urls(r2_keys: list, expires_in: int = 3600) -> dict:
+    """
+    Presigned URLs for many files, served from the cache where possible.
+    Signing is local HMAC work, so one pass on one thread beats fanning
+    out across the pool.
+    
+    Returns:
+        dict of r2_key -> URL
+    """
+    return {r2_key: get_r2_url(r2_key, expires_in) for r2_key in r2_keys}
+
+def _forget_urls(r2_keys: list):
+    """Drop cached presigned URLs for deleted objects."""
+    keys = set(r2_keys)
+    with _presigned_lock:
+        for cache_key in [k for k in _presigned if k[0] in keys]:
+            del _presigned[cache_key]
 
 def download_from_r2(r2_key: str) -> bytes:
     """
@@ -116,4 +214,119 @@ def delete_from_r2(r2_key: str) -> bool:
     """
     client = get_r2_client()
     client.delete_object(Bucket=R2_BUCKET_NAME, Key=r2_key)
+    _forget_urls([r2_key])
     return True
+
+async def upload_to_r2_async(file_bytes: bytes, original_filename: str, content_type: str = "application/pdf") -> dict:
+    """Async version of upload_to_r2."""
+    return await _run(upload_to_r2, file_bytes, original_filename, content_type)
+
+async def get_r2_url_async(r2_key: str, expires_in: int = 3600) -> str:
+    """Async version of get_r2_url."""
+    return await _run(get_r2_url, r2_key, expires_in)
+
+async def download_from_r2_async(r2_key: str) -> bytes:
+    """Async version of download_from_r2."""
+    return await _run(download_from_r2, r2_key)
+
+async def delete_from_r2_async(r2_key: str) -> bool:
+    """Async version of delete_from_r2."""
+    return await _run(delete_from_r2, r2_key)
+
+async def get_r2_urls_async(r2_keys: list, expires_in: int = 3600) -> dict:
+    """Async version of get_r2_urls."""
+    return await _run(get_r2_urls, r2_keys, expires_in)
+
+async def upload_stream_to_r2_async(
+    parts: AsyncIterator[bytes],
+    original_filename: str,
+    content_type: str = "application/pdf"
+) -> dict:
+    """
+    Upload a file to R2 as it arrives, holding at most a few parts in memory.
+
+    Parts go up with an S3 multipart upload, R2_UPLOAD_CONCURRENCY at a
+    time; a file that fits in a single part is sent with one put_object.
+    R2 requires every part but the last to be the same size, so `parts`
+    should yield fixed-size blocks (see R2_PART_SIZE). If anything fails,
+    including the caller raising from inside `parts`, the multipart upload
+    is aborted so no orphaned parts are left in the bucket.
+
+    Args:
+        parts: Async iterator of file content blocks, in order
+        original_filename: Original name of the file
+        content_type: MIME type of the file
+
+    Returns:
+        dict with r2_key, r2_url, and file_size
+    """
+    client = await _run(get_r2_client)
+    r2_key = new_r2_key(original_filename)
+    semaphore = asyncio.Semaphore(R2_UPLOAD_CONCURRENCY)
+    upload_id = None
+    tasks = []
+    size = 0
+
+    async def send(part_number: int, data: bytes) -> dict:
+        try:
+            response = await _run(
+                client.upload_part,
+                Bucket=R2_BUCKET_NAME,
+                Key=r2_key,
+                UploadId=upload_id,
+                PartNumber=part_number,
+                Body=data
+            )
+            return {"PartNumber": part_number, "ETag": response["ETag"]}
+        finally:
+            semaphore.release()
+
+    async def queue_part(data: bytes):
+        # Waits while R2_UPLOAD_CONCURRENCY parts are in flight
+        await semaphore.acquire()
+        for task in tasks:
+            if task.done() and task.exception():
+                semaphore.release()
+                raise task.exception()
+        tasks.append(asyncio.create_task(send(len(tasks) + 1, data)))
+
+    # Hold one part back: a file that ends within it needs no multipart upload
+    held = None
+    try:
+        async for data in parts:
+            size += len(data)
+            if held is not None:
+                if upload_id is None:
+                    response = await _run(client.create_multipart_upload, Bucket=R2_BUCKET_NAME, Key=r2_key, ContentType=content_type)
+                    upload_id = response["UploadId"]
+                await queue_part(held)
+            held = data
+
+        if upload_id is None:
+            await _run(client.put_object, Bucket=R2_BUCKET_NAME, Key=r2_key, Body=held or b"", ContentType=content_type)
+        else:
+            await queue_part(held)
+            completed = await asyncio.gather(*tasks)
+            await _run(
+                client.complete_multipart_upload,
+                Bucket=R2_BUCKET_NAME,
+                Key=r2_key,
+                UploadId=upload_id,
+                MultipartUpload={"Parts": completed}
+            )
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if upload_id is not None:
+            try:
+                await _run(client.abort_multipart_upload, Bucket=R2_BUCKET_NAME, Key=r2_key, UploadId=upload_id)
+            except Exception as abort_err:
+                logger.error("Could not abort multipart upload of %s: %s", r2_key, abort_err)
+        raise
+
+    return {
+        "r2_key": r2_key,
+        "r2_url": await _run(_object_url, r2_key),
+        "file_size": size
+    }
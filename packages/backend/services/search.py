@@ -1,31 +1,157 @@
 """
 Search service for finding similar chunks.
-Uses cosine similarity for vector matching.
+Uses cosine similarity for vector matching, fused with BM25 text
+matching by reciprocal rank fusion when a query text is given.
 """
-from backend.data.storage import get_all_chunks
-from backend.services.embedding import cosine_similarity
+import asyncio
+import re
+from typing import Optional
+from backend.config import HYBRID_SEARCH_ENABLED, RRF_K
+from backend.data.storage import get_search_indexes, get_user_document_ids, get_chunk_partitions
+from backend.utils.telemetry import registry
 
+# Candidates taken from each ranking before fusion, per requested result
+FUSION_DEPTH = 4
 
-async def search_similar_chunks(query_vector: list, limit: int = 3):
+SEARCH_SECONDS = registry.histogram(
+    "search_seconds", "Time to rank chunks for a query, index refresh excluded", ("mode",)
+)
+
+# Identifier shapes: letters and digits mixed in one token (AB-125,
+# 0x80070005, X1Y2), underscore-joined names (ERR_CONN_RESET) and long
+# digit runs (serial numbers). Plain numbers ("chapter 3", "2023") and
+# ordinals ("3rd", "1990s") are ordinary words.
+_IDENTIFIER = re.compile(
+    r"^(?:(?=[^A-Za-z]*[A-Za-z])(?=[^0-9]*[0-9])[A-Za-z0-9]+(?:[-./:][A-Za-z0-9]+)*"
+    r"|[A-Za-z0-9]+(?:_[A-Za-z0-9]+)+"
+    r"|[0-9]{6,})$"
+)
+_ORDINAL = re.compile(r"^[0-9]+(?:st|nd|rd|th|s)$", re.IGNORECASE)
+
+
+def looks_like_identifier(query: str) -> bool:
+    """
+    True for short queries built around an identifier, which lexical
+    search answers better than embeddings. Callers fall back to hybrid
+    search when the lexical search finds nothing.
+    """
+    tokens = [token.strip("\"'`()[]{}?!,;") for token in query.split()]
+    tokens = [token for token in tokens if token]
+    return 0 < len(tokens) <= 3 and any(
+        _IDENTIFIER.match(token) and not _ORDINAL.match(token) for token in tokens
+    )
+
+
+async def resolve_scope(document_ids: Optional[list] = None, user_id: Optional[str] = None) -> Optional[list]:
+    """
+    Turn request filters into the list of document partitions to search.
+    None means no filter (search everything).
+    """
+    if user_id is not None:
+        owned = await get_user_document_ids(user_id)
+        if document_ids is None:
+            document_ids = owned
+        else:
+            owned = set(owned)
+            document_ids = [doc_id for doc_id in document_ids if doc_id in owned]
+    if document_ids is None:
+        return None
+    return await get_chunk_partitions(document_ids)
+
+
+def _result(meta: dict, vectors: Optional[dict], **scores) -> dict:
+    """A search result: the chunk metadata, its scores and, if collected, its vector."""
+    result = {**meta, **scores}
+    if vectors is not None:
+        result["vector"] = vectors.get(id(meta))
+    return result
+
+
+def _fuse(rankings: list, limit: int, vectors: Optional[dict] = None) -> list:
+    """
+    Reciprocal rank fusion: each ranking adds 1 / (RRF_K + rank) to an
+    entry's score. Entries are matched by identity of their metadata.
+    """
+    fused = {}
+    for name, ranking in rankings:
+        for rank, (score, meta) in enumerate(ranking, start=1):
+            entry = fused.setdefault(id(meta), {"meta": meta, "score": 0.0, "vector_score": None, "lexical_score": None})
+            entry["score"] += 1.0 / (RRF_K + rank)
+            entry[name] = score
+    best = sorted(fused.values(), key=lambda e: e["score"], reverse=True)[:limit]
+    return [
+        _result(e["meta"], vectors, score=e["score"], vector_score=e["vector_score"], lexical_score=e["lexical_score"])
+        for e in best
+    ]
+
+
+def _merge(matches: list, k: int) -> list:
+    matches.sort(key=lambda m: m[0], reverse=True)
+    return matches[:k]
+
+
+async def search_similar_chunks(
+    query_vector: Optional[list],
+    limit: int = 3,
+    document_ids: Optional[list] = None,
+    query_text: Optional[str] = None,
+    with_vectors: bool = False
+):
     """
     Finds the top 'limit' chunks most similar to the query vector.
-    Searches both D1 and in-memory chunks.
-    """
-    all_chunks = await get_all_chunks()
-    
-    if not all_chunks:
-        return []
-    
-    results = []
-    for chunk in all_chunks:
-        score = cosine_similarity(query_vector, chunk['vector'])
-        results.append({
-            "score": score,
-            "chunk": chunk
-        })
-    
-    results.sort(key=lambda x: x['score'], reverse=True)
-    
-    top_matches = [item['chunk'] for item in results[:limit]]
-    
-    return top_matches
\ No newline at end of file
+    Searches both D1 and in-memory chunks, restricted to document_ids
+    when given.
+
+    With query_text the vector ranking is fused with a BM25 ranking of
+    the chunk text; with query_text and no vector the search is lexical
+    only. with_vectors adds each result's stored unit-length embedding
+    as "vector" (None for lexical-only matches).
+    """
+    indexes = await get_search_indexes()
+    hybrid = HYBRID_SEARCH_ENABLED and query_text
+    depth = limit * FUSION_DEPTH if hybrid else limit
+    mode = "vector" if not hybrid else "lexical" if query_vector is None else "hybrid"
+    with SEARCH_SECONDS.time(span="search", mode=mode) as span:
+        # The matrix scan and BM25 scoring are CPU-bound; keep them off
+        # the event loop so concurrent requests aren't stalled. Each
+        # index holds its read lock while ranking, so changes made on the
+        # loop meanwhile wait instead of racing the scan
+        results = await asyncio.to_thread(
+            _rank, indexes, query_vector, query_text if hybrid else None, limit, depth, document_ids, with_vectors
+        )
+        span["results"] = len(results)
+    return results
+
+
+def _rank(
+    indexes: list,
+    query_vector,
+    query_text: Optional[str],
+    limit: int,
+    depth: int,
+    document_ids,
+    with_vectors: bool = False
+) -> list:
+    """Vector ranking, or its fusion with BM25 when query_text is given."""
+    vector_matches = []
+    # id(metadata) -> stored vector, when asked for
+    vectors = {} if with_vectors else None
+    if query_vector is not None:
+        for index in indexes:
+            for match in index.search(query_vector, depth, partitions=document_ids, with_vectors=with_vectors):
+                vector_matches.append(match[:2])
+                if with_vectors:
+                    vectors[id(match[1])] = match[2]
+        vector_matches = _merge(vector_matches, depth)
+
+    if not query_text:
+        return [_result(meta, vectors, score=score) for score, meta in vector_matches]
+
+    lexical_matches = []
+    for index in indexes:
+        lexical_matches.extend(index.search_text(query_text, depth, partitions=document_ids))
+    lexical_matches = _merge(lexical_matches, depth)
+
+    if query_vector is None:
+        return [_result(meta, vectors, score=score, lexical_score=score) for score, meta in lexical_matches[:limit]]
+    return _fuse([("vector_score", vector_matches), ("lexical_score", lexical_matches)], limit, vectors)
@@ -0,0 +1,151 @@
+"""
+Local SQLite storage backend, a drop-in for Cloudflare D1 on single-node
+deployments and in development.
+
+Queries take the same SQL and return the same response shape as the D1
+REST API, so every function in services/d1.py works unchanged against it.
+The database runs in WAL mode, so readers don't wait on the writer, and
+embeddings are stored as BLOBs instead of base64 text.
+"""
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from backend.utils.telemetry import registry, emit_span
+
+logger = logging.getLogger(__name__)
+
+SQLITE_SECONDS = registry.histogram("sqlite_query_seconds", "Latency of local SQLite queries", ("status",))
+
+
+class SQLiteBackend:
+    """
+    One SQLite connection, used from a single worker thread so queries
+    never block the event loop and never run concurrently on the
+    connection. sqlite3 keeps a cache of prepared statements per
+    connection, so repeated queries skip parsing.
+
+    Args:
+        path: Database file, created with its directory if missing
+        cached_statements: Prepared statements kept by the connection
+    """
+
+    name = "sqlite"
+    # Embeddings go in the BLOB column as raw bytes
+    binary_embeddings = True
+
+    def __init__(self, path: str, cached_statements: int = 256):
+        self.path = path
+        self.cached_statements = cached_statements
+        self._db: Optional[sqlite3.Connection] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        db = sqlite3.connect(self.path, check_same_thread=False, cached_statements=self.cached_statements)
+        db.row_factory = sqlite3.Row
+        db.execute("PRAGMA journal_mode=WAL;")
+        db.execute("PRAGMA synchronous=NORMAL;")
+        # D1 enforces foreign keys (ON DELETE CASCADE from documents to chunks)
+        db.execute("PRAGMA foreign_keys=ON;")
+        db.execute("PRAGMA busy_timeout=5000;")
+        logger.info("Opened SQLite database %s", self.path)
+        return db
+
+    def _open(self):
+        with self._lock:
+            if self._db is None:
+                self._db = self._connect()
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+
+    async def open(self):
+        """Open the connection and its worker thread if not open yet."""
+        self._open()
+
+    async def close(self):
+        """Wait for pending queries, then close the connection."""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    @staticmethod
+    def _response(cursor: sqlite3.Cursor, rows: list) -> dict:
+        """The D1 REST API response shape."""
+        return {
+            "success": True,
+            "result": [{
+                "results": [dict(row) for row in rows],
+                "success": True,
+                "meta": {"changes": max(cursor.rowcount, 0), "last_row_id": cursor.lastrowid}
+            }]
+        }
+
+    def _execute(self, sql: str, params: list) -> dict:
+        try:
+            cursor = self._db.execute(sql, params)
+            rows = cursor.fetchall()
+            self._db.commit()
+            return self._response(cursor, rows)
+        except Exception:
+            self._db.rollback()
+            raise
+
+    def _execute_many(self, sql: str, rows: list) -> int:
+        # One transaction for the whole batch: a single fsync, not one per row
+        try:
+            cursor = self._db.executemany(sql, rows)
+            self._db.commit()
+            return max(cursor.rowcount, 0)
+        except Exception:
+            self._db.rollback()
+            raise
+
+    async def _run(self, span: str, sql: str, func, *args):
+        self._open()
+        started = time.perf_counter()
+        status = "error"
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+            status = "ok"
+            return result
+        finally:
+            duration = time.perf_counter() - started
+            SQLITE_SECONDS.observe(duration, status=status)
+            emit_span(span, duration, status=status, statement=sql.split(None, 1)[0].upper() if sql.strip() else "")
+
+    async def execute(self, sql: str, params: list = None) -> dict:
+        """
+        Run one statement and commit.
+
+        Args:
+            sql: SQL query string
+            params: Optional list of parameters for the prepared statement
+
+        Returns:
+            Response dict shaped like the D1 REST API's
+        """
+        return await self._run("sqlite.query", sql, self._execute, sql, params or [])
+
+    async def insert_rows(self, table: str, columns: tuple, rows: list) -> int:
+        """
+        Insert many rows in one transaction with a single prepared statement.
+
+        Returns:
+            Number of rows written
+        """
+        if not rows:
+            return 0
+        sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))});"
+        return await self._run("sqlite.insert", sql, self._execute_many, sql, rows)
@@ -0,0 +1,28 @@
+import os
+
+import pytest
+
+# Read at import time: fake credentials, no on-disk embedding cache and
+# in-process PDF extraction
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("EMBEDDING_CACHE_PATH", "")
+os.environ.setdefault("PDF_WORKERS", "1")
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """
+    The app against local fakes of OpenAI, D1 and R2, with its data
+    directories under tmp_path.
+    """
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("data/uploads")
+    from fastapi.testclient import TestClient
+    from backend.benchmarks import fakes
+
+    fakes.install(dim=64)
+    from backend.main import app
+
+    with TestClient(app) as test_client:
+        test_client.post("/api/v1/init-db")
+        yield test_client
@@ -0,0 +1,60 @@
+import json
+
+import numpy as np
+import pytest
+
+from backend.utils.embedding_codec import (
+    FORMAT_FLOAT16,
+    FORMAT_FLOAT32,
+    decode_embedding,
+    decode_embeddings,
+    embedding_format,
+    encode_embedding,
+    encode_embedding_blob,
+)
+
+VECTOR = np.random.default_rng(0).normal(size=64).astype(np.float32)
+
+
+def test_float32_text_round_trip_is_exact():
+    encoded = encode_embedding(VECTOR)
+    assert embedding_format(encoded) == FORMAT_FLOAT32
+    assert np.array_equal(decode_embedding(encoded), VECTOR)
+
+
+def test_float16_text_round_trip_is_close():
+    encoded = encode_embedding(VECTOR, FORMAT_FLOAT16)
+    assert embedding_format(encoded) == FORMAT_FLOAT16
+    assert np.allclose(decode_embedding(encoded), VECTOR, atol=1e-2)
+
+
+@pytest.mark.parametrize("wrap", [bytes, memoryview])
+def test_blob_round_trip_is_exact(wrap):
+    blob = wrap(encode_embedding_blob(VECTOR))
+    assert embedding_format(blob) == FORMAT_FLOAT32
+    assert np.array_equal(decode_embedding(blob), VECTOR)
+
+
+def test_legacy_json_rows_still_decode():
+    legacy = json.dumps(VECTOR.tolist())
+    assert embedding_format(legacy) == "json"
+    assert np.allclose(decode_embedding(legacy), VECTOR)
+
+
+def test_decode_embeddings_mixes_formats():
+    values = [encode_embedding(VECTOR), encode_embedding_blob(VECTOR), json.dumps(VECTOR.tolist())]
+    matrix, kept = decode_embeddings(values)
+    assert kept == [0, 1, 2]
+    assert matrix.shape == (3, 64)
+    assert np.allclose(matrix, VECTOR)
+
+
+def test_decode_embeddings_skips_rows_of_another_dimension():
+    old = np.ones(32, dtype=np.float32)
+    values = [encode_embedding(VECTOR), encode_embedding(old), encode_embedding_blob(VECTOR)]
+    matrix, kept = decode_embeddings(values)
+    assert kept == [0, 2]
+    assert matrix.shape == (2, 64)
+
+    matrix, kept = decode_embeddings(values, dim=32)
+    assert kept == [1] and np.array_equal(matrix[0], old)
@@ -0,0 +1,131 @@
+import threading
+
+import numpy as np
+
+from backend.data.index import PartitionedIndex, VectorIndex
+from backend.data.ivf import IVFIndex
+
+
+def _data(n=2000, dim=32, seed=0):
+    rng = np.random.default_rng(seed)
+    vectors = rng.normal(size=(n, dim)).astype(np.float32)
+    return vectors, [{"row": i} for i in range(n)]
+
+
+def _rows(matches):
+    return [meta["row"] for _, meta in matches]
+
+
+def test_ann_probing_every_list_matches_exact_search():
+    vectors, metadata = _data()
+    index = VectorIndex(ann=IVFIndex(nlist=8, min_size=0))
+    index.add_many(vectors, metadata)
+    index.wait_for_ann()
+    assert index.ann.trained
+
+    for query in vectors[:20]:
+        exact = index.search(query, 3, exact=True)
+        full_probe = index.search(query, 3, nprobe=8)
+        assert _rows(full_probe) == _rows(exact)
+        assert np.allclose([s for s, _ in full_probe], [s for s, _ in exact])
+
+
+def test_ann_trains_off_the_caller_and_drops_a_run_over_moved_rows(monkeypatch):
+    vectors, metadata = _data()
+    release = threading.Event()
+    train = IVFIndex.train
+
+    def blocked_train(engine, rows):
+        release.wait()
+        train(engine, rows)
+
+    monkeypatch.setattr(IVFIndex, "train", blocked_train)
+    index = VectorIndex(ann=IVFIndex(nlist=8, min_size=0))
+    # Returns while training is still blocked; search stays exact meanwhile
+    index.add_many(vectors, metadata)
+    assert not index.ann.trained
+    assert _rows(index.search(vectors[3], 1)) == [3]
+
+    index.remove_if(lambda meta: meta["row"] % 2 == 0)
+    index.add_many(_data(n=10, seed=1)[0], [{"row": 2000 + i} for i in range(10)])
+    release.set()
+    index.wait_for_ann()
+    assert index.ann.trained and index.ann._count == len(index) == 1010
+    for query in vectors[1:40:2]:
+        assert _rows(index.search(query, 3, nprobe=8)) == _rows(index.search(query, 3, exact=True))
+
+
+def test_int8_search_with_rerank_matches_exact_search():
+    vectors, metadata = _data()
+    exact_index = VectorIndex()
+    exact_index.add_many(vectors, metadata)
+    index = VectorIndex(quantization="int8", rerank=4)
+    index.add_many(vectors, metadata)
+
+    for query in vectors[:20]:
+        assert _rows(index.search(query, 3)) == _rows(exact_index.search(query, 3))
+
+
+def test_load_applies_quantization(tmp_path):
+    vectors, metadata = _data(n=50)
+    index = VectorIndex()
+    index.add_many(vectors, metadata)
+    index.save(str(tmp_path))
+
+    loaded = VectorIndex.load(str(tmp_path), quantization="int8", rerank=2)
+    assert loaded.quantized and loaded.rerank == 2
+    assert _rows(loaded.search(vectors[7], 1)) == [7]
+
+
+def _documents(index, vectors, sizes):
+    """Add consecutive rows of `vectors` as documents doc0, doc1, ... of the given sizes."""
+    start = 0
+    for n, size in enumerate(sizes):
+        index.add_many(vectors[start:start + size], [
+            {"document_id": f"doc{n}", "row": row} for row in range(start, start + size)
+        ])
+        start += size
+
+
+def test_small_documents_share_one_index_and_large_ones_get_their_own():
+    vectors, _ = _data(n=400)
+    index = PartitionedIndex(min_partition_size=100)
+    _documents(index, vectors, [30, 30, 60, 120])
+    assert set(index.partitions) == {"doc3"}
+    assert len(index.shared) == 120 and index.partition_names() == {"doc0", "doc1", "doc2", "doc3"}
+
+    # Growing past the threshold moves the document's rows out
+    index.add_many(vectors[240:290], [{"document_id": "doc2", "row": row} for row in range(240, 290)])
+    assert set(index.partitions) == {"doc2", "doc3"} and len(index.shared) == 60
+    assert sorted(meta["row"] for meta in index.partitions["doc2"].metadata) == list(range(60, 120)) + list(range(240, 290))
+
+    exact = VectorIndex()
+    exact.add_many(vectors[:290], [{"row": row} for row in range(290)])
+    for query in vectors[:20]:
+        assert _rows(index.search(query, 5)) == _rows(exact.search(query, 5))
+
+
+def test_scoped_search_only_returns_the_named_documents():
+    vectors, _ = _data(n=300)
+    index = PartitionedIndex(min_partition_size=100)
+    _documents(index, vectors, [40, 40, 40, 180])
+    for query in vectors[::15]:
+        for scope in (["doc1"], ["doc0", "doc3"], ["missing"]):
+            matches = index.search(query, 10, partitions=scope)
+            assert {meta["document_id"] for _, meta in matches} <= set(scope)
+            expected = [meta for meta in index.metadata if meta["document_id"] in scope]
+            assert len(matches) == min(10, len(expected))
+
+
+def test_removing_and_renaming_shared_documents():
+    vectors, _ = _data(n=120)
+    index = PartitionedIndex(min_partition_size=100)
+    _documents(index, vectors, [40, 40, 40])
+
+    assert index.remove_where("document_id", "doc0") == 40
+    assert index.remove_from("doc1", lambda meta: meta["row"] >= 60) == 20
+    assert index.rename("doc1", "doc2") == 20
+    assert index.partition_names() == {"doc2"} and len(index) == 60
+    assert {meta["document_id"] for meta in index.metadata} == {"doc2"}
+    assert _rows(index.search(vectors[45], 1, partitions=["doc2"])) == [45]
+    assert index.search(vectors[45], 1, partitions=["doc1"]) == []
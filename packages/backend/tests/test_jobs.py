@@ -0,0 +1,57 @@
+import asyncio
+import json
+import os
+import uuid
+from datetime import datetime, timedelta
+
+from backend.services.jobs import JobQueue
+
+
+def _write_job(jobs_dir, stage="processing", age=timedelta(0)):
+    job_id = str(uuid.uuid4())
+    updated = (datetime.utcnow() - age).isoformat()
+    with open(os.path.join(jobs_dir, f"{job_id}.json"), "w") as f:
+        json.dump({"id": job_id, "document_id": "d", "stage": stage, "created_at": updated, "updated_at": updated}, f)
+    return job_id
+
+
+def test_each_unfinished_job_is_resumed_by_one_process(tmp_path):
+    jobs_dir = str(tmp_path)
+    job_id = _write_job(jobs_dir)
+    # workers=0: claim and queue, but don't run the pipeline
+    first, second = JobQueue(jobs_dir, workers=0), JobQueue(jobs_dir, workers=0)
+
+    async def run():
+        await first.start()
+        await second.start()
+        assert list(first.jobs) == [job_id] and second.jobs == {}
+        assert first._queue.qsize() == 1 and second._queue.qsize() == 0
+        # Status is served by the process that does not own the job too
+        assert second.get(job_id)["stage"] == "processing"
+
+        # Once the owner exits, the next process to start takes the job over
+        await first.stop()
+        third = JobQueue(jobs_dir, workers=0)
+        await third.start()
+        assert list(third.jobs) == [job_id]
+        await second.stop()
+        await third.stop()
+
+    asyncio.run(run())
+
+
+def test_finished_jobs_are_read_from_disk_and_pruned_when_expired(tmp_path):
+    jobs_dir = str(tmp_path)
+    recent = _write_job(jobs_dir, stage="completed")
+    expired = _write_job(jobs_dir, stage="failed", age=timedelta(hours=2))
+    queue = JobQueue(jobs_dir, workers=0, retention_hours=1)
+
+    async def run():
+        await queue.start()
+        assert queue.jobs == {}
+        assert queue.get(recent)["stage"] == "completed"
+        assert queue.get(expired) is None and queue.get("../secrets") is None
+        await queue.stop()
+
+    asyncio.run(run())
+    assert sorted(os.listdir(jobs_dir)) == [f"{recent}.json"]
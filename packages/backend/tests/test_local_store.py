@@ -0,0 +1,117 @@
+import asyncio
+import json
+import os
+import shutil
+
+import numpy as np
+
+from backend.data.local_store import MANIFEST, METADATA, VECTORS, LocalStore
+
+
+def _add(store, document_id, vectors, start=0):
+    asyncio.run(store.add_many(vectors, [
+        {"document_id": document_id, "text": f"chunk {start + i}", "chunk_index": start + i}
+        for i in range(len(vectors))
+    ]))
+
+
+def test_committed_rows_survive_a_reload(tmp_path):
+    vectors = np.random.default_rng(0).normal(size=(10, 16)).astype(np.float32)
+    store = LocalStore(str(tmp_path))
+    store.load()
+    _add(store, "local:a", vectors[:6])
+    _add(store, "local:a", vectors[6:], start=6)
+
+    reloaded = LocalStore(str(tmp_path))
+    reloaded.load()
+    assert len(reloaded.index) == 10
+    score, meta = reloaded.index.search(vectors[8], 1)[0]
+    assert meta["chunk_index"] == 8 and score > 0.999
+
+
+def test_bytes_past_the_manifest_are_ignored_and_overwritten(tmp_path):
+    vectors = np.random.default_rng(1).normal(size=(4, 8)).astype(np.float32)
+    store = LocalStore(str(tmp_path))
+    store.load()
+    _add(store, "local:a", vectors[:2])
+
+    # A writer that crashed before switching the manifest
+    path = store._path("local:a")
+    with open(os.path.join(path, MANIFEST)) as f:
+        manifest = json.load(f)
+    with open(os.path.join(path, VECTORS), "ab") as f:
+        f.write(b"\0" * 64)
+    with open(os.path.join(path, METADATA), "ab") as f:
+        f.write(b'{"document_id": "local:a", "text": "torn"')
+
+    reloaded = LocalStore(str(tmp_path))
+    reloaded.load()
+    assert [meta["text"] for meta in reloaded.index.metadata] == ["chunk 0", "chunk 1"]
+
+    _add(reloaded, "local:a", vectors[2:], start=2)
+    again = LocalStore(str(tmp_path))
+    again.load()
+    assert [meta["text"] for meta in again.index.metadata] == ["chunk 0", "chunk 1", "chunk 2", "chunk 3"]
+
+
+def test_load_sweeps_leftover_files(tmp_path):
+    store = LocalStore(str(tmp_path))
+    store.load()
+    _add(store, "local:a", np.ones((2, 4), dtype=np.float32))
+    path = store._path("local:a")
+    open(os.path.join(path, MANIFEST + ".tmp"), "w").close()
+
+    LocalStore(str(tmp_path)).load()
+    assert sorted(os.listdir(path)) == [".lock", MANIFEST, METADATA, VECTORS]
+
+
+def test_remove_document_deletes_files_and_registration(tmp_path):
+    store = LocalStore(str(tmp_path))
+    store.load()
+    _add(store, "local:a", np.ones((2, 4), dtype=np.float32))
+    store.register_document("a", {"document_id": "local:a"})
+
+    assert asyncio.run(store.remove_document("local:a")) == 2
+    assert len(store.index) == 0 and store.documents == {}
+
+    reloaded = LocalStore(str(tmp_path))
+    reloaded.load()
+    assert len(reloaded.index) == 0 and reloaded.documents == {}
+
+
+def test_refresh_extends_partitions_in_place_and_drops_deleted_ones(tmp_path):
+    vectors = np.random.default_rng(2).normal(size=(12, 8)).astype(np.float32)
+    writer = LocalStore(str(tmp_path))
+    writer.load()
+    _add(writer, "local:a", vectors[:4])
+    _add(writer, "local:b", vectors[4:6])
+    reader = LocalStore(str(tmp_path))
+    reader.load()
+    first = reader.index.partitions["local:a"].metadata[0]
+
+    _add(writer, "local:a", vectors[6:10], start=4)
+    asyncio.run(writer.remove_document("local:b"))
+    asyncio.run(reader.refresh())
+    assert reader.index.partition_names() == {"local:a"}
+    partition = reader.index.partitions["local:a"]
+    # Grown in place: the old rows' metadata was kept, not re-read
+    assert partition.metadata[0] is first and len(partition) == 8
+    assert reader.index.search(vectors[9], 1)[0][1]["chunk_index"] == 7
+
+    # Deleted and uploaded again by another worker: reloaded whole
+    asyncio.run(writer.remove_document("local:a"))
+    _add(writer, "local:a", vectors[10:])
+    asyncio.run(reader.refresh())
+    assert [meta["text"] for meta in reader.index.metadata] == ["chunk 0", "chunk 1"]
+
+
+def test_refresh_skips_partitions_deleted_during_the_scan(tmp_path, monkeypatch):
+    store = LocalStore(str(tmp_path))
+    store.load()
+    _add(store, "local:a", np.ones((2, 4), dtype=np.float32))
+    entries = list(os.scandir(store._partitions_dir()))
+    shutil.rmtree(store._path("local:a"))
+
+    monkeypatch.setattr(os, "scandir", lambda path: iter(entries))
+    asyncio.run(store.refresh())
+    assert len(store.index) == 0 and not os.path.exists(store._path("local:a"))
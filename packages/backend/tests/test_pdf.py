@@ -0,0 +1,25 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from backend.services import pdf
+
+
+def test_concurrent_callers_share_one_pool(monkeypatch):
+    created = []
+
+    class SlowPool:
+        def __init__(self, **kwargs):
+            # Widen the window between the None check and the assignment
+            time.sleep(0.02)
+            created.append(self)
+
+        def shutdown(self, **kwargs):
+            pass
+
+    monkeypatch.setattr(pdf, "ProcessPoolExecutor", SlowPool)
+    monkeypatch.setattr(pdf, "_pool", None)
+    with ThreadPoolExecutor(8) as threads:
+        pools = list(threads.map(lambda _: pdf._get_pool(2), range(8)))
+    assert len(created) == 1 and all(pool is created[0] for pool in pools)
+    pdf.shutdown_pool()
+    assert pdf._pool is None
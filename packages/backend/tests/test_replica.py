@@ -0,0 +1,68 @@
+import asyncio
+import threading
+
+import numpy as np
+
+from backend.data import replica as replica_module
+from backend.data.index import normalize
+from backend.data.replica import ChunkReplica
+
+
+def _d1_rows(documents=60, per_document=50, dim=32, seed=0):
+    rng = np.random.default_rng(seed)
+    vectors = rng.normal(size=(documents * per_document, dim)).astype(np.float32)
+    metadata = [
+        {"rowid": i + 1, "document_id": f"doc{i // per_document}", "chunk_index": i % per_document, "text": f"chunk {i}"}
+        for i in range(documents * per_document)
+    ]
+    return vectors, metadata
+
+
+def test_searches_on_a_worker_thread_while_the_replica_syncs(monkeypatch):
+    vectors, metadata = _d1_rows()
+
+    async def chunk_vectors_since(watermark, limit):
+        rows = [i for i, meta in enumerate(metadata) if meta["rowid"] > watermark][:limit]
+        # Yield to the loop between pages, as the D1 round trip would
+        await asyncio.sleep(0)
+        if not rows:
+            return np.empty((0, 0), dtype=np.float32), [], None
+        return vectors[rows], [dict(metadata[i]) for i in rows], metadata[rows[-1]]["rowid"]
+
+    monkeypatch.setattr(replica_module, "get_chunk_vectors_since", chunk_vectors_since)
+    replica = ChunkReplica(page_size=25)
+    query = normalize(vectors[0])
+    scope = ["doc0", "doc7", "moved"]
+    stop = threading.Event()
+    errors = []
+
+    def search():
+        try:
+            while not stop.is_set():
+                for score, meta, vector in replica.index.search(query, 5, partitions=scope, with_vectors=True):
+                    assert meta["document_id"] in scope
+                    # The row scored is the row whose metadata came back
+                    assert np.isclose(score, float(vector @ query), atol=1e-5)
+                    assert np.allclose(vector, normalize(vectors[meta["rowid"] - 1]), atol=1e-5)
+                replica.index.search(query, 5)
+                len(replica.index)
+        except Exception as e:
+            errors.append(e)
+
+    async def churn():
+        await replica.sync()
+        for n in range(0, 60, 3):
+            replica.invalidate_chunks(f"doc{n}", 25)
+            replica.rename_document(f"doc{n + 1}", "moved" if n == 6 else f"renamed{n}")
+            replica.invalidate_document(f"doc{n + 2}")
+            await asyncio.sleep(0)
+
+    thread = threading.Thread(target=search)
+    thread.start()
+    try:
+        asyncio.run(churn())
+    finally:
+        stop.set()
+        thread.join()
+    assert not errors
+    assert len(replica.index) == 20 * 25 + 20 * 50
@@ -0,0 +1,26 @@
+import pytest
+
+from backend.services.search import looks_like_identifier
+
+
+@pytest.mark.parametrize("query", [
+    "AB-125",
+    "error 0x80070005",
+    "ERR_CONN_RESET",
+    "part X1Y2 torque",
+    "serial 8675309",
+])
+def test_identifier_queries_take_the_lexical_path(query):
+    assert looks_like_identifier(query)
+
+
+@pytest.mark.parametrize("query", [
+    "chapter 3 summary",
+    "2023 revenue",
+    "3rd quarter",
+    "well-known issues",
+    "what does the warranty cover for water damage",
+    "AB-125 torque spec for the rear axle",
+])
+def test_natural_language_queries_use_hybrid_search(query):
+    assert not looks_like_identifier(query)
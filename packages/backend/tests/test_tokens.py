@@ -0,0 +1,30 @@
+import sys
+
+from backend.utils import tokens
+
+
+class FakeEncoding:
+    def encode(self, text, disallowed_special=()):
+        return text.split()
+
+    def decode(self, words):
+        return " ".join(words)
+
+
+def test_counts_fall_back_to_the_estimate_until_loaded(monkeypatch):
+    text = "one two three four five six"
+    assert tokens.count_tokens(text, "unloaded-model") == len(text) // tokens.CHARS_PER_TOKEN + 1
+
+    monkeypatch.setitem(tokens._encodings, "fake-model", FakeEncoding())
+    assert tokens.count_tokens(text, "fake-model") == 6
+    # A cut prefix drops its last, possibly partial, word
+    assert tokens.truncate_tokens(text, 4, "fake-model") == "one two three"
+    assert tokens.truncate_tokens(text, 10, "fake-model") == text
+
+
+def test_load_records_a_missing_tokenizer_once(monkeypatch):
+    monkeypatch.setattr(tokens, "_encodings", {})
+    monkeypatch.setitem(sys.modules, "tiktoken", None)
+    tokens.load("some-model", "some-model")
+    assert tokens._encodings == {"some-model": None}
+    assert tokens.count_tokens("abcdef", "some-model") == 3
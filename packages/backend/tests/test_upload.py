@@ -0,0 +1,89 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from backend.benchmarks.synthetic import write_pdf
+
+
+def _upload(client, path, filename):
+    with open(path, "rb") as f:
+        return client.post("/api/v1/upload", files={"file": (filename, f, "application/pdf")})
+
+
+def test_same_filename_different_content_gets_separate_documents(client, tmp_path):
+    write_pdf(str(tmp_path / "a.pdf"), 2, seed=1)
+    write_pdf(str(tmp_path / "b.pdf"), 2, seed=2)
+    first = _upload(client, tmp_path / "a.pdf", "report.pdf").json()
+    second = _upload(client, tmp_path / "b.pdf", "report.pdf").json()
+    assert first["document_id"] != second["document_id"]
+    assert not second["deduplicated"]
+
+
+def test_concurrent_uploads_of_the_same_pdf_ingest_once(client, tmp_path):
+    write_pdf(str(tmp_path / "c.pdf"), 3, seed=3)
+    with ThreadPoolExecutor(4) as pool:
+        responses = list(pool.map(lambda i: _upload(client, tmp_path / "c.pdf", f"copy{i}.pdf").json(), range(4)))
+
+    assert len({r["document_id"] for r in responses}) == 1
+    assert sum(not r["deduplicated"] for r in responses) == 1
+    from backend.data.local_store import local_store
+    partition = local_store.index.partitions[responses[0]["document_id"]]
+    assert len(partition) == next(r["chunks_processed"] for r in responses if not r["deduplicated"])
+
+
+def test_pdf_without_text_is_a_client_error(client, tmp_path):
+    write_pdf(str(tmp_path / "empty.pdf"), 1, lines_per_page=0)
+    assert _upload(client, tmp_path / "empty.pdf", "empty.pdf").status_code == 400
+
+
+def test_cloud_upload_job_status_survives_the_job(client, tmp_path):
+    write_pdf(str(tmp_path / "cloud.pdf"), 2, seed=4)
+    with open(tmp_path / "cloud.pdf", "rb") as f:
+        accepted = client.post("/api/v1/upload/cloud", files={"file": ("cloud.pdf", f, "application/pdf")}).json()
+
+    job = _wait_for_job(client, accepted["job_id"])
+    assert job["stage"] == "completed" and job["chunks_stored"] > 0
+    from backend.services.jobs import job_queue
+    assert accepted["job_id"] not in job_queue.jobs
+
+
+def _wait_for_job(client, job_id):
+    for _ in range(200):
+        job = client.get(f"/api/v1/jobs/{job_id}").json()
+        if job["stage"] in ("completed", "failed"):
+            return job
+        time.sleep(0.05)
+    raise AssertionError("job did not finish")
+
+
+def test_delete_local_document(client, tmp_path):
+    write_pdf(str(tmp_path / "d.pdf"), 2, seed=5)
+    document_id = _upload(client, tmp_path / "d.pdf", "d.pdf").json()["document_id"]
+
+    assert client.delete(f"/api/v1/documents/{document_id}").json()["status"] == "deleted"
+    from backend.data.local_store import local_store
+    assert document_id not in local_store.index.partition_names()
+    assert not os.listdir("data/uploads")
+    assert client.delete(f"/api/v1/documents/{document_id}").status_code == 404
+    # The same bytes can be uploaded again and are ingested afresh
+    assert not _upload(client, tmp_path / "d.pdf", "d.pdf").json()["deduplicated"]
+
+
+def test_delete_cloud_document_keeps_the_pdf_while_a_duplicate_uses_it(client, tmp_path):
+    from backend.services import r2
+
+    write_pdf(str(tmp_path / "e.pdf"), 2, seed=6)
+    with open(tmp_path / "e.pdf", "rb") as f:
+        original = client.post("/api/v1/upload/cloud", files={"file": ("e.pdf", f, "application/pdf")}).json()
+    _wait_for_job(client, original["job_id"])
+    with open(tmp_path / "e.pdf", "rb") as f:
+        duplicate = client.post("/api/v1/upload/cloud?user_id=u2", files={"file": ("e.pdf", f, "application/pdf")}).json()
+    assert duplicate["deduplicated"]
+    objects = r2._client.objects
+    assert len(objects) == 1
+
+    assert client.delete(f"/api/v1/documents/{original['id']}").status_code == 200
+    assert len(objects) == 1
+    assert client.delete(f"/api/v1/documents/{duplicate['id']}").status_code == 200
+    assert objects == {}
+    assert client.delete(f"/api/v1/documents/{duplicate['id']}").status_code == 404
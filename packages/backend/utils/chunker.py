@@ -1,4 +1,14 @@
-from typing import List
+import re
+from bisect import bisect_right
+from typing import Iterable, Iterator, List
+from backend.config import CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS
+from backend.utils.tokens import CHARS_PER_TOKEN
+
+# Paragraph breaks and sentence ends, found in one scan of each window
+_BOUNDARY = re.compile(r'(\n[^\S\n]*\n)|([.!?]["\')\]]*(?=\s))')
+_SENTENCE_GAP = re.compile(r'[.!?]["\')\]]*\s+')
+_WORD_GAP = re.compile(r'\s+')
+_NON_SPACE = re.compile(r'\S')
 
 def chunk_text(text: str, chunk_size: int = 1000, overlap: int = 200) -> List[str]:
 
@@ -36,3 +46,112 @@ def chunk_text(text: str, chunk_size: int = 1000, overlap: int = 200) -> List[st
       break
              
   return chunks
+
+
+def _find_end(text: str, start: int, limit: int, min_end: int) -> int:
+  """
+  Pick where a chunk starting at `start` should end, at most `limit`.
+  Prefers the last paragraph break, then the last sentence end, then the
+  last space after `min_end`; cuts at `limit` only when there is none.
+  """
+  paragraph = sentence = None
+  for match in _BOUNDARY.finditer(text, min_end, limit):
+    if match.group(1):
+      paragraph = match.start()
+    else:
+      sentence = match.end()
+  if paragraph is not None:
+    return paragraph
+  if sentence is not None:
+    return sentence
+  space = max(text.rfind(" ", min_end, limit), text.rfind("\n", min_end, limit))
+  return space if space > start else limit
+
+
+def _find_next_start(text: str, start: int, end: int, overlap: int) -> int:
+  """
+  Start of the chunk after [start, end): the first sentence (else word)
+  that begins inside the last `overlap` characters, so the chunks share
+  whole sentences instead of half words.
+  """
+  if overlap > 0:
+    target = max(end - overlap, start + 1)
+    match = _SENTENCE_GAP.search(text, target, end) or _WORD_GAP.search(text, target, end)
+    if match and match.end() < end:
+      return match.end()
+  return end
+
+
+def iter_page_chunks(
+  pages: Iterable[str],
+  max_tokens: int = CHUNK_MAX_TOKENS,
+  overlap_tokens: int = CHUNK_OVERLAP_TOKENS
+) -> Iterator[dict]:
+
+  """
+  Splits a stream of pages into chunks of at most max_tokens (estimated),
+  ending on paragraph or sentence boundaries where possible.
+
+  Works in a single pass over the text: each page is appended to a small
+  buffer once, chunk boundaries are found by scanning forward, and each
+  chunk's text is one slice of the buffer.
+
+  Args:
+    pages: Iterable of page texts, in order.
+    max_tokens: Token budget per chunk.
+    overlap_tokens: Roughly how much text neighbouring chunks share.
+
+  Returns:
+    An iterator of dicts with the chunk text, the 1-based pages it spans
+    (page_start, page_end) and its [char_start, char_end) offsets in the
+    document text ("\\n".join(pages)).
+  """
+
+  # Budgets become character windows at the shared upper-bound estimate,
+  # so chunks stay within max_tokens without running a tokenizer
+  max_chars = max(1, max_tokens * CHARS_PER_TOKEN)
+  overlap = min(overlap_tokens * CHARS_PER_TOKEN, max_chars // 4)
+  page_starts = []
+  buffer = ""
+  base = 0
+  pos = 0
+
+  def cut(final: bool) -> Iterator[dict]:
+    nonlocal pos
+    while True:
+      match = _NON_SPACE.search(buffer, pos)
+      if match is None:
+        pos = len(buffer)
+        return
+      pos = match.start()
+      last = pos + max_chars >= len(buffer)
+      # Only cut once the whole window is buffered
+      if last and not final:
+        return
+      end = len(buffer) if last else _find_end(buffer, pos, pos + max_chars, pos + max_chars // 2)
+      while buffer[end - 1].isspace():
+        end -= 1
+      yield {
+        "text": buffer[pos:end],
+        "page_start": bisect_right(page_starts, base + pos),
+        "page_end": bisect_right(page_starts, base + end - 1),
+        "char_start": base + pos,
+        "char_end": base + end
+      }
+      if last:
+        pos = len(buffer)
+        return
+      pos = _find_next_start(buffer, pos, end, overlap)
+
+  for page in pages:
+    if page_starts:
+      buffer += "\n"
+    page_starts.append(base + len(buffer))
+    buffer += page
+    yield from cut(final=False)
+    # Drop consumed text once per page rather than once per chunk
+    buffer = buffer[pos:]
+    base += pos
+    pos = 0
+
+  yield from cut(final=True)
@@ -0,0 +1,114 @@
+"""
+Compact text encoding for embeddings stored in D1.
+
+Vectors are stored as "<format>:<base64 little-endian bytes>", e.g.
+"f32:AAB...". The prefix versions the layout so readers can tell the
+formats apart. Legacy rows hold a JSON array and are still readable.
+Backends with a BLOB type (local SQLite) store the same prefix followed
+by the raw bytes instead of base64.
+"""
+import base64
+import logging
+from collections import Counter
+from typing import Optional
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+FORMAT_FLOAT32 = "f32"
+FORMAT_FLOAT16 = "f16"
+
+_DTYPES = {
+    FORMAT_FLOAT32: np.dtype("<f4"),
+    FORMAT_FLOAT16: np.dtype("<f2"),
+}
+
+
+def encode_embedding(vector, fmt: str = FORMAT_FLOAT32) -> str:
+    """
+    Encode a vector as a prefixed base64 string.
+
+    Args:
+        vector: List or array of floats
+        fmt: FORMAT_FLOAT32 or FORMAT_FLOAT16
+
+    Returns:
+        Encoded string for the embedding column
+    """
+    if fmt not in _DTYPES:
+        raise ValueError(f"Unknown embedding format: {fmt}")
+    raw = np.asarray(vector, dtype=_DTYPES[fmt]).tobytes()
+    return f"{fmt}:{base64.b64encode(raw).decode('ascii')}"
+
+
+def encode_embedding_blob(vector, fmt: str = FORMAT_FLOAT32) -> bytes:
+    """
+    Encode a vector as the format prefix followed by its raw bytes.
+
+    Args:
+        vector: List or array of floats
+        fmt: FORMAT_FLOAT32 or FORMAT_FLOAT16
+
+    Returns:
+        Bytes for a BLOB embedding column
+    """
+    if fmt not in _DTYPES:
+        raise ValueError(f"Unknown embedding format: {fmt}")
+    return fmt.encode("ascii") + b":" + np.asarray(vector, dtype=_DTYPES[fmt]).tobytes()
+
+
+def embedding_format(value) -> str:
+    """Return the format prefix of a stored value, or 'json' for legacy rows."""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        prefix, sep, _ = bytes(value[:8]).partition(b":")
+        prefix = prefix.decode("ascii", "replace")
+        if sep and prefix in _DTYPES:
+            return prefix
+        raise ValueError("Unknown binary embedding format")
+    prefix, sep, _ = value.partition(":")
+    if sep and prefix in _DTYPES:
+        return prefix
+    return "json"
+
+
+def decode_embedding(value) -> np.ndarray:
+    """
+    Decode a stored embedding (text or BLOB) into a float32 array.
+    Binary formats are decoded straight from the base64 or raw bytes.
+    """
+    fmt = embedding_format(value)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return np.frombuffer(value, dtype=_DTYPES[fmt], offset=len(fmt) + 1).astype(np.float32)
+    if fmt == "json":
+        # Legacy JSON array; parse the numbers without building a Python list
+        return np.fromstring(value.strip()[1:-1], dtype=np.float32, sep=",")
+    raw = base64.b64decode(value[len(fmt) + 1:])
+    return np.frombuffer(raw, dtype=_DTYPES[fmt]).astype(np.float32)
+
+
+def decode_embeddings(values: list, dim: Optional[int] = None) -> tuple:
+    """
+    Decode many stored embeddings into one (n, dim) float32 matrix.
+
+    Rows of another dimension (e.g. stored before EMBEDDING_DIMENSIONS
+    changed) are skipped with a warning instead of failing the batch.
+
+    Args:
+        values: Stored embeddings
+        dim: Expected dimension; defaults to the most common one in values
+
+    Returns:
+        (matrix, kept): the decoded rows and their positions in values
+    """
+    vectors = [decode_embedding(value) for value in values]
+    if not vectors:
+        return np.empty((0, dim or 0), dtype=np.float32), []
+    if dim is None:
+        dim = Counter(v.shape[0] for v in vectors).most_common(1)[0][0]
+    kept = [i for i, v in enumerate(vectors) if v.shape[0] == dim]
+    if len(kept) < len(vectors):
+        logger.warning("Skipped %d of %d embeddings that are not %d-dim", len(vectors) - len(kept), len(vectors), dim)
+    matrix = np.empty((len(kept), dim), dtype=np.float32)
+    for row, i in enumerate(kept):
+        matrix[row] = vectors[i]
+    return matrix, kept
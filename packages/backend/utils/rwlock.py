@@ -0,0 +1,79 @@
+"""
+Readers-writer lock for the in-memory indexes.
+
+Searches run on worker threads (see services/search.py) while the event
+loop appends, removes and renames chunks. Any number of searches may
+hold the read side at once; a writer waits for them to finish and
+blocks new ones while it waits, so a steady stream of searches cannot
+starve it.
+
+Both sides are re-entrant for the thread holding them, and the writer may
+also take the read side, so an index method that calls another locked
+method does not deadlock. Upgrading a read hold to a write is not
+supported.
+"""
+import threading
+from contextlib import contextmanager
+
+
+class RWLock:
+    """Writer-preferring readers-writer lock built on a Condition."""
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = None
+        self._writer_depth = 0
+        self._waiting_writers = 0
+        self._local = threading.local()
+
+    def _read_depth(self) -> int:
+        return getattr(self._local, "depth", 0)
+
+    @contextmanager
+    def read(self):
+        me = threading.get_ident()
+        depth = self._read_depth()
+        if self._writer == me or depth:
+            # Nested inside this thread's own hold: nothing to wait for
+            self._local.depth = depth + 1
+            try:
+                yield
+            finally:
+                self._local.depth = depth
+            return
+        with self._cond:
+            while self._writer is not None or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+        self._local.depth = 1
+        try:
+            yield
+        finally:
+            self._local.depth = 0
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        me = threading.get_ident()
+        with self._cond:
+            if self._writer != me:
+                self._waiting_writers += 1
+                try:
+                    while self._writer is not None or self._readers:
+                        self._cond.wait()
+                finally:
+                    self._waiting_writers -= 1
+                self._writer = me
+            self._writer_depth += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer_depth -= 1
+                if not self._writer_depth:
+                    self._writer = None
+                    self._cond.notify_all()
@@ -0,0 +1,304 @@
+"""
+Metrics and trace spans.
+
+Counters and histograms live in one process-wide registry, rendered in
+the Prometheus text format by the /metrics route. Timed stages can also
+emit a trace span: a DEBUG record on the "backend.trace" logger carrying
+the request's trace id, the stage name, its duration and attributes.
+Spans cost nothing unless a handler is attached (see configure_logging).
+"""
+import bisect
+import contextvars
+import json
+import logging
+import math
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Iterable, Iterator, Optional
+
+# Seconds; wide enough for a cache hit and for a slow PDF
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048)
+
+# Set per HTTP request by TelemetryMiddleware and per job by the job queue;
+# asyncio tasks inherit it
+trace_id = contextvars.ContextVar("trace_id", default=None)
+trace_logger = logging.getLogger("backend.trace")
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    """Monotonic count per label set."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(labels.get(name, "") for name in self.labels), 0)
+
+    def render(self) -> list:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram:
+    """Bucketed distribution (cumulative on render) per label set."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (+Inf last), sum, count]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        slot = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][slot] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, span: Optional[str] = None, **labels):
+        """
+        Observe the duration of the block. With `span`, also emit a trace
+        span of that name; the yielded dict becomes its attributes.
+        """
+        attributes = {}
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            yield attributes
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            duration = time.perf_counter() - started
+            self.observe(duration, **labels)
+            if span:
+                emit_span(span, duration, status=status, **labels, **attributes)
+
+    def count(self, **labels) -> int:
+        entry = self._values.get(tuple(labels.get(name, "") for name in self.labels))
+        return entry[2] if entry else 0
+
+    def render(self) -> list:
+        with self._lock:
+            items = sorted((key, (list(entry[0]), entry[1], entry[2])) for key, entry in self._values.items())
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+
+class Gauge:
+    """Value read from a callback at render time, e.g. a cache size."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, read: Callable[[], float]):
+        self.name = name
+        self.help = help
+        self.read = read
+
+    def render(self) -> list:
+        try:
+            value = self.read()
+        except Exception:
+            return []
+        return [] if value is None else [f"{self.name} {_format_value(value)}"]
+
+
+class Registry:
+    """
+    Named metrics of the process. Asking for an existing name returns
+    the metric already registered under it.
+    """
+
+    def __init__(self, prefix: str = "pdfhelper_"):
+        self.prefix = prefix
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, name: str, factory):
+        name = self.prefix + name
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = factory(name)
+            return metric
+
+    def counter(self, name: str, help: str, labels: tuple = ()) -> Counter:
+        return self._get(name, lambda full: Counter(full, help, labels))
+
+    def histogram(self, name: str, help: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self._get(name, lambda full: Histogram(full, help, labels, buckets))
+
+    def gauge(self, name: str, help: str, read: Callable[[], float]) -> Gauge:
+        return self._get(name, lambda full: Gauge(full, help, read))
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def emit_span(name: str, duration: float, **attributes):
+    """Log a finished span of the current trace, if anyone is listening."""
+    if trace_logger.isEnabledFor(logging.DEBUG):
+        trace_logger.debug(name, extra={"span": {
+            "trace_id": trace_id.get(),
+            "name": name,
+            "duration_ms": round(duration * 1000, 3),
+            **attributes
+        }})
+
+
+class TimedIterator:
+    """
+    Wraps an iterator and sums the time spent producing its items, so a
+    stage of a generator pipeline can be timed apart from its consumer.
+    """
+
+    def __init__(self, iterable: Iterable):
+        self._iterator = iter(iterable)
+        self.seconds = 0.0
+        self.items = 0
+
+    def __iter__(self) -> Iterator:
+        return self
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            item = next(self._iterator)
+        finally:
+            self.seconds += time.perf_counter() - started
+        self.items += 1
+        return item
+
+
+HTTP_SECONDS = registry.histogram("http_request_seconds", "HTTP request duration, body included", ("method", "route", "status"))
+
+
+class TelemetryMiddleware:
+    """
+    ASGI middleware that gives each HTTP request a trace id (returned in
+    the X-Trace-Id header) and times it by route template, so streamed
+    responses are timed to their last byte.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_trace_id = new_trace_id()
+        token = trace_id.set(request_trace_id)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_trace(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-trace-id", request_trace_id.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_trace)
+        finally:
+            duration = time.perf_counter() - started
+            # The router stores the matched route in the scope; templates keep label counts bounded
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_SECONDS.observe(duration, method=scope["method"], route=route, status=str(status))
+            emit_span("http.request", duration, method=scope["method"], route=route, status=status)
+            trace_id.reset(token)
+
+
+class SpanFormatter(logging.Formatter):
+    """One JSON object per span record."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        span = getattr(record, "span", None) or {"name": record.getMessage()}
+        return json.dumps({"ts": round(record.created, 6), **span}, default=str)
+
+
+def configure_logging(level: str = "INFO", trace_enabled: bool = False, trace_path: str = ""):
+    """
+    Leveled logging for the app, plus the trace span handler: spans go as
+    JSON lines to trace_path, or to stderr if it is empty. Called once on
+    startup.
+    """
+    logging.basicConfig(level=level.upper(), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    # Spans never reach the app log, only their own handler
+    trace_logger.propagate = False
+    for handler in list(trace_logger.handlers):
+        trace_logger.removeHandler(handler)
+    if trace_enabled:
+        handler = logging.FileHandler(trace_path) if trace_path else logging.StreamHandler()
+        handler.setFormatter(SpanFormatter())
+        trace_logger.addHandler(handler)
+        trace_logger.setLevel(logging.DEBUG)
+    else:
+        trace_logger.setLevel(logging.WARNING)
@@ -0,0 +1,68 @@
+"""
+Token counting shared by the chunker, embedding batches and chat context.
+
+Tokenizers come from tiktoken, whose first use of an encoding may
+download its BPE file, so load() runs once at startup off the event
+loop (see main.py) and counting never loads anything itself. Until a
+model's tokenizer is loaded, or when tiktoken or its files are
+unavailable, counts fall back to one estimate of CHARS_PER_TOKEN.
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Characters per token assumed without a tokenizer. English text averages
+# nearer 4; 3 overestimates, so limits checked against it still hold
+CHARS_PER_TOKEN = 3
+
+# Encoding per model name; None when it could not be loaded
+_encodings = {}
+
+
+def load(*models: str) -> None:
+    """
+    Load the tokenizer for each model, downloading its encoding if needed.
+    Blocking: call it from a thread in async code.
+    """
+    for model in models:
+        if model in _encodings:
+            continue
+        encoding = None
+        try:
+            import tiktoken
+            try:
+                encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                encoding = tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            logger.warning("No tokenizer for %s, estimating tokens: %s", model, e)
+        _encodings[model] = encoding
+
+
+def estimate_tokens(text: str) -> int:
+    """Upper-bound token count of text without a tokenizer."""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def count_tokens(text: str, model: str) -> int:
+    """Tokens of text for model, estimated if its tokenizer is not loaded."""
+    encoding = _encodings.get(model)
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text: str, max_tokens: int, model: str) -> str:
+    """The longest prefix of text within max_tokens, cut after a whole word when possible."""
+    encoding = _encodings.get(model)
+    if encoding is None:
+        cut = text[:max(0, (max_tokens - 1) * CHARS_PER_TOKEN)]
+    else:
+        tokens = encoding.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        cut = encoding.decode(tokens[:max_tokens])
+    if len(cut) >= len(text):
+        return text
+    space = cut.rfind(" ")
+    return cut[:space] if space > len(cut) // 2 else cut